@@ -0,0 +1,25 @@
+// clientside callbacks of the dashboard; these run in the browser, so that they do not reach the server
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // draw the counts of the selected variable as a pie or bar chart
+        render_counts: function (countData, tab, colourScheme) {
+            if (!countData || (tab !== 'tab-pie' && tab !== 'tab-bar')) {
+                return [{data: [], layout: {}}, {display: 'none'}];
+            }
+
+            var trace;
+            var layout = {colorway: colourScheme, margin: {t: 60}};
+            if (tab === 'tab-pie') {
+                trace = {type: 'pie', labels: countData.Categories, values: countData.Values};
+                layout.piecolorway = colourScheme;
+            } else {
+                trace = {type: 'bar', x: countData.Categories, y: countData.Values,
+                         marker: {color: colourScheme[0]}};
+                layout.xaxis = {title: {text: 'Categories'}, type: 'category'};
+                layout.yaxis = {title: {text: 'Values'}};
+            }
+
+            return [{data: [trace], layout: layout}, {display: 'block'}];
+        }
+    }
+});
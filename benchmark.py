@@ -0,0 +1,174 @@
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from dash import html
+
+# private module
+import dash_v6
+import fake_vantage6
+
+
+def get_callback(dashboard, output_id):
+    """
+    Retrieve the function of a Dash callback, so that it can be called without a browser
+
+    :param Dashboard dashboard: the dashboard that the callback is registered on
+    :param str output_id: id of the (first) component that the callback outputs to
+    :return callable: the undecorated callback
+    """
+    for callback_id, callback in dashboard.App.callback_map.items():
+        if callback_id.lstrip('.').startswith(f'{output_id}.'):
+            return callback['callback'].__wrapped__
+
+    raise KeyError(f'No callback outputs to {output_id}')
+
+
+def render_until_complete(render, arguments, poll_interval, timeout):
+    """
+    Call a rendering callback as the job poll of the dashboard would, until it renders a graph or pushes the data
+    that the browser draws the graph from
+
+    :param callable render: callback that returns the content first and whether the job poll should be disabled last
+    :param callable arguments: function of the number of intervals that returns the arguments of the callback
+    :param float poll_interval: number of seconds between calls, i.e. the interval of the job poll
+    :param float timeout: maximum number of seconds to wait for the graph
+    :return float: number of seconds until the graph was rendered
+    """
+    start = time.perf_counter()
+    n_intervals = None
+
+    while True:
+        outputs = render(*arguments(n_intervals))
+        content, poll_disabled = outputs[0], outputs[-1]
+
+        if poll_disabled:
+            # the status of a failed query is rendered as a message instead of a graph or data
+            if content is None or isinstance(content, html.Div):
+                raise RuntimeError(f'Query failed whilst benchmarking: {outputs}')
+            return time.perf_counter() - start
+
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError('Query did not complete whilst benchmarking')
+
+        time.sleep(poll_interval)
+        n_intervals = (n_intervals or 0) + 1
+
+
+def summarise(name, latencies):
+    """
+    Summarise the latencies of a scenario
+
+    :param str name: name of the scenario
+    :param list latencies: latencies in seconds
+    :return dict: the number of samples and the p50 and p95 latency in milliseconds
+    """
+    return {'scenario': name,
+            'samples': len(latencies),
+            'p50': float(np.percentile(latencies, 50)) * 1000,
+            'p95': float(np.percentile(latencies, 95)) * 1000}
+
+
+def run_benchmark(iterations=None, server=None, poll_interval=None, organisations=None, timeout=None):
+    """
+    Drive the callbacks of a dashboard that runs against a fake Vantage6 server, and measure how long it takes
+    until counts and heatmaps are rendered when their results are not yet cached, and when they are.
+    Every uncached iteration queries a variable or ROI that has not been queried before.
+
+    :param int iterations: number of queries per scenario
+    :param FakeVantage6Server server: the server to run against, defaults to a server with default settings
+    :param float poll_interval: number of seconds between calls of the job poll, defaults to that of the dashboard
+    :param list organisations: names of the organisations to select, defaults to all organisations
+    :param float timeout: maximum number of seconds to wait for a single query
+    :return list: summary per scenario, see summarise
+    """
+    if isinstance(iterations, int) is False:
+        iterations = 20
+
+    if server is None:
+        server = fake_vantage6.FakeVantage6Server()
+
+    if organisations is None:
+        organisations = list(server.Organisations.values())
+
+    if isinstance(timeout, (int, float)) is False:
+        timeout = 60
+
+    with tempfile.TemporaryDirectory() as directory:
+        # without status events the dashboard polls the status of tasks, as it does without socket.io
+        event_source_factory = server.event_source if server.EmitEvents else None
+        dashboard = dash_v6.Dashboard(server.client, os.path.join(directory, 'benchmark_cache.sqlite'),
+                                      event_source_factory)
+
+        if isinstance(poll_interval, (int, float)) is False:
+            poll_interval = dashboard.JobPollingInterval / 1000
+
+        authenticate = get_callback(dashboard, 'authentication-status')
+        select_organisations = get_callback(dashboard, 'organisation-ids')
+        render_content = get_callback(dashboard, 'count-data')
+        render_heatmap = get_callback(dashboard, 'heatmap-content')
+
+        session_id = authenticate(1, 'benchmark', 'benchmark', None)[4]
+        organisation_ids = select_organisations(True, organisations, session_id)
+
+        # let the warm-up of the cache finish, so that it does not compete with the measured queries
+        while dashboard.Jobs:
+            time.sleep(0.01)
+
+        # variables that have not been queried before, registered after the warm-up so that they are not prefetched
+        variables = [f'benchmark:P{iteration}' for iteration in range(iterations)]
+        for variable in variables:
+            dashboard.filter_dict[variable] = [f'C{category}' for category in range(server.CountCategories)]
+
+        rois = [f'BENCHMARK-{iteration}' for iteration in range(iterations)]
+
+        def count_arguments(variable):
+            return lambda n_intervals: (organisation_ids, variable, n_intervals, session_id)
+
+        def heatmap_arguments(roi):
+            return lambda n_intervals: (organisation_ids, roi, n_intervals, session_id)
+
+        latencies = {}
+        for scenario in ['uncached', 'cached']:
+            latencies[f'counts ({scenario})'] = [
+                render_until_complete(render_content, count_arguments(variable), poll_interval, timeout)
+                for variable in variables]
+            latencies[f'heatmap ({scenario})'] = [
+                render_until_complete(render_heatmap, heatmap_arguments(roi), poll_interval, timeout)
+                for roi in rois]
+
+        dashboard.ResultCache.close()
+
+    return [summarise(name, scenario_latencies) for name, scenario_latencies in latencies.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the latency of the dashboard against a fake Vantage6 '
+                                                 'server, so that performance changes can be compared')
+    parser.add_argument('--iterations', type=int, default=20, help='number of queries per scenario')
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds that a task takes on the server')
+    parser.add_argument('--request-latency', type=float, default=0.0, help='seconds per request to the server')
+    parser.add_argument('--count-categories', type=int, default=4, help='categories per counted variable')
+    parser.add_argument('--heatmap-rows', type=int, default=100, help='rows per organisation of the heatmaps')
+    parser.add_argument('--poll-interval', type=float, default=None,
+                        help='seconds between calls of the job poll, defaults to that of the dashboard')
+    parser.add_argument('--no-events', action='store_true',
+                        help='do not emit task status events, so that the completion of tasks is only polled')
+    arguments = parser.parse_args()
+
+    server = fake_vantage6.FakeVantage6Server(arguments.latency, arguments.request_latency,
+                                              arguments.count_categories, arguments.heatmap_rows,
+                                              emit_events=arguments.no_events is False)
+    summaries = run_benchmark(arguments.iterations, server, arguments.poll_interval)
+
+    print(f'{"scenario":<20}{"samples":>10}{"p50 (ms)":>12}{"p95 (ms)":>12}')
+    for summary in summaries:
+        print(f'{summary["scenario"]:<20}{summary["samples"]:>10}{summary["p50"]:>12.1f}{summary["p95"]:>12.1f}')
+    print(f'requests to the server: {dict(server.Requests)}')
+
+
+if __name__ == '__main__':
+    main()
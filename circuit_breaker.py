@@ -0,0 +1,120 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=None, reset_timeout=None, probe_timeout=None):
+        """
+        Thread-safe circuit breaker per organisation. Once failure_threshold consecutive queries of an organisation
+        have failed, e.g. by exceeding their deadline, the breaker of the organisation opens and it is not queried
+        for reset_timeout seconds, so that a node that does not respond does not hold up the queries of all users.
+        Thereafter the breaker is half-open: a single query is let through as a probe, see allow, whilst the breaker
+        remains open for all other queries. A success of the probe closes the breaker, whereas a failure opens it
+        for another reset_timeout seconds.
+
+        :param int failure_threshold: number of consecutive failures that open the breaker
+        :param float reset_timeout: number of seconds that the breaker remains open
+        :param float probe_timeout: number of seconds after which a probe that neither succeeded nor failed, e.g. as
+        it was cancelled, is given up, so that another probe can be let through; defaults to the reset timeout
+        """
+        if isinstance(failure_threshold, int) is False:
+            failure_threshold = 3
+
+        if isinstance(reset_timeout, (int, float)) is False:
+            reset_timeout = 10 * 60
+
+        if isinstance(probe_timeout, (int, float)) is False:
+            probe_timeout = reset_timeout
+
+        self.FailureThreshold = failure_threshold
+        self.ResetTimeout = reset_timeout
+        self.ProbeTimeout = probe_timeout
+
+        self._Failures = {}
+        self._OpenedAt = {}
+        self._ProbingSince = {}
+        self._Lock = threading.Lock()
+
+    def is_open(self, organisation_id):
+        """
+        Check whether an organisation should not be queried; a half-open breaker is open whilst its probe is running
+
+        :param int organisation_id: id of the organisation
+        :return bool: True if the breaker of the organisation is open
+        """
+        with self._Lock:
+            return self._is_open(organisation_id, time.time())
+
+    def allow(self, organisation_ids):
+        """
+        Claim the permission to query organisations together; the breakers of organisations that are half-open let
+        this query through as their probe, after which they remain open until the probe succeeded or failed
+
+        :param list organisation_ids: ids of the organisations that are queried together
+        :return bool: True if the organisations may be queried, False if any of their breakers is open, in which
+        case no probe is claimed
+        """
+        now = time.time()
+
+        with self._Lock:
+            if any(self._is_open(organisation_id, now) for organisation_id in organisation_ids):
+                return False
+
+            for organisation_id in organisation_ids:
+                if organisation_id in self._OpenedAt:
+                    self._ProbingSince[organisation_id] = now
+
+        return True
+
+    def _is_open(self, organisation_id, now):
+        """
+        Check whether an organisation should not be queried; the lock of the breaker must be held
+
+        :param int organisation_id: id of the organisation
+        :param float now: current time in seconds since the epoch
+        :return bool: True if the breaker of the organisation is open
+        """
+        opened_at = self._OpenedAt.get(organisation_id)
+        if opened_at is None:
+            return False
+
+        if now - opened_at < self.ResetTimeout:
+            return True
+
+        return now - self._ProbingSince.get(organisation_id, float('-inf')) < self.ProbeTimeout
+
+    def record_success(self, organisation_id):
+        """
+        Register a query of an organisation that succeeded, which closes its breaker
+
+        :param int organisation_id: id of the organisation
+        """
+        with self._Lock:
+            self._Failures.pop(organisation_id, None)
+            self._OpenedAt.pop(organisation_id, None)
+            self._ProbingSince.pop(organisation_id, None)
+
+    def record_failure(self, organisation_id):
+        """
+        Register a query of an organisation that failed, which opens its breaker once the failure threshold has
+        been reached, or again if the query was the probe of a half-open breaker
+
+        :param int organisation_id: id of the organisation
+        """
+        with self._Lock:
+            failures = self._Failures[organisation_id] = self._Failures.get(organisation_id, 0) + 1
+
+            if failures >= self.FailureThreshold:
+                self._OpenedAt[organisation_id] = time.time()
+                self._ProbingSince.pop(organisation_id, None)
+
+    def open_organisations(self):
+        """
+        Retrieve the organisations that are not queried
+
+        :return list: ids of the organisations of which the breaker is open
+        """
+        now = time.time()
+
+        with self._Lock:
+            return [organisation_id for organisation_id in self._OpenedAt if self._is_open(organisation_id, now)]
@@ -0,0 +1,194 @@
+import base64
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+import time
+
+# secret of this process, used to recognise credentials without using the password itself as key of the pools
+_CredentialSecret = os.urandom(32)
+
+_Pools = {}
+_PoolsLock = threading.Lock()
+
+
+def get_client_pool(identity, password, create_client, size=None, refresh_margin=None, timeout=None):
+    """
+    Retrieve the pool of authenticated clients for the given credentials, or create it if there is none yet.
+    Logging in again with the same credentials reuses the authenticated clients, rather than authenticating
+    and loading the encryption key once more.
+
+    :param tuple identity: server and username that the clients are authenticated for
+    :param str password: password of the user; the pool is recognised by a digest of it, but note that
+    create_client typically captures the password itself, and the pool keeps create_client for the life of the
+    process to create and re-authenticate clients
+    :param callable create_client: function that creates an authenticated vantage6.client.Client
+    :param int size: maximum number of clients in the pool
+    :param float refresh_margin: number of seconds before expiry of the access token that it is refreshed
+    :param float timeout: default maximum number of seconds to wait for a client of the pool
+    :return ClientPool: the pool of clients
+    """
+    credential_digest = hmac.new(_CredentialSecret, str(password).encode(), hashlib.sha256).hexdigest()
+    pool_key = (tuple(identity), credential_digest)
+
+    with _PoolsLock:
+        pool = _Pools.get(pool_key)
+
+    if pool is None:
+        # authenticate outside the lock; a failing authentication raises before the pool is registered
+        pool = ClientPool(create_client, size, refresh_margin, timeout)
+
+        with _PoolsLock:
+            pool = _Pools.setdefault(pool_key, pool)
+
+    return pool
+
+
+def get_token_expiry(token):
+    """
+    Retrieve the expiry time of a JSON web token without verifying it
+
+    :param str token: the access token
+    :return float: expiry as seconds since the epoch, or None if it cannot be determined
+    """
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class ClientPool:
+    def __init__(self, create_client, size=None, refresh_margin=None, timeout=None):
+        """
+        Pool of authenticated Vantage6 clients that are handed out to concurrent task submissions and result polls.
+        The clients keep their sessions and HTTP connections alive; their access tokens are refreshed before expiry.
+
+        :param callable create_client: function that creates an authenticated vantage6.client.Client
+        :param int size: maximum number of clients in the pool
+        :param float refresh_margin: number of seconds before expiry of the access token that it is refreshed
+        :param float timeout: default maximum number of seconds to wait for a client if all clients are in use
+        """
+        if isinstance(size, int) is False:
+            size = 4
+
+        if isinstance(refresh_margin, (int, float)) is False:
+            refresh_margin = 60
+
+        if isinstance(timeout, (int, float)) is False:
+            timeout = 60
+
+        self.CreateClient = create_client
+        self.Size = size
+        self.RefreshMargin = refresh_margin
+        self.Timeout = timeout
+
+        # the most recently used clients are handed out first, as their connections are most likely alive
+        self._Idle = queue.LifoQueue()
+        self._Created = 0
+        self._Lock = threading.Lock()
+
+        # authenticate straight away, so that invalid credentials are noticed upon login
+        self.Primary = self._create()
+        self._Idle.put(self.Primary)
+
+    @contextlib.contextmanager
+    def client(self, timeout=None):
+        """
+        Borrow a client from the pool for the duration of a with-statement
+
+        :param float timeout: maximum number of seconds to wait for a client, defaults to the timeout of the pool
+        :return: an authenticated vantage6.client.Client with a valid access token
+        """
+        client = self.acquire(timeout)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def acquire(self, timeout=None):
+        """
+        Take a client from the pool; a new client is created if all clients are in use and the pool is not full
+
+        :param float timeout: maximum number of seconds to wait for a client, defaults to the timeout of the pool
+        :return: an authenticated vantage6.client.Client with a valid access token
+        :raise TimeoutError: if no client became available in time
+        """
+        if isinstance(timeout, (int, float)) is False:
+            timeout = self.Timeout
+
+        try:
+            client = self._Idle.get_nowait()
+        except queue.Empty:
+            with self._Lock:
+                may_create = self._Created < self.Size
+                if may_create:
+                    self._Created += 1
+
+            if may_create:
+                try:
+                    return self.CreateClient()
+                except BaseException:
+                    with self._Lock:
+                        self._Created -= 1
+                    raise
+
+            try:
+                client = self._Idle.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f'No Vantage6 client became available within {timeout} seconds') from None
+
+        return self._refresh(client)
+
+    def release(self, client):
+        """
+        Return a client to the pool
+
+        :param client: the vantage6.client.Client that was acquired
+        """
+        self._Idle.put(client)
+
+    def _create(self):
+        """
+        Create a new authenticated client and count it as part of the pool
+
+        :return: an authenticated vantage6.client.Client
+        """
+        client = self.CreateClient()
+
+        with self._Lock:
+            self._Created += 1
+
+        return client
+
+    def _refresh(self, client):
+        """
+        Refresh the access token of a client if it expires within the refresh margin
+
+        :param client: the vantage6.client.Client to refresh
+        :return: the client, or a newly authenticated client if refreshing failed
+        :raise Exception: if authenticating anew failed as well, in which case the client is no longer counted as
+        part of the pool, so that another client can be created in its place
+        """
+        expiry = get_token_expiry(getattr(client, 'token', None))
+
+        if expiry is None or expiry - time.time() > self.RefreshMargin:
+            return client
+
+        try:
+            client.refresh_token()
+            return client
+        except Exception:
+            pass
+
+        # the refresh token may have expired as well, so authenticate anew
+        try:
+            return self.CreateClient()
+        except BaseException:
+            with self._Lock:
+                self._Created -= 1
+            raise
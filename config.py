@@ -9,3 +9,42 @@ password = ""
 
 # organisation information; set to None if encryption has not been set up
 organization_key = None
+
+# cache information; results of federated queries are kept on disk in the output directory
+cache_filename = "query_cache.sqlite"
+cache_ttl = 7 * 24 * 60 * 60  # seconds
+cache_max_bytes = 512 * 1024 ** 2
+memory_cache_max_bytes = 128 * 1024 ** 2  # per result store
+figure_cache_max_bytes = 32 * 1024 ** 2
+# expired results are kept on disk for this long, to be shown when institutions do not respond in time
+cache_stale_ttl = 30 * 24 * 60 * 60  # seconds
+
+# heatmap information; larger correlation matrices are drawn without values, and averaged into blocks if need be
+heatmap_annotation_max_size = 30  # variables
+heatmap_max_size = 150  # variables per axis
+# retrieve the sufficient statistics of the correlation per institution, so that any selection of institutions is
+# combined locally; requires a version of the heatmap algorithm that supports output='sufficient_statistics',
+# otherwise the correlation matrix is retrieved per selection of institutions
+heatmap_sufficient_statistics = False
+
+# session information; sessions of users that have been idle for longer are removed
+session_max_idle = 8 * 60 * 60  # seconds
+# selections that follow the previous change of a user within this time are only queried once they have settled
+selection_debounce = 0.5  # seconds
+
+# client information; authenticated clients are shared by concurrent tasks of users with the same credentials
+client_pool_size = 4
+client_token_refresh_margin = 60  # seconds before expiry of the access token
+client_pool_timeout = 60  # seconds that a task waits for a client if all clients are in use
+
+# task information; whilst task status events are received, the status of a task is only polled at this interval
+task_event_fallback_interval = 30  # seconds
+
+# deadline information; dashboard queries that take longer are killed, and their institutions considered unavailable
+# for as long as the deadline before being queried again; institutions of which this many consecutive queries exceeded
+# their deadline are not queried until the reset timeout has passed, after which a single query is sent as a probe
+# whilst all other queries keep falling back; the institution is queried again once the probe succeeded, and remains
+# unavailable for another reset timeout if it failed
+query_deadline = 120  # seconds
+circuit_breaker_failures = 3
+circuit_breaker_reset_timeout = 10 * 60  # seconds
@@ -1,5 +1,9 @@
 import dash
-import hashlib
+import flask
+import json
+import os
+import threading
+import time
 import vantage6.client
 
 import numpy as np
@@ -8,29 +12,51 @@ import pandas as pd
 
 from dash import html
 from dash import dcc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import ClientsideFunction, Input, Output, State
 
 # private module
+import circuit_breaker
+import config as config
+import metrics
 import miscellaneous
+import persistent_cache
+import query_planner
+import result_store
+import sessions
+import task_tracker
 import vantage_client
 
 
 class Dashboard:
-    def __init__(self):
-        """"""
+    def __init__(self, client_factory=None, cache_path=None, event_source_factory=None):
+        """
+        :param callable client_factory: function that creates the Vantage6 clients of users, see Vantage6Client;
+        e.g. FakeVantage6Server.client to run the dashboard without a Vantage6 server
+        :param str cache_path: path of the SQLite database that results are cached in,
+        defaults to config.cache_filename in the output directory
+        :param callable event_source_factory: function that subscribes to the task status events of the server,
+        see Vantage6Client; e.g. FakeVantage6Server.event_source
+        """
+        if isinstance(cache_path, str) is False:
+            cache_path = os.path.join(vantage_client.get_output_path(), config.cache_filename)
+
+        self.ClientFactory = client_factory
+        self.EventSourceFactory = event_source_factory
         # settings
         self.ColourSchemeContinuous = px.colors.sequential.Agsunset
         self.ColourSchemeCategorical = px.colors.sequential.Agsunset
 
-        # vantage components
-        self.Vantage6User = vantage_client.Vantage6Client()
-        self.Organisations = None
+        # vantage components; every user has their own client and selection of organisations, which are kept
+        # in their session, whereas the results of queries are shared between all users
+        self.Sessions = sessions.SessionRegistry(config.session_max_idle)
         # organisation names are ideally retrieved from the client, but some standard names will have to be in place
         # currently names have to be changed to match specific node names
         self.OrganisationsNames = ['HN1_Maastro', 'Montreal', 'Toronto', 'HN3_Maastro']
-        self.Organisations_ids_to_query = []
         self.roi_names = {'GTV Primary': 'GTV-1',
                           'GTV Node': 'GTV-2'}
+        # variables that the correlation heatmap is computed for
+        self.heatmap_variables = ['Fmorph.pca.elongation', 'Fmorph.pca.flatness', 'Fmorph.diam']
+        self.heatmap_censor_column = 'censor'
 
         self.filter_dict = {'roo:P100018': ['C16576', 'C20197'],
                             'roo:P100244': ['C48719', 'C48720', 'C48724', 'C48728', 'C48732'],
@@ -42,21 +68,65 @@ class Dashboard:
                             'roo:P100202': ['C12762', 'C12246', 'C12420', 'C12423'],
                             'roo:P100231': ['C94626', 'C15313']}
 
-        self.Filters_to_apply = {}
-
         # this 'dataset' is used to display some data when the user has not been authenticated yet
         self._PlaceholderData = {"Not an actual variable_count": {"0.0": 2, "1.0": 4}}
-        self.PlaceholderDataframe = miscellaneous.convert_count_dict_to_dataframe(self._PlaceholderData,
-                                                                                  self.Filters_to_apply,
-                                                                                  self.Organisations_ids_to_query)
 
-        self._PlaceholderDataHeatMap = {}
-        self.PlaceholderDataFrameHeatMap, temp_dict = miscellaneous.convert_heatmap_to_appropriate_dataframe(
-            pd.DataFrame(np.random.rand(10, 10), columns=[f'Column_{i}' for i in range(10)]),
-            self.Organisations_ids_to_query,
-            tuple(self.roi_names.values())[0])
+        # results of queries are stored by their hash identifier, so that they can be looked up directly;
+        # the results are also kept on disk so that they are available after a restart or eviction from memory
+        self.ResultCache = persistent_cache.PersistentCache(cache_path, config.cache_ttl, config.cache_max_bytes,
+                                                            config.cache_stale_ttl)
+        self.CountResults = result_store.ResultStore(self.ResultCache, config.cache_ttl, config.memory_cache_max_bytes,
+                                                     'counts')
+        self.CountResults.put_frame(miscellaneous.convert_count_dict_to_dataframe(self._PlaceholderData, {}, []),
+                                    'HashIdentifier', persist=False)
+
+        # counts are stored per organisation, so that any selection of organisations can be assembled locally
+        self.CountPlanner = query_planner.QueryPlanner(self.CountResults, self._build_count_query_key,
+                                                       miscellaneous.sum_count_frames)
+
+        self.HeatmapResults = result_store.ResultStore(self.ResultCache, config.cache_ttl,
+                                                       config.memory_cache_max_bytes, 'heatmaps')
+        placeholder_heatmap_data = pd.DataFrame(np.random.rand(10, 10), columns=[f'Column_{i}' for i in range(10)])
+        if config.heatmap_sufficient_statistics:
+            placeholder_heatmap_result = miscellaneous.pack_sufficient_statistics(
+                miscellaneous.compute_sufficient_statistics(placeholder_heatmap_data,
+                                                            list(placeholder_heatmap_data.columns)))
+        else:
+            placeholder_heatmap_result = miscellaneous.convert_correlation_matrix(
+                placeholder_heatmap_data.corr().to_dict())
+        self.HeatmapResults.put(self._build_heatmap_query_key(tuple(self.roi_names.values())[0], []),
+                                placeholder_heatmap_result, persist=False)
+
+        # the sufficient statistics of the correlation are stored per organisation and combined locally,
+        # whereas correlation matrices cannot be combined and are stored per selection of organisations
+        if config.heatmap_sufficient_statistics:
+            self.HeatmapPlanner = query_planner.QueryPlanner(self.HeatmapResults, self._build_heatmap_query_key,
+                                                             miscellaneous.combine_sufficient_statistics)
+        else:
+            self.HeatmapPlanner = query_planner.QueryPlanner(self.HeatmapResults, self._build_heatmap_query_key,
+                                                             miscellaneous.select_correlation_matrix, split=False)
+
+        # figures are stored as JSON by the query they show and the way they are drawn, and counts by the data that
+        # is pushed to the browser, so that repeated views neither combine the results nor construct the figure again
+        self.FigureCache = result_store.ResultStore(ttl=config.cache_ttl, max_bytes=config.figure_cache_max_bytes,
+                                                    name='figures')
+
+        # queries that are running in the background, their results are added to the result stores upon completion
+        self.Jobs = {}
+        # guards the jobs and unavailable jobs only; results are planned and stored outside of it, as these may be
+        # read from and written to disk
+        self._JobsLock = threading.RLock()
+        self.JobPollingInterval = 1000
+        metrics.jobs_in_flight.set_function(lambda: len(self.Jobs))
+
+        # queries that exceeded their deadline, by the time they did so, and the organisations that keep doing so;
+        # their results fall back to the last stored results until they are queried again
+        self.UnavailableJobs = {}
+        # a probe of a half-open breaker is given up once it could have exceeded its deadline
+        self.Breaker = circuit_breaker.CircuitBreaker(config.circuit_breaker_failures,
+                                                      config.circuit_breaker_reset_timeout, config.query_deadline)
+        metrics.open_circuits.set_function(lambda: len(self.Breaker.open_organisations()))
 
-        self._PlaceholderDataHeatMap.update(temp_dict)
         # content components
         self.DashboardTitle = ''
         self.DashboardTileTexts = ["3 countries", "4 institutions", "2000 patients"]
@@ -76,10 +146,17 @@ class Dashboard:
         self.Layout = self.define_layout()
         self.register_callbacks()
 
+        # expose the metrics of this process for Prometheus on the server that the dashboard runs on
+        self.App.server.add_url_rule('/metrics', 'metrics', self.serve_metrics)
+
     def define_layout(self):
         """"""
         self.App.layout = html.Div([
             dcc.Store(id='authentication-status', data=False),  # Store for login status
+            dcc.Store(id='session-id', data=None),  # Store for the id of the user's server-side session
+            dcc.Store(id='organisation-ids', data=[]),  # Store for the ids of the selected organisations
+            dcc.Store(id='count-data', data=None),  # Store for the counts of the selected variable
+            dcc.Store(id='colour-scheme', data=list(self.ColourSchemeCategorical)),  # Store for the chart colours
 
             html.Header([
                 html.Div(className='primary-header', children=[
@@ -144,9 +221,12 @@ class Dashboard:
                     dcc.Tab(label='Bar chart', className='graph', value='tab-bar'),
                 ]),
 
-                # Tab content
-                html.Div(id='tab-content', className='graph-content'),
-                html.Div(id='query-trigger-not-for-display'),
+                # Tab content; the graph is drawn in the browser from the counts in the store
+                html.Div(id='tab-content', className='graph-content', children=[
+                    html.Div(id='count-status'),
+                    dcc.Graph(id='count-graph', style={'display': 'none'})
+                ]),
+                dcc.Interval(id='count-job-poll', interval=self.JobPollingInterval, disabled=True),
 
                 # Display the heatmap below the tabs
                 html.Div([
@@ -165,6 +245,7 @@ class Dashboard:
                 ], style={'display': 'flex', 'flexDirection': 'row', 'vertical-align': 'top'}),
 
                 html.Div(id='heatmap-content'),
+                dcc.Interval(id='heatmap-job-poll', interval=self.JobPollingInterval, disabled=True),
             ])
         ])
 
@@ -175,36 +256,45 @@ class Dashboard:
             [Output('authentication-status', 'data'),
              Output('input-container', 'style'),
              Output('welcome-message', 'children'),
-             Output('auth-lock', 'style')],
+             Output('auth-lock', 'style'),
+             Output('session-id', 'data')],
             [Input('login-button', 'n_clicks')],
             [State('input-username', 'value'),
-             State('input-password', 'value')]
+             State('input-password', 'value'),
+             State('session-id', 'data')]
         )
-        def authenticate(n_clicks, username, password):
+        def authenticate(n_clicks, username, password, session_id):
             """"""
             if n_clicks > 0:
                 try:
                     # log in
-                    self.Vantage6User.login(username, password)
-                    self.Organisations = self.Vantage6User.Client.organization.list()
+                    vantage6_user = vantage_client.Vantage6Client(self.ClientFactory, self.EventSourceFactory)
+                    vantage6_user.login(username, password)
+                    with vantage6_user.borrow_client() as client:
+                        organisations = client.organization.list()
+
+                    # replace any earlier session of this browser by a new one
+                    self.Sessions.remove(session_id)
+                    session_id = self.Sessions.create(vantage6_user, organisations)
 
                     # Successful authentication, return True (logged in) and empty style for input container
                     welcome_message = [f'Welcome {username}, happy to have you here!']
-                    return True, {'display': 'none'}, welcome_message, {'display': 'none'}
+                    return True, {'display': 'none'}, welcome_message, {'display': 'none'}, session_id
                 except vantage6.client.AuthenticationException:
-                    return False, {'display': 'block'}, [], {'display': 'block'}
+                    return False, {'display': 'block'}, [], {'display': 'block'}, None
             # Default: Display the login input fields, an empty welcome message, and hide the button
-            return False, {'display': 'block'}, [], {'display': 'block'}
+            return False, {'display': 'block'}, [], {'display': 'block'}, None
 
         @self.App.callback(
-            Output('query-trigger-not-for-display', 'children'),
+            Output('organisation-ids', 'data'),
             [Input('authentication-status', 'data'),
-             Input('institution-checklist', 'value')]
+             Input('institution-checklist', 'value')],
+            [State('session-id', 'data')]
         )
-        def select_organisations(authentication_status, organisation_to_include):
+        def select_organisations(authentication_status, organisation_to_include, session_id):
             """
             Transcribe the user's selection of organisations to ids that can be used in the Vantage6 Python client
-            by directly accessing the Vantage6 Python client which are then stored it in a class object.
+            by directly accessing the Vantage6 Python client which are then stored in the user's browser.
 
             The dcc.CheckList was not directly used as a callback to use Vantage6's Python client to ensure that:
              - dummy data can be displayed whilst not being an authenticated user
@@ -212,16 +302,23 @@ class Dashboard:
 
             :param bool authentication_status: ensure that the user is authenticated to retrieve the organisation ids
             :param list organisation_to_include: list of organisations that the user has selected on the dashboard
-            :return: an empty string, the query trigger is solely used to prioritise this callback over callbacks
-            that actually use the selected organisations. This is done to ensure that a generic graph is visible
-            whilst not being logged in by using a class object rather than callback itself
+            :param str session_id: the id of the user's session
+            :return: the ids of the selected organisations; whilst not being logged in this remains an empty list,
+            so that a generic graph is visible
             """
+            session = self.Sessions.get(session_id)
+
             # only retrieve the organisation ids when the user is authenticated as it will otherwise break
-            if authentication_status:
-                self.Organisations_ids_to_query = [organisation['id'] for organisation in self.Organisations['data']
-                                                   if organisation['name'] in organisation_to_include]
+            if authentication_status is False or session is None:
+                return []
+
+            organisation_ids = [organisation['id'] for organisation in session.Organisations['data']
+                                if organisation['name'] in organisation_to_include]
 
-            return ""
+            # fill the result stores in the background, so that selecting another variable is instant
+            self._select_organisations(session, organisation_ids)
+
+            return organisation_ids
 
         # to implement
         # @self.App.callback(
@@ -242,53 +339,108 @@ class Dashboard:
         #     return current_content  # Return the current content when not updating
 
         @self.App.callback(
-            Output('tab-content', 'children'),
-            Input('query-trigger-not-for-display', 'children'),
-            Input('tabs', 'value'),
-            Input("dataset-variable", "value"))
-        def render_content(query_trigger, tab, dataset_variable):
+            Output('count-data', 'data'),
+            Output('count-status', 'children'),
+            Output('count-job-poll', 'disabled'),
+            Input('organisation-ids', 'data'),
+            Input("dataset-variable", "value"),
+            Input('count-job-poll', 'n_intervals'),
+            State('session-id', 'data'))
+        def render_content(organisation_ids, dataset_variable, n_intervals, session_id):
             """
-            to complete
+            Push the counts of the selected variable to the browser, or render the status of the query whilst it is
+            still running. The query runs in the background; the job poll re-triggers this callback until its results
+            are in. The chart is drawn in the browser, so that switching tabs or colours does not reach the server.
+            Variables that the user clicks through in rapid succession are only queried once the selection settles,
+            and the queries of variables that are no longer shown are cancelled.
+
+            :param list organisation_ids: the ids of the selected organisations
+            :param str dataset_variable: name or predicate of the variable to render
+            :param int n_intervals: number of times the running query has been polled
+            :param str session_id: the id of the user's session
+            :return: the counts or None, the query status, and whether the job poll should be disabled
+            """
+            vantage6_user, submit = self._select_view(
+                session_id, 'counts', (dataset_variable, tuple(organisation_ids)),
+                list(self.CountPlanner.keys([dataset_variable], organisation_ids).values()))
+
+            data_key = self._build_figure_key(self._build_count_query_key(dataset_variable, organisation_ids),
+                                              'count-data')
+            count_data = self.FigureCache.get(data_key)
+            if count_data is not None:
+                return count_data, None, True
+
+            # retrieve the data that is to be rendered
+            filtered_data, job_status, progress = self._retrieve_counts_to_render(dataset_variable, organisation_ids,
+                                                                                  vantage6_user, submit)
+
+            if filtered_data is None:
+                return None, self._render_job_status(job_status), job_status not in ['queued', 'running']
+
+            count_data = filtered_data[['Categories', 'Values']].to_dict('list')
+
+            # the counts of the institutions that responded are shown until the counts of all institutions are in;
+            # these partial counts are not cached, so that the job poll replaces them
+            if job_status != 'complete':
+                return count_data, self._render_job_status(job_status, progress), \
+                    job_status not in ['queued', 'running']
+
+            self.FigureCache.put(data_key, count_data)
+            return count_data, None, True
+
+        # draw the pie or bar chart in the browser, see assets/dashboard_clientside.js
+        self.App.clientside_callback(
+            ClientsideFunction(namespace='dashboard', function_name='render_counts'),
+            Output('count-graph', 'figure'),
+            Output('count-graph', 'style'),
+            Input('count-data', 'data'),
+            Input('tabs', 'value'),
+            Input('colour-scheme', 'data'))
 
-            :param any query_trigger:
-            :param str tab:
-            :param str dataset_variable:
-            :return:
+        @self.App.callback(
+            Output('heatmap-content', 'children'),
+            Output('heatmap-job-poll', 'disabled'),
+            Input('organisation-ids', 'data'),
+            Input("roi-checklist", "value"),
+            Input('heatmap-job-poll', 'n_intervals'),
+            State('session-id', 'data'))
+        def render_heatmap(organisation_ids, roi_checklist, n_intervals, session_id):
             """
-            if tab == 'tab-pie':
-                # retrieve the data that is to be rendered
-                filtered_data = self._retrieve_counts_to_render(dataset_variable)
+            Render the correlation heatmap of the selected ROI, or the status of the query whilst it is still running
 
-                # create a pie chart
-                fig = px.pie(filtered_data, names='Categories', values='Values',
-                             color_discrete_sequence=self.ColourSchemeCategorical)
+            :param list organisation_ids: the ids of the selected organisations
+            :param str roi_checklist: the ROI that is selected
+            :param int n_intervals: number of times the running query has been polled
+            :param str session_id: the id of the user's session
+            :return: the graph or query status, and whether the job poll should be disabled
+            """
+            vantage6_user, submit = self._select_view(
+                session_id, 'heatmap', (roi_checklist, tuple(organisation_ids)),
+                list(self.HeatmapPlanner.keys([roi_checklist], organisation_ids).values()))
 
-            # elif tab == 'tab-scatter':
-            #     Create a scatter plot
-            # fig = px.scatter(filtered_data, x='X', y='Y', title=dataset_variable)
+            figure_key = self._build_figure_key(self._build_heatmap_query_key(roi_checklist, organisation_ids),
+                                                'heatmap', self.ColourSchemeContinuous)
+            figure_json = self.FigureCache.get(figure_key)
+            if figure_json is not None:
+                return dcc.Graph(figure=json.loads(figure_json)), True
 
-            elif tab == 'tab-bar':
-                # retrieve the data that is to be rendered
-                filtered_data = self._retrieve_counts_to_render(dataset_variable)
+            heatmap_data, job_status, progress = self._retrieve_heatmap_to_render(roi_checklist, organisation_ids,
+                                                                                  vantage6_user, submit)
 
-                # create a bar chart
-                fig = px.bar(filtered_data, x='Categories', y='Values',
-                             color_discrete_sequence=self.ColourSchemeCategorical)
+            if heatmap_data is None:
+                return self._render_job_status(job_status), job_status not in ['queued', 'running']
 
-            else:
-                fig = None
+            with metrics.phase_duration.time({'phase': 'figure_heatmap'}):
+                fig_heatmap = self._build_heatmap_figure(heatmap_data)
 
-            return dcc.Graph(figure=fig)
+            # the heatmap of the institutions that responded is shown until the statistics of all institutions are
+            # in; this partial heatmap is not cached, so that the job poll replaces it
+            if job_status != 'complete':
+                return html.Div([self._render_job_status(job_status, progress), dcc.Graph(figure=fig_heatmap)]), \
+                    job_status not in ['queued', 'running']
 
-        @self.App.callback(
-            Output('heatmap-content', 'children'),
-            Input('query-trigger-not-for-display', 'children'),
-            Input("roi-checklist", "value"))
-        def render_heatmap(query_trigger, roi_checklist):
-            heatmap_data = self._retrieve_heatmap_to_render(roi_checklist)
-            fig_heatmap = px.imshow(heatmap_data, y=heatmap_data.columns, text_auto=True, aspect="auto",
-                                    title='Correlation Heatmap')
-            return dcc.Graph(figure=fig_heatmap)
+            self.FigureCache.put(figure_key, fig_heatmap.to_json())
+            return dcc.Graph(figure=fig_heatmap), True
 
     def run(self, debug=None):
         """
@@ -301,116 +453,618 @@ class Dashboard:
 
         self.App.run_server(debug=debug)
 
-    def _retrieve_counts_to_render(self, dataset_variable):
+    @staticmethod
+    def serve_metrics():
         """
-        Retrieve counts of given variable, either from data already existing in the placeholder, or by querying Vantage6
+        Serve the metrics of this process in the Prometheus text format on the /metrics route
 
-        :param str dataset_variable: name or predicate of the variable to query
-        :return: pandas.DataFrame consisting of the counts of the desired variable
+        :return flask.Response: the exposition of the metrics
+        """
+        return flask.Response(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def warm_up_cache(self, organisation_ids, vantage6_user):
+        """
+        Submit the counts of all dashboard variables and the heatmaps of all ROIs for the given organisations,
+        so that their results are in the result stores by the time that the user selects them.
+        The counts are retrieved in a single task, which runs concurrently with the heatmaps in the background;
+        stored results and running queries are not submitted again.
+
+        :param list organisation_ids: organisations to query
+        :param Vantage6Client vantage6_user: the client of the user to submit the queries with
+        """
+        self._request_counts(list(self.filter_dict), list(organisation_ids), vantage6_user)
+
+        for roi_name in self.roi_names.values():
+            self._request_heatmap(roi_name, list(organisation_ids), vantage6_user)
+
+    def _select_organisations(self, session, organisation_ids):
+        """
+        Warm up the cache for the organisations that a user selected, see warm_up_cache. Whilst the user toggles
+        organisations in rapid succession, only the selection that settles is warmed up, and the queries of
+        organisations that are no longer selected are cancelled unless another view still waits for them.
+
+        :param DashboardSession session: the session of the user
+        :param list organisation_ids: organisations that the user has selected
         """
+        self._watch_jobs(session, 'organisations',
+                         list(self.CountPlanner.keys(list(self.filter_dict), organisation_ids).values()) +
+                         list(self.HeatmapPlanner.keys(list(self.roi_names.values()), organisation_ids).values()))
 
-        if dataset_variable != 'Not an actual variable':
-            self.Filters_to_apply = {dataset_variable: self.filter_dict[dataset_variable]}
+        if session.change_selection('organisations', tuple(organisation_ids), config.selection_debounce):
+            self.warm_up_cache(organisation_ids, session.Vantage6User)
+            return
 
-        # do not attempt to query dummy data; the [] and [0] represent the default filter and organisation state
+        # warm up once the selection has settled, unless it has been changed again by then
+        settled_timer = threading.Timer(config.selection_debounce, self._warm_up_settled_selection,
+                                        (session, organisation_ids))
+        settled_timer.daemon = True
+        settled_timer.start()
+
+    def _warm_up_settled_selection(self, session, organisation_ids):
+        """
+        Warm up the cache for a selection of organisations that was debounced, if it is still the user's selection
+
+        :param DashboardSession session: the session of the user
+        :param list organisation_ids: organisations that the user had selected
+        """
+        if session.Selections.get('organisations', (None,))[0] == tuple(organisation_ids):
+            self.warm_up_cache(organisation_ids, session.Vantage6User)
+
+    def _select_view(self, session_id, view, selection, job_keys):
+        """
+        Register the selection of a view of a user's session and the results that the view waits for;
+        queries of the previous selection are cancelled unless another view still waits for them
+
+        :param str session_id: the id of the user's session
+        :param str view: name of the view, e.g. 'counts'
+        :param tuple selection: hashable description of the selection, e.g. the variable and organisation ids
+        :param list job_keys: hash identifiers of the results per organisation that make up the selection
+        :return: the client of the user, None if the user is not logged in, and whether the queries of the selection
+        may be submitted straight away rather than once the selection has settled, see config.selection_debounce
+        """
+        session = self.Sessions.get(session_id)
+
+        if session is None:
+            return None, False
+
+        self._watch_jobs(session, view, job_keys)
+        return session.Vantage6User, session.change_selection(view, selection, config.selection_debounce)
+
+    def _watch_jobs(self, session, view, job_keys):
+        """
+        Replace the results that a view of a session waits for, and cancel the queries of the results that are no
+        longer waited for by any view of any session. A query that retrieves several results, e.g. the counts of
+        several variables, is only cancelled if none of its results are waited for.
+
+        :param DashboardSession session: the session of the user
+        :param str view: name of the view, e.g. 'counts'
+        :param list job_keys: hash identifiers of the results that the view waits for
+        """
+        released_job_keys = session.watch_jobs(view, job_keys)
+
+        if not released_job_keys:
+            return
+
+        watched_job_keys = self.Sessions.collect_watched_jobs()
+        task_handles_to_cancel = []
+
+        with self._JobsLock:
+            job_keys_per_handle = {}
+            for job_key, task_handle in self.Jobs.items():
+                job_keys_per_handle.setdefault(task_handle, []).append(job_key)
+
+            for task_handle, handle_job_keys in job_keys_per_handle.items():
+                if released_job_keys.isdisjoint(handle_job_keys) or \
+                        watched_job_keys.isdisjoint(handle_job_keys) is False:
+                    continue
+
+                for job_key in handle_job_keys:
+                    self.Jobs.pop(job_key)
+                task_handles_to_cancel.append(task_handle)
+
+        # the tasks are killed on the server outside of the lock, as this takes a request per task
+        for task_handle in task_handles_to_cancel:
+            task_handle.cancel()
+
+    def _retrieve_counts_to_render(self, dataset_variable, organisation_ids, vantage6_user, submit=True):
+        """
+        Retrieve counts of given variable, either from the result store, or by querying Vantage6.
+        The query is submitted in the background; until its results are in, the status of the query is returned.
+
+        :param str dataset_variable: name or predicate of the variable to query
+        :param list organisation_ids: organisations to query
+        :param Vantage6Client vantage6_user: the client of the user, None if the user is not logged in
+        :param bool submit: submit the missing counts, otherwise these are reported as queued
+        :return: pandas.DataFrame consisting of the counts of the desired variable, which are partial whilst the query
+        is running and None if no institution has responded yet, the status of the query, and its progress as the
+        number of institutions that responded and the number of institutions that were queried
+        """
+        # do not attempt to query dummy data; the [] represents the default organisation state
         if f'{dataset_variable}_count' in self._PlaceholderData.keys():
-            filtered_data = self.PlaceholderDataframe[
-                self.PlaceholderDataframe['HashIdentifier'] == miscellaneous.hash_information(dataset_variable,
-                                                                                              {}, [])]
-            return filtered_data
-        else:
-            # collect the data that is to be queried
-            filtered_data = self.PlaceholderDataframe[self.PlaceholderDataframe['HashIdentifier'] ==
-                                                      miscellaneous.hash_information(dataset_variable,
-                                                                                     self.Filters_to_apply,
-                                                                                     self.Organisations_ids_to_query)]
-
-            # if it appears empty, i.e., the data for the organisation hash is not available then retrieve it
-            if filtered_data.empty:
-                query_name = f'Dashboard request of counts for {dataset_variable}'
-                self.Vantage6User.compute_count_sparql(name=query_name,
-                                                       predicates=dataset_variable,
-                                                       organisation_ids=self.Organisations_ids_to_query,
-                                                       filters=self.Filters_to_apply,
-                                                       save_results=False)
-                query_result = self.Vantage6User.Results[query_name]
-
-                # append the query result
-                self.PlaceholderDataframe = miscellaneous.convert_count_dict_to_dataframe(query_result,
-                                                                                          self.Filters_to_apply,
-                                                                                          self.Organisations_ids_to_query,
-                                                                                          self.PlaceholderDataframe)
-
-            # filter the placeholder to retrieve the new data
-            filtered_data = self.PlaceholderDataframe[self.PlaceholderDataframe['HashIdentifier'] ==
-                                                      miscellaneous.hash_information(dataset_variable,
-                                                                                     self.Filters_to_apply,
-                                                                                     self.Organisations_ids_to_query)]
-            return filtered_data
-
-    def _retrieve_heatmap_to_render(self, roi_checklist):
-        """
-        Retrieve either from data already existing in the placeholder, or by querying Vantage6
-
-        :return: pandas.DataFrame consisting of the counts of the desired variable
+            return self.CountResults.get(self._build_count_query_key(dataset_variable, [])), 'complete', (1, 1)
+
+        return self._request_counts([dataset_variable], list(organisation_ids), vantage6_user,
+                                    submit)[dataset_variable]
+
+    def _request_counts(self, dataset_variables, organisation_ids, vantage6_user, submit=True):
+        """
+        Retrieve the counts of variables for a selection of organisations. Counts are stored per organisation and
+        summed locally, so that only the organisations of which counts are missing have to be queried.
+        For every such organisation, the variables that are neither stored nor already being retrieved are submitted
+        to Vantage6 together, as a single task running in the background.
+
+        :param list dataset_variables: predicates of the variables to query
+        :param list organisation_ids: organisations to query
+        :param Vantage6Client vantage6_user: the client to submit queries with, None does not submit any queries
+        :param bool submit: submit the missing counts, otherwise these are reported as queued
+        :return dict: per variable a pandas.DataFrame consisting of the counts of the organisations that responded or
+        None if none did, the status of the query, and the number of organisations that responded and were queried;
+        counts of organisations that are unavailable fall back to their last stored counts
+        """
+        # collect the data that is available per organisation; the results are looked up outside of the lock of
+        # the jobs, as these may be read from disk
+        query_plan = self.CountPlanner.plan(dataset_variables, organisation_ids)
+
+        with self._JobsLock:
+            unavailable_job_keys = self._collect_unavailable_job_keys(query_plan)
+
+            for organisation_unit, missing_variables in query_plan.Missing.items():
+                # the variables that are not available and are not being retrieved yet; results that have been
+                # stored since the plan was made are no longer being retrieved, but are not queried again either
+                variables_to_query = [dataset_variable for dataset_variable in missing_variables
+                                      if query_plan.Keys[(dataset_variable, organisation_unit)] not in self.Jobs and
+                                      query_plan.Keys[(dataset_variable, organisation_unit)]
+                                      not in unavailable_job_keys and
+                                      self.CountResults.holds(query_plan.Keys[(dataset_variable, organisation_unit)])
+                                      is False]
+
+                if not variables_to_query or vantage6_user is None or submit is False:
+                    continue
+
+                # organisations of which the breaker is half-open are only queried by a single probe
+                if self.Breaker.allow(organisation_unit) is False:
+                    unavailable_job_keys.update(query_plan.Keys[(dataset_variable, organisation_unit)]
+                                                for dataset_variable in variables_to_query)
+                    continue
+
+                self._submit_count_job(variables_to_query, list(organisation_unit),
+                                       [query_plan.Keys[(dataset_variable, organisation_unit)]
+                                        for dataset_variable in variables_to_query], vantage6_user)
+
+        self.CountPlanner.fall_back(query_plan, unavailable_job_keys)
+
+        counts = {}
+        for dataset_variable in dataset_variables:
+            with metrics.phase_duration.time({'phase': 'combine_counts'}):
+                filtered_data = self.CountPlanner.assemble(query_plan, dataset_variable, partial=True)
+
+            missing_keys = query_plan.missing_keys(dataset_variable)
+            if missing_keys:
+                job_status = self._collect_job_statuses(missing_keys, vantage6_user is not None,
+                                                        unavailable_job_keys)
+            else:
+                job_status = 'complete'
+
+            counts[dataset_variable] = (filtered_data, job_status, query_plan.progress(dataset_variable))
+
+        return counts
+
+    def _submit_count_job(self, dataset_variables, organisation_ids, job_keys, vantage6_user):
+        """
+        Submit a single count task for several variables in the background; the lock of the jobs must be held
+
+        :param list dataset_variables: predicates of the variables to query
+        :param list organisation_ids: organisations to query
+        :param list job_keys: hash identifiers of the variables that are queried
+        :param Vantage6Client vantage6_user: the client to submit the task with
+        """
+        # every variable is filtered on its own categories
+        filters = {dataset_variable: self.filter_dict[dataset_variable] for dataset_variable in dataset_variables}
+        query_name = f'Dashboard request of counts for {", ".join(dataset_variables)} of {organisation_ids}'
+        task_handle = vantage6_user.compute_count_sparql(name=query_name,
+                                                         predicates=dataset_variables,
+                                                         organisation_ids=organisation_ids,
+                                                         filters=filters,
+                                                         save_results=False,
+                                                         wait=False,
+                                                         deadline=config.query_deadline)
+        for job_key in job_keys:
+            self.Jobs[job_key] = task_handle
+        task_handle.add_done_callback(
+            lambda handle: self._store_count_result(dataset_variables, job_keys, handle, filters, organisation_ids))
+
+    def _store_count_result(self, dataset_variables, job_keys, task_handle, filters, organisation_ids):
+        """
+        Split the result of a finished count query into the counts per variable and store these; variables without
+        any values are stored as empty counts, whereas variables that are missing from the result are left for the
+        callback to report as failed, so that they are not queried over and over again.
+        Queries that exceeded their deadline mark their organisations as unavailable, other failed queries and
+        results that cannot be stored are left for the callback to report as failed.
+
+        :param list dataset_variables: predicates of the variables that were queried
+        :param list job_keys: hash identifiers of the variables that were queried, in the order of the variables
+        :param TaskHandle task_handle: handle of the finished query
+        :param dict filters: filters that were applied in the query, per variable
+        :param list organisation_ids: organisations that were queried
+        """
+        if isinstance(task_handle.exception(), task_tracker.TaskDeadlineExceededError):
+            self._mark_unavailable(job_keys, task_handle, organisation_ids)
+            return
+
+        if task_handle.exception() is not None:
+            return
+
+        result = task_handle.result()
+
+        try:
+            with metrics.phase_duration.time({'phase': 'convert_counts'}):
+                count_data = miscellaneous.convert_count_dict_to_dataframe(result, filters, organisation_ids)
+
+            for entry_size in miscellaneous.count_memory_per_entry(count_data, 'HashIdentifier'):
+                metrics.count_entry_size.observe(entry_size)
+
+            missing_job_keys = [job_key for dataset_variable, job_key in zip(dataset_variables, job_keys)
+                                if f'{dataset_variable}_count' not in result]
+            empty_job_keys = [job_key for dataset_variable, job_key in zip(dataset_variables, job_keys)
+                              if f'{dataset_variable}_count' in result and not result[f'{dataset_variable}_count']]
+
+            # the results are stored before their jobs are removed, so that they are not queried again in between
+            self.CountResults.put_frame(count_data, 'HashIdentifier')
+            for job_key in empty_job_keys:
+                self.CountResults.put(job_key, miscellaneous.convert_count_dict_to_dataframe({}, {}, []))
+        except Exception as exception:
+            self._mark_failed(job_keys, task_handle, exception)
+            return
+
+        if missing_job_keys:
+            missing_variables = [dataset_variable for dataset_variable, job_key in zip(dataset_variables, job_keys)
+                                 if job_key in missing_job_keys]
+            self._mark_failed(missing_job_keys, task_handle,
+                              KeyError(f'The result does not contain the counts of {", ".join(missing_variables)}'))
+
+        with self._JobsLock:
+            for job_key in job_keys:
+                if job_key in missing_job_keys:
+                    continue
+                self.Jobs.pop(job_key, None)
+                self.UnavailableJobs.pop(job_key, None)
+
+        for organisation_id in organisation_ids:
+            self.Breaker.record_success(organisation_id)
+
+    def _retrieve_heatmap_to_render(self, roi_checklist, organisation_ids, vantage6_user, submit=True):
+        """
+        Retrieve either from data already existing in the result store, or by querying Vantage6.
+        The query is submitted in the background; until its results are in, the status of the query is returned.
+
+        :param str roi_checklist: ROI to compute the heatmap for
+        :param list organisation_ids: organisations to query
+        :param Vantage6Client vantage6_user: the client of the user, None if the user is not logged in
+        :param bool submit: submit the missing statistics, otherwise these are reported as queued
+        :return: pandas.DataFrame consisting of the correlation matrix, which is partial whilst the query is running
+        and None if no institution has responded yet, the status of the query, and its progress as the number of
+        institutions that responded and the number of institutions that were queried
         """
         # build in a check for the filter or alike thing, to ensure that it is not directly querying data
-        # collect the data that is to be queried
-        expl_vars = ['Fmorph.pca.elongation', 'Fmorph.pca.flatness', 'Fmorph.diam']
-        censor_col = 'censor'
+        return self._request_heatmap(roi_checklist, list(organisation_ids), vantage6_user, submit)
 
+    def _request_heatmap(self, roi_name, organisation_ids, vantage6_user, submit=True):
+        """
+        Retrieve the correlation heatmap of a ROI for a selection of organisations. The sufficient statistics of
+        the correlation are stored per organisation and combined locally, so that only the organisations of which
+        statistics are missing have to be queried; these are submitted to Vantage6 in the background.
+
+        :param str roi_name: ROI to compute the heatmap for
+        :param list organisation_ids: organisations to query
+        :param Vantage6Client vantage6_user: the client to submit queries with, None does not submit any queries
+        :param bool submit: submit the missing statistics, otherwise these are reported as queued
+        :return: pandas.DataFrame consisting of the correlation matrix of the organisations that responded or None if
+        none did, the status of the query, and the number of organisations that responded and were queried;
+        statistics of organisations that are unavailable fall back to their last stored statistics
+        """
         # if organizations ids are selected, check the hash id if already present and fetch it
-        if self.Organisations_ids_to_query:
-            OrganisationHash = hashlib.sha256(
-                (str(tuple(self.Organisations_ids_to_query)) + roi_checklist).encode()).hexdigest()
         # else get the default hash id with organization ids [] and roi filter as GTV-1
+        if not organisation_ids:
+            roi_name = 'GTV-1'
+
+        # the results are looked up outside of the lock of the jobs, as these may be read from disk
+        query_plan = self.HeatmapPlanner.plan([roi_name], organisation_ids)
+
+        with self._JobsLock:
+            unavailable_job_keys = self._collect_unavailable_job_keys(query_plan)
+
+            for organisation_unit in query_plan.Missing:
+                job_key = query_plan.Keys[(roi_name, organisation_unit)]
+
+                # results that have been stored since the plan was made are not queried again
+                if job_key in self.Jobs or job_key in unavailable_job_keys or self.HeatmapResults.holds(job_key):
+                    continue
+
+                if vantage6_user is None or submit is False:
+                    continue
+
+                # organisations of which the breaker is half-open are only queried by a single probe
+                if self.Breaker.allow(organisation_unit) is False:
+                    unavailable_job_keys.add(job_key)
+                    continue
+
+                query_name = f'Heatmap statistics for {list(organisation_unit)} with filter ROI {roi_name}'
+
+                task_handle = vantage6_user.compute_hm_sparql(
+                    name=query_name,
+                    expl_vars=self.heatmap_variables,
+                    censor_col=self.heatmap_censor_column,
+                    roitype=roi_name,
+                    organisation_ids=list(organisation_unit),
+                    save_results=False,
+                    wait=False,
+                    sufficient_statistics=config.heatmap_sufficient_statistics,
+                    deadline=config.query_deadline)
+                self.Jobs[job_key] = task_handle
+                task_handle.add_done_callback(
+                    lambda handle, job_key=job_key, organisation_unit=organisation_unit:
+                    self._store_heatmap_result(job_key, handle, list(organisation_unit)))
+
+        self.HeatmapPlanner.fall_back(query_plan, unavailable_job_keys)
+
+        with metrics.phase_duration.time({'phase': 'combine_heatmap'}):
+            heatmap_data = self.HeatmapPlanner.assemble(query_plan, roi_name, partial=True)
+
+        missing_keys = query_plan.missing_keys(roi_name)
+        if missing_keys:
+            job_status = self._collect_job_statuses(missing_keys, vantage6_user is not None, unavailable_job_keys)
         else:
-            OrganisationHash = hashlib.sha256(
-                (str(tuple(self.Organisations_ids_to_query)) + 'GTV-1').encode()).hexdigest()
+            job_status = 'complete'
+
+        return heatmap_data, job_status, query_plan.progress(roi_name)
+
+    def _store_heatmap_result(self, job_key, task_handle, organisation_ids):
+        """
+        Store the sufficient statistics or correlation matrix of a finished heatmap query, see
+        config.heatmap_sufficient_statistics; queries that exceeded their deadline mark their organisations as
+        unavailable, other failed queries and results that cannot be stored, e.g. as they do not have the expected
+        shape, are left for the callback to report as failed
+
+        :param str job_key: hash identifier of the query
+        :param TaskHandle task_handle: handle of the finished query
+        :param list organisation_ids: organisations that were queried
+        """
+        if isinstance(task_handle.exception(), task_tracker.TaskDeadlineExceededError):
+            self._mark_unavailable([job_key], task_handle, organisation_ids)
+            return
 
-        if OrganisationHash in self._PlaceholderDataHeatMap:
-            columns_to_fetch = self._PlaceholderDataHeatMap[OrganisationHash]['columns']
-            roi_to_fetch = self._PlaceholderDataHeatMap[OrganisationHash]['ROI']
+        if task_handle.exception() is not None:
+            return
 
-            heatmap_data = self.PlaceholderDataFrameHeatMap[columns_to_fetch]
-            heatmap_data = heatmap_data[(self.PlaceholderDataFrameHeatMap['ROI'] == roi_to_fetch) &
-                                        (self.PlaceholderDataFrameHeatMap['OrganisationHash'] == OrganisationHash)]
-            heatmap_data = heatmap_data.drop(columns=['ROI', 'OrganisationHash'])
+        try:
+            if config.heatmap_sufficient_statistics:
+                heatmap_result = miscellaneous.pack_sufficient_statistics(task_handle.result())
+            else:
+                heatmap_result = miscellaneous.convert_correlation_matrix(task_handle.result())
 
-            return heatmap_data
+            # the result is stored before its job is removed, so that it is not queried again in between
+            self.HeatmapResults.put(job_key, heatmap_result)
+        except Exception as exception:
+            self._mark_failed([job_key], task_handle, exception)
+            return
 
-        else:
-            query_name = f'Heatmap for {self.Organisations_ids_to_query} with filter ROI'
+        with self._JobsLock:
+            self.Jobs.pop(job_key, None)
+            self.UnavailableJobs.pop(job_key, None)
 
-            # TODO use right task
-            self.Vantage6User.compute_hm_sparql(name=query_name,
-                                                expl_vars=expl_vars,
-                                                censor_col=censor_col,
-                                                roitype=roi_checklist,
-                                                organisation_ids=self.Organisations_ids_to_query,
-                                                save_results=False)
+        for organisation_id in organisation_ids:
+            self.Breaker.record_success(organisation_id)
 
-            query_result = self.Vantage6User.Results[query_name]
+    def _mark_failed(self, job_keys, task_handle, exception):
+        """
+        Register queries of which the result could not be stored, e.g. as it is malformed, by replacing their handle
+        with a failed one; the callback then reports them as failed, after which they can be submitted again
+
+        :param list job_keys: hash identifiers of the results that were queried
+        :param TaskHandle task_handle: handle of the query
+        :param Exception exception: the reason that the result could not be stored
+        """
+        print(f'Result of query {task_handle.Name} could not be stored: {exception!r}')
+        failed_handle = task_tracker.TaskTracker.fail(task_handle.Name, exception)
+
+        with self._JobsLock:
+            for job_key in job_keys:
+                if self.Jobs.get(job_key) is task_handle:
+                    self.Jobs[job_key] = failed_handle
+
+    def _mark_unavailable(self, job_keys, task_handle, organisation_ids):
+        """
+        Register queries that exceeded their deadline, so that their results fall back to the last stored results
+        rather than being queried again straight away, and count the failure towards the circuit breakers of the
+        organisations that were queried
+
+        :param list job_keys: hash identifiers of the results that were queried
+        :param TaskHandle task_handle: handle of the query
+        :param list organisation_ids: organisations that were queried
+        """
+        with self._JobsLock:
+            for job_key in job_keys:
+                if self.Jobs.get(job_key) is task_handle:
+                    self.Jobs.pop(job_key)
+                self.UnavailableJobs[job_key] = time.time()
 
-            # append the query result
-            self.PlaceholderDataFrameHeatMap, temp_dict = miscellaneous.convert_heatmap_to_appropriate_dataframe(
-                query_result,
-                self.Organisations_ids_to_query,
-                roi_checklist,
-                self.PlaceholderDataFrameHeatMap)
+        for organisation_id in organisation_ids:
+            self.Breaker.record_failure(organisation_id)
 
-            self._PlaceholderDataHeatMap.update(temp_dict)
+    def _collect_unavailable_job_keys(self, query_plan):
+        """
+        Determine the missing results of which the organisations are considered unavailable, as their query exceeded
+        its deadline less than a deadline ago or the circuit breaker of one of the organisations is open; these
+        results are not queried, and fall back to the last stored results. Results of organisations of which the
+        breaker is half-open are only unavailable once the probe has been claimed, see CircuitBreaker.allow;
+        the lock of the jobs must be held
+
+        :param QueryPlan query_plan: plan of the query
+        :return set: hash identifiers of the unavailable results
+        """
+        retry_before = time.time() - config.query_deadline
+        for job_key in [job_key for job_key, unavailable_since in self.UnavailableJobs.items()
+                        if unavailable_since <= retry_before]:
+            self.UnavailableJobs.pop(job_key)
+
+        unavailable_job_keys = set()
+        for (item, organisation_unit), job_key in query_plan.Keys.items():
+            if (item, organisation_unit) in query_plan.Results or job_key in self.Jobs:
+                continue
+
+            if job_key in self.UnavailableJobs or \
+                    any(self.Breaker.is_open(organisation_id) for organisation_id in organisation_unit):
+                unavailable_job_keys.add(job_key)
 
-            columns_to_fetch = self._PlaceholderDataHeatMap[OrganisationHash]['columns']
-            roi_to_fetch = self._PlaceholderDataHeatMap[OrganisationHash]['ROI']
+        return unavailable_job_keys
+
+    @staticmethod
+    def _build_heatmap_figure(heatmap_data):
+        """
+        Build the figure of a correlation matrix. Small matrices are annotated with their values; the variables of
+        larger matrices are ordered so that correlated variables are adjacent, and matrices with more variables than
+        config.heatmap_max_size are averaged into blocks, so that the browser does not have to draw every cell
+
+        :param pandas.DataFrame heatmap_data: the correlation matrix, with the variables as index and columns
+        :return: plotly.graph_objects.Figure of the heatmap
+        """
+        if len(heatmap_data.columns) <= config.heatmap_annotation_max_size:
+            return px.imshow(heatmap_data, y=heatmap_data.columns, text_auto=True, aspect="auto",
+                             title='Correlation Heatmap')
 
-            # collect the data that is to be queried
-            heatmap_data = self.PlaceholderDataFrameHeatMap[columns_to_fetch]
-            heatmap_data = heatmap_data[(self.PlaceholderDataFrameHeatMap['ROI'] == roi_to_fetch) &
-                                        (self.PlaceholderDataFrameHeatMap['OrganisationHash'] == OrganisationHash)]
-            heatmap_data = heatmap_data.drop(columns=['ROI', 'OrganisationHash'])
+        order = miscellaneous.order_correlation_matrix(heatmap_data.to_numpy())
+        matrix, labels = miscellaneous.downsample_matrix(heatmap_data.to_numpy()[np.ix_(order, order)],
+                                                         [heatmap_data.columns[i] for i in order],
+                                                         config.heatmap_max_size)
 
-        return heatmap_data
+        return px.imshow(pd.DataFrame(matrix, index=labels, columns=labels), zmin=-1, zmax=1, aspect="auto",
+                         title='Correlation Heatmap')
+
+    def _build_count_query_key(self, dataset_variable, organisation_ids):
+        """
+        Build the canonical key of the counts of a variable, as filtered by the dashboard;
+        variables without filters, such as the placeholder data, are keyed as in convert_count_dict_to_dataframe
+
+        :param str dataset_variable: predicate of the variable
+        :param list organisation_ids: organisations to query
+        :return: sha256 hash as string of the query
+        """
+        filters = {}
+        if dataset_variable in self.filter_dict:
+            filters = {dataset_variable: self.filter_dict[dataset_variable]}
+
+        return miscellaneous.build_query_key('count', predicate=dataset_variable, filters=filters,
+                                             organisation_ids=organisation_ids)
+
+    def _build_heatmap_query_key(self, roi_name, organisation_ids):
+        """
+        Build the canonical key of the sufficient statistics or correlation matrix of a heatmap, covering every
+        parameter of the heatmap task
+
+        :param str roi_name: ROI to compute the heatmap for
+        :param list organisation_ids: organisations to query
+        :return: sha256 hash as string of the query
+        """
+        return miscellaneous.build_query_key('heatmap_statistics', expl_vars=self.heatmap_variables,
+                                             censor_col=self.heatmap_censor_column, roitype=roi_name,
+                                             organisation_ids=organisation_ids,
+                                             sufficient_statistics=config.heatmap_sufficient_statistics)
+
+    @staticmethod
+    def _build_figure_key(query_key, chart_type, colour_scheme=None):
+        """
+        Build the key of a figure, covering the data it shows and the way it is drawn
+
+        :param str query_key: canonical key of the query of which the results are shown
+        :param str chart_type: type of chart, e.g. 'heatmap', or 'count-data' for the data that is drawn in the browser
+        :param list colour_scheme: colours of the chart, None if the colours are applied in the browser
+        :return: sha256 hash as string of the figure
+        """
+        # the colours are joined, as lists are ordered when building the key whilst the order of colours matters
+        return miscellaneous.build_query_key('figure', query_key=query_key, chart_type=chart_type,
+                                             colour_scheme=','.join(colour_scheme or []))
+
+    def _collect_job_status(self, job_key):
+        """
+        Retrieve the status of a query that is running in the background; failed queries are removed,
+        so that they are submitted again upon the next request
+
+        :param str job_key: hash identifier of the query
+        :return str: 'queued', 'running', 'unavailable' or 'failed'
+        """
+        with self._JobsLock:
+            task_handle = self.Jobs.get(job_key)
+
+            if task_handle is None:
+                return 'queued'
+
+            # queries that exceeded their deadline are registered as unavailable once their handle has finished
+            if task_handle.done() and isinstance(task_handle.exception(), task_tracker.TaskDeadlineExceededError):
+                return 'unavailable'
+
+            if task_handle.done() and task_handle.exception() is not None:
+                self.Jobs.pop(job_key)
+                return 'failed'
+
+            # successful queries remain running until their result has been stored
+            return 'queued' if task_handle.TaskId is None else 'running'
+
+    def _collect_job_statuses(self, job_keys, authenticated=True, unavailable_job_keys=None):
+        """
+        Retrieve the overall status of several queries that are running in the background
+
+        :param list job_keys: hash identifiers of the queries
+        :param bool authenticated: whether the user is logged in and queries have been submitted on their behalf
+        :param set unavailable_job_keys: hash identifiers of queries of which the organisations are unavailable
+        :return str: 'failed' if any query failed, otherwise 'running' if any query is running, otherwise 'queued'
+        if any query is queued, otherwise 'unavailable' if the organisations of the queries are unavailable;
+        'unauthenticated' if queries are missing that could not be submitted as the user is not logged in
+        """
+        if unavailable_job_keys is None:
+            unavailable_job_keys = set()
+
+        with self._JobsLock:
+            if authenticated is False and any(job_key not in self.Jobs for job_key in job_keys):
+                return 'unauthenticated'
+
+        job_statuses = {'unavailable' if job_key in unavailable_job_keys else self._collect_job_status(job_key)
+                        for job_key in job_keys}
+
+        for job_status in ['failed', 'running', 'queued']:
+            if job_status in job_statuses:
+                return job_status
+        return 'unavailable'
+
+    @staticmethod
+    def _render_job_status(job_status, progress=None):
+        """
+        Render a message describing the status of a query that is running in the background
+
+        :param str job_status: 'unauthenticated', 'queued', 'running', 'unavailable' or 'failed'
+        :param tuple progress: number of institutions that responded and were queried, if partial results are shown
+        :return: html.Div containing the message
+        """
+        messages = {'unauthenticated': 'Please log in on the top left to explore this variable',
+                    'queued': 'Your query has been queued and will be sent to the selected institutions shortly',
+                    'running': 'Waiting for the selected institutions to respond to your query',
+                    'unavailable': 'Not all selected institutions responded in time; these are unavailable for now and '
+                                   'their last known results are shown where available',
+                    'failed': 'The query could not be completed, please try again'}
+        message = messages[job_status]
+
+        if progress is not None:
+            message = f'Partial results of {progress[0]} out of {progress[1]} institutions are shown. {message}'
+        return html.Div(message, className='query-status')
+
+
+def create_server():
+    """
+    Create the dashboard and return its Flask server, e.g. to run it under a multi-threaded or multi-process WSGI
+    server such as: gunicorn --threads 8 'dash_v6:create_server()'
+
+    :return: flask.Flask server of the dashboard
+    """
+    return Dashboard().App.server
 
 
 if __name__ == '__main__':
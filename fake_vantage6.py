@@ -0,0 +1,310 @@
+import base64
+import collections
+import itertools
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from vantage6.client import AuthenticationException
+
+# private module
+import miscellaneous
+
+
+class FakeVantage6Server:
+    def __init__(self, latency=None, request_latency=None, count_categories=None, heatmap_rows=None,
+                 organisations=None, users=None, token_lifetime=None, organisation_latency=None, emit_events=True):
+        """
+        In-process stand-in for a Vantage6 server, implementing the part of the client API that the dashboard uses.
+        Tasks complete after a fixed latency and return generated results of a configurable size, so that the
+        dashboard can be run and benchmarked without access to the server in config.server_url.
+
+        :param float latency: number of seconds that a task takes to complete
+        :param float request_latency: number of seconds that every request to the server takes, i.e. the round trip
+        :param int count_categories: number of categories in the counts of every variable
+        :param int heatmap_rows: number of rows per organisation that the correlation heatmaps are computed from
+        :param dict organisations: organisation names by id, defaults to the organisations of the dashboard
+        :param dict users: passwords by username, None accepts any credentials
+        :param float token_lifetime: number of seconds that an access token remains valid
+        :param dict organisation_latency: number of seconds that tasks take per organisation id, e.g. to simulate
+        a slow node; a task takes as long as the slowest organisation it queries, others take the default latency
+        :param bool emit_events: notify the listeners of the task status events when a task completes; set to False
+        to simulate lost events, so that the status of tasks is only noticed by polling
+        """
+        if isinstance(latency, (int, float)) is False:
+            latency = 1.0
+
+        if isinstance(request_latency, (int, float)) is False:
+            request_latency = 0.0
+
+        if isinstance(count_categories, int) is False:
+            count_categories = 4
+
+        if isinstance(heatmap_rows, int) is False:
+            heatmap_rows = 100
+
+        if isinstance(organisations, dict) is False:
+            organisations = {2: 'HN1_Maastro', 3: 'Montreal', 4: 'Toronto', 5: 'HN3_Maastro'}
+
+        if isinstance(token_lifetime, (int, float)) is False:
+            token_lifetime = 15 * 60
+
+        if isinstance(organisation_latency, dict) is False:
+            organisation_latency = {}
+
+        self.Latency = latency
+        self.RequestLatency = request_latency
+        self.CountCategories = count_categories
+        self.HeatmapRows = heatmap_rows
+        self.Organisations = organisations
+        self.Users = users
+        self.TokenLifetime = token_lifetime
+        self.OrganisationLatency = organisation_latency
+        self.EmitEvents = emit_events
+
+        # number of requests per endpoint, e.g. to verify how often the server is polled
+        self.Requests = collections.Counter()
+        self.Tasks = {}
+        self.EventListeners = []
+
+        self._TaskIds = itertools.count(1)
+        self._Lock = threading.Lock()
+
+    def client(self, server_url=None, server_port=None, server_api=None, verbose=False):
+        """
+        Create a client of this server; has the signature of vantage6.client.Client, so that it can be passed as
+        client_factory to Vantage6Client
+
+        :return FakeClient: an unauthenticated client
+        """
+        return FakeClient(self)
+
+    def event_source(self, listener, client=None):
+        """
+        Subscribe a listener to the task status events of this server; has the signature of the event source
+        factory of Vantage6Client
+
+        :param TaskEventListener listener: listener to notify of status changes
+        :param FakeClient client: the client that subscribes, unused
+        """
+        with self._Lock:
+            self.EventListeners.append(listener)
+        listener.Connected = True
+
+    def request(self, endpoint):
+        """
+        Register a request to the server and simulate its round trip
+
+        :param str endpoint: name of the endpoint, e.g. 'task.get'
+        """
+        with self._Lock:
+            self.Requests[endpoint] += 1
+
+        if self.RequestLatency > 0:
+            time.sleep(self.RequestLatency)
+
+    def create_task(self, input_, organizations):
+        """
+        Register a task, of which the result is available once the latency of the server has passed
+
+        :param dict input_: input of the algorithm
+        :param list organizations: organisations that the task was sent to
+        :return dict: the task
+        """
+        with self._Lock:
+            task_id = next(self._TaskIds)
+            task = self.Tasks[task_id] = {'id': task_id, 'created': time.time(), 'input': input_,
+                                          'organizations': organizations}
+
+        if self.EmitEvents:
+            status_change = threading.Timer(self._get_latency(task), self._emit_status_change, (task_id, 'completed'))
+            status_change.daemon = True
+            status_change.start()
+
+        return {'id': task_id, 'complete': False}
+
+    def get_task(self, task_id):
+        """
+        Retrieve the state of a task
+
+        :param int task_id: id of the task
+        :return dict: the task, with 'complete' set once its latency has passed
+        """
+        with self._Lock:
+            task = self.Tasks[task_id]
+
+        if task.get('killed'):
+            return {'id': task_id, 'complete': False, 'status': 'killed'}
+
+        return {'id': task_id, 'complete': time.time() - task['created'] >= self._get_latency(task)}
+
+    def kill_task(self, task_id):
+        """
+        Kill a task, so that it never completes
+
+        :param int task_id: id of the task
+        """
+        with self._Lock:
+            self.Tasks[task_id]['killed'] = True
+
+        if self.EmitEvents:
+            self._emit_status_change(task_id, 'killed')
+
+    def list_results(self, task_id):
+        """
+        Retrieve the result of a task
+
+        :param int task_id: id of the task
+        :return dict: the result in the format of the Vantage6 server
+        """
+        with self._Lock:
+            task = self.Tasks[task_id]
+
+        return {'data': [{'task': {'id': task_id}, 'result': self.compute_result(task['input'])}]}
+
+    def compute_result(self, input_):
+        """
+        Generate the result of an algorithm; results are seeded by the input so that repeated tasks agree
+
+        :param dict input_: input of the algorithm
+        :return: counts per variable, (sufficient statistics of) a correlation matrix, or an empty dictionary
+        """
+        kwargs = input_.get('kwargs', {})
+        organisation_ids = kwargs.get('organization_ids') or list(self.Organisations)
+        random_generator = np.random.default_rng(
+            int(miscellaneous.build_query_key('fake_result', **kwargs)[:8], 16))
+
+        if 'predicates' in kwargs:
+            predicates = kwargs['predicates']
+            if isinstance(predicates, str):
+                predicates = [predicates]
+
+            # counts are summed over the organisations, as the real algorithm does
+            counts = {}
+            for predicate in predicates:
+                values = random_generator.integers(1, 100, (self.CountCategories, len(organisation_ids))).sum(axis=1)
+                counts[f'{predicate}_count'] = {f'C{category}': int(value) for category, value in enumerate(values)}
+            return counts
+
+        if 'expl_vars' in kwargs:
+            expl_vars = kwargs['expl_vars']
+            dataframe = pd.DataFrame(random_generator.random((self.HeatmapRows * len(organisation_ids),
+                                                              len(expl_vars))), columns=expl_vars)
+
+            if kwargs.get('output') == 'sufficient_statistics':
+                return miscellaneous.compute_sufficient_statistics(dataframe, expl_vars)
+            return dataframe.corr().to_dict()
+
+        return {}
+
+    def _get_latency(self, task):
+        """
+        Determine how long a task takes, i.e. as long as the slowest organisation that it queries
+
+        :param dict task: the task
+        :return float: number of seconds
+        """
+        organisation_ids = task['input'].get('kwargs', {}).get('organization_ids') or list(self.Organisations)
+        return max(self.OrganisationLatency.get(organisation_id, self.Latency) for organisation_id in organisation_ids)
+
+    def _emit_status_change(self, task_id, status):
+        """
+        Notify the listeners of a change of the status of a task
+
+        :param int task_id: id of the task
+        :param str status: new status of the task
+        """
+        with self._Lock:
+            listeners = list(self.EventListeners)
+
+            # killed tasks do not complete anymore
+            if status == 'completed' and self.Tasks[task_id].get('killed'):
+                return
+
+        for listener in listeners:
+            listener.handle_status_change({'task_id': task_id, 'job_id': task_id, 'status': status})
+
+
+class FakeClient:
+    def __init__(self, server):
+        """
+        Client of a FakeVantage6Server with the attributes of vantage6.client.Client that the dashboard uses
+
+        :param FakeVantage6Server server: the server to send requests to
+        """
+        self.Server = server
+        self.token = None
+
+        self.task = _FakeTaskEndpoint(server)
+        self.result = _FakeResultEndpoint(server)
+        self.organization = _FakeOrganizationEndpoint(server)
+
+    def authenticate(self, username, password):
+        """
+        Authenticate the client; raises vantage6.client.AuthenticationException for unknown credentials
+
+        :param str username: username of the user
+        :param str password: password of the user
+        """
+        self.Server.request('token.user')
+
+        if self.Server.Users is not None and self.Server.Users.get(username) != password:
+            raise AuthenticationException('Invalid credentials')
+
+        self.refresh_token()
+
+    def refresh_token(self):
+        """
+        Issue a new access token; the token is an unsigned JSON web token with an expiry claim
+        """
+        self.Server.request('token.refresh')
+
+        claims = json.dumps({'exp': time.time() + self.Server.TokenLifetime}).encode()
+        self.token = f"e30.{base64.urlsafe_b64encode(claims).decode().rstrip('=')}.fake"
+
+    def setup_encryption(self, organization_key):
+        """
+        Encryption is not simulated
+
+        :param str organization_key: the private key of the organisation, ignored
+        """
+        pass
+
+
+class _FakeTaskEndpoint:
+    def __init__(self, server):
+        self.Server = server
+
+    def create(self, input=None, organizations=None, **kwargs):
+        self.Server.request('task.create')
+        return self.Server.create_task(input, organizations)
+
+    def get(self, id_, include_results=False):
+        self.Server.request('task.get')
+        return self.Server.get_task(id_)
+
+    def kill(self, id_):
+        self.Server.request('task.kill')
+        return self.Server.kill_task(id_)
+
+
+class _FakeResultEndpoint:
+    def __init__(self, server):
+        self.Server = server
+
+    def list(self, task=None, **kwargs):
+        self.Server.request('result.list')
+        return self.Server.list_results(task)
+
+
+class _FakeOrganizationEndpoint:
+    def __init__(self, server):
+        self.Server = server
+
+    def list(self, **kwargs):
+        self.Server.request('organization.list')
+        return {'data': [{'id': organisation_id, 'name': organisation_name}
+                         for organisation_id, organisation_name in self.Server.Organisations.items()]}
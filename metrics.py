@@ -0,0 +1,249 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# upper bounds of the histogram buckets, the +Inf bucket is added when rendering
+duration_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+size_buckets = tuple(256 * 4 ** exponent for exponent in range(10))
+
+
+def format_labels(labels, extra_labels=None):
+    """
+    Format labels of a sample in the Prometheus text format
+
+    :param tuple labels: (name, value) pairs of the labels
+    :param tuple extra_labels: (name, value) pairs that are appended, e.g. the upper bound of a bucket
+    :return str: the formatted labels, or an empty string if there are none
+    """
+    labels = tuple(labels) + tuple(extra_labels or ())
+
+    if not labels:
+        return ''
+
+    escaped_labels = [f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+                      for name, value in labels]
+    return '{' + ','.join(escaped_labels) + '}'
+
+
+class Metric:
+    Type = 'untyped'
+
+    def __init__(self, name, description):
+        """
+        Thread-safe metric of which a value is kept per combination of labels
+
+        :param str name: name of the metric
+        :param str description: description of the metric, shown as help text
+        """
+        self.Name = name
+        self.Description = description
+
+        self._Values = {}
+        self._Lock = threading.Lock()
+
+    def render(self):
+        """
+        Render the metric in the Prometheus text format
+
+        :return list: lines of the metric
+        """
+        lines = [f'# HELP {self.Name} {self.Description}', f'# TYPE {self.Name} {self.Type}']
+
+        with self._Lock:
+            values = dict(self._Values)
+
+        for labels, value in sorted(values.items()):
+            lines.extend(self._render_samples(labels, value))
+        return lines
+
+    def _render_samples(self, labels, value):
+        return [f'{self.Name}{format_labels(labels)} {value}']
+
+    @staticmethod
+    def _label_key(labels):
+        return tuple(sorted((labels or {}).items()))
+
+
+class Counter(Metric):
+    Type = 'counter'
+
+    def increment(self, labels=None, value=1):
+        """
+        Increase the counter
+
+        :param dict labels: labels of the sample, e.g. {'store': 'counts'}
+        :param float value: amount to increase the counter with
+        """
+        label_key = self._label_key(labels)
+        with self._Lock:
+            self._Values[label_key] = self._Values.get(label_key, 0) + value
+
+
+class Gauge(Metric):
+    Type = 'gauge'
+
+    def __init__(self, name, description):
+        super().__init__(name, description)
+        self._Functions = {}
+
+    def increment(self, labels=None, value=1):
+        """
+        Increase the gauge
+
+        :param dict labels: labels of the sample
+        :param float value: amount to increase the gauge with
+        """
+        label_key = self._label_key(labels)
+        with self._Lock:
+            self._Values[label_key] = self._Values.get(label_key, 0) + value
+
+    def decrement(self, labels=None, value=1):
+        """
+        Decrease the gauge
+
+        :param dict labels: labels of the sample
+        :param float value: amount to decrease the gauge with
+        """
+        self.increment(labels, -value)
+
+    def set_function(self, function, labels=None):
+        """
+        Let the gauge be determined by a function whenever it is rendered
+
+        :param callable function: function without arguments that returns the value
+        :param dict labels: labels of the sample
+        """
+        with self._Lock:
+            self._Functions[self._label_key(labels)] = function
+
+    def render(self):
+        with self._Lock:
+            functions = dict(self._Functions)
+
+        for label_key, function in functions.items():
+            value = function()
+            with self._Lock:
+                self._Values[label_key] = value
+
+        return super().render()
+
+
+class Histogram(Metric):
+    Type = 'histogram'
+
+    def __init__(self, name, description, buckets=None):
+        """
+        Histogram of observed values, e.g. durations or sizes
+
+        :param str name: name of the metric
+        :param str description: description of the metric, shown as help text
+        :param tuple buckets: sorted upper bounds of the buckets, defaults to duration_buckets
+        """
+        super().__init__(name, description)
+
+        if buckets is None:
+            buckets = duration_buckets
+
+        self.Buckets = tuple(buckets)
+
+    def observe(self, value, labels=None):
+        """
+        Add an observation to the histogram
+
+        :param float value: the observed value
+        :param dict labels: labels of the sample
+        """
+        label_key = self._label_key(labels)
+        bucket_index = bisect.bisect_left(self.Buckets, value)
+
+        # values are replaced rather than updated, so that rendering can copy them without holding the lock
+        with self._Lock:
+            bucket_counts, total, count = self._Values.get(label_key, ((0,) * (len(self.Buckets) + 1), 0, 0))
+            bucket_counts = list(bucket_counts)
+            bucket_counts[bucket_index] += 1
+            self._Values[label_key] = (tuple(bucket_counts), total + value, count + 1)
+
+    @contextlib.contextmanager
+    def time(self, labels=None):
+        """
+        Observe the duration of a with-statement in seconds, also when it raises an exception
+
+        :param dict labels: labels of the sample, e.g. {'phase': 'task_create'}
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def _render_samples(self, labels, value):
+        bucket_counts, total, count = value
+
+        lines = []
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(self.Buckets + ('+Inf',), bucket_counts):
+            cumulative_count += bucket_count
+            lines.append(f'{self.Name}_bucket{format_labels(labels, (("le", upper_bound),))} {cumulative_count}')
+
+        lines.append(f'{self.Name}_sum{format_labels(labels)} {total}')
+        lines.append(f'{self.Name}_count{format_labels(labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Collection of the metrics of this process, rendered together on the /metrics route of the dashboard
+        """
+        self.Metrics = {}
+        self._Lock = threading.Lock()
+
+    def counter(self, name, description):
+        return self._register(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=None):
+        return self._register(Histogram(name, description, buckets))
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text format
+
+        :return str: the exposition of the metrics
+        """
+        with self._Lock:
+            metrics = list(self.Metrics.values())
+
+        return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+    def _register(self, metric):
+        with self._Lock:
+            if metric.Name in self.Metrics:
+                raise ValueError(f'Metric {metric.Name} has already been registered')
+            self.Metrics[metric.Name] = metric
+
+        return metric
+
+
+registry = MetricsRegistry()
+
+# metrics of the dashboard; phases are e.g. task_create, task_wait, result_list, convert_counts and figure_heatmap
+phase_duration = registry.histogram('dashboard_phase_duration_seconds',
+                                    'Duration of the phases of handling dashboard requests')
+cache_lookups = registry.counter('dashboard_cache_lookups_total',
+                                 'Lookups of query results per result store, by whether they were found in memory, '
+                                 'on disk, or not at all')
+payload_size = registry.histogram('vantage6_result_payload_bytes',
+                                  'Estimated in-memory size of the results that were retrieved from Vantage6',
+                                  size_buckets)
+count_entry_size = registry.histogram('dashboard_count_entry_bytes',
+                                     'Estimated memory that the counts of a single variable and organisation occupy '
+                                     'once converted', size_buckets)
+tasks_in_flight = registry.gauge('vantage6_tasks_in_flight', 'Vantage6 tasks that are being created or awaited')
+jobs_in_flight = registry.gauge('dashboard_jobs_in_flight',
+                                'Queries of the dashboard that are running in the background')
+open_circuits = registry.gauge('dashboard_open_circuits',
+                               'Organisations that are not queried, as their recent queries exceeded their deadline')
@@ -1,19 +1,28 @@
+import numpy as np
 import pandas as pd
 import hashlib
+import json
+import numbers
+import sys
 
 
 def convert_count_dict_to_dataframe(data_dict, filters, organisation_ids, existing_df=None):
     """
     Convert a dictionary of data into a Pandas DataFrame.
+    The DataFrame is built column by column in a single pass over the dictionary; the categories and hash identifiers
+    are categorical columns, so that every distinct label is held once and the rows only hold integer codes.
 
     :param dict data_dict: a dictionary where keys are category names, and values are dictionaries of categories and values.
-    :param dict filters: a dictionary of the filters that were applied on the specific query
+    :param dict filters: a dictionary of the filters that were applied on the specific query, keyed by predicate;
+    every count is identified by the filters of its own predicate only, so that the counts of a batched query
+    are identified in the same way as those of a query for a single predicate
     :param list organisation_ids: a list of organisations that the task was run on, this list is converted to a hash id.
     This is necessary to create a unique id for the specific combination of organisations that the result belongs to
     :param pandas.DataFrame existing_df: An existing DataFrame to which the generated DataFrame will be appended.
             Defaults to None.
 
-    :return pd.DataFrame: A DataFrame containing the converted data.
+    :return pd.DataFrame: A DataFrame containing the converted data, with categorical 'Categories' and
+    'HashIdentifier' columns.
 
     Example:
         existing_dataframe = pd.DataFrame()  # Initialise an existing DataFrame (or provide an existing one)
@@ -31,22 +40,32 @@ def convert_count_dict_to_dataframe(data_dict, filters, organisation_ids, existi
         result_dataframe = convert_dict_to_dataframe(sample_data, existing_dataframe)
         print(result_dataframe)
     """
-    # initialise an empty list to store DataFrames
-    dfs = []
+    # initialise the columns, the hash identifier is computed once per predicate rather than per row
+    hash_identifiers = []
+    number_of_categories = []
+    categories = []
+    values = []
 
-    # iterate through the dictionaries and convert them to DataFrames
+    # iterate through the dictionaries and append them to the columns
     for key, values_dict in data_dict.items():
-        df = pd.DataFrame({
-            "Categories": list(values_dict.keys()),
-            "Values": list(values_dict.values())
-        })
+        # create a hash of the organisation_ids, filters and the category name
+        predicate = key[:key.rfind('_count')]
+        predicate_filters = {}
+        if isinstance(filters, dict) and predicate in filters:
+            predicate_filters = {predicate: filters[predicate]}
+        hash_identifiers.append(build_query_key('count', predicate=predicate, filters=predicate_filters,
+                                                organisation_ids=organisation_ids))
 
-        # create a hash of the organisation_ids and the category name
-        df["HashIdentifier"] = hash_information(key[:key.rfind('_count')], filters, organisation_ids)
-        dfs.append(df)
+        number_of_categories.append(len(values_dict))
+        categories.extend(values_dict.keys())
+        values.extend(values_dict.values())
 
-    # concatenate all DataFrames into one
-    final_df = pd.concat(dfs, ignore_index=True)
+    final_df = pd.DataFrame({
+        "Categories": pd.Categorical(categories),
+        "Values": np.array(values) if values else np.array([], dtype=np.int64),
+        "HashIdentifier": pd.Categorical.from_codes(np.repeat(np.arange(len(hash_identifiers)), number_of_categories),
+                                                    categories=pd.Index(hash_identifiers))
+    })
 
     # if an existing DataFrame is provided, append the generated DataFrame to it
     if isinstance(existing_df, pd.DataFrame):
@@ -55,56 +74,265 @@ def convert_count_dict_to_dataframe(data_dict, filters, organisation_ids, existi
     return final_df
 
 
-def hash_information(*information_to_hash):
+def count_memory_per_entry(count_frame, key_column='HashIdentifier'):
     """
-    Turn the information of a query into a sha256 hash, such as variable name, filters, and organisations
-    Supports multiple types including integers, floats, strings, lists, and dictionaries
+    Report the memory that the counts of every query occupy in a DataFrame built by convert_count_dict_to_dataframe;
+    every row is charged for its codes and values, and every query once for each distinct label that it uses
 
-    :param any information_to_hash: information that is to be put in the hash
-    :return: sha256 hash as string of all the information that was provided to the function
+    :param pd.DataFrame count_frame: counts of one or more queries
+    :param str key_column: name of the column that holds the hash identifier of the queries
+    :return pd.Series: estimated size in bytes per hash identifier
     """
-    # create an empty string to add information to
-    hash_info = ""
+    key_codes = pd.Categorical(count_frame[key_column]).codes
+    row_bytes = 0.0
+    label_bytes = np.zeros(len(count_frame), dtype=np.int64)
 
-    # cycle through the information that is to be hashed
-    for info in information_to_hash:
-        if isinstance(info, (int, float)):
-            info = str(info)
-        # concatenate the information as strings
-        hash_info += str(info)
+    for column in count_frame.columns:
+        series = count_frame[column]
 
-    # generate a single hash for all information
-    hash_identifier = hashlib.sha256(hash_info.encode()).hexdigest()
-    return hash_identifier
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes = series.cat.codes.to_numpy()
+            row_bytes += codes.dtype.itemsize
 
+            # the labels are shared by the rows, so a query is charged for a label upon its first use only
+            label_sizes = np.array([sys.getsizeof(label) for label in series.cat.categories], dtype=np.int64)
+            first_use = ~pd.DataFrame({'key': key_codes, 'label': codes}).duplicated().to_numpy()
+            label_bytes += np.where(first_use, label_sizes[codes], 0)
+        else:
+            row_bytes += series.memory_usage(index=False, deep=True) / max(len(count_frame), 1)
 
-def convert_heatmap_to_appropriate_dataframe(output_dataframe, organisation_ids, roi_names, existing_df=None):
+    memory_per_entry = pd.Series(label_bytes + row_bytes).groupby(np.asarray(count_frame[key_column]),
+                                                                   sort=False).sum()
+    return memory_per_entry.round().astype(np.int64)
+
+
+def sum_count_frames(count_frames):
     """
+    Sum the counts of a single variable that were retrieved from different organisations; counts are additive,
+    so the counts of any selection of organisations are the sum of the counts of the individual organisations
 
-    :param roi_names:
-    :param TODO by varsha dict output_dataframe: A dictionary where keys are category names, and values are dictionaries of categories and values.
-    :param list organisation_ids: a list of organisations that the task was run on, this list is converted to a hash id.
-    This is necessary to create a unique id for the specific combination of organisations that the result belongs to
-    :param pandas.DataFrame existing_df: An existing DataFrame to which the generated DataFrame will be appended.
-            Defaults to None.
+    :param list count_frames: pandas.DataFrames with columns 'Categories' and 'Values', one per organisation
+    :return pd.DataFrame: A DataFrame with the summed values per category
+    """
+    if len(count_frames) == 1:
+        return count_frames[0][["Categories", "Values"]]
+
+    combined_df = pd.concat([df[["Categories", "Values"]] for df in count_frames], ignore_index=True)
+    return combined_df.groupby("Categories", as_index=False, sort=False, observed=True)["Values"].sum()
 
-    :return pd.DataFrame: A DataFrame containing the converted data.
+
+def compute_sufficient_statistics(dataframe, expl_vars):
     """
-    # create a hash of the organisation_ids
-    organisation_hash = hashlib.sha256((str(tuple(organisation_ids))+roi_names).encode()).hexdigest()
+    Compute the sufficient statistics of the correlation between variables for a single organisation.
+    This is a local stand-in for the output of the varshagouthamchand/v6_hm algorithm when it is asked for
+    sufficient statistics, e.g. to test the dashboard without a Vantage6 server.
 
-    # add extra columns for ROI filter and the organisation hash
-    output_dataframe["ROI"] = roi_names
-    output_dataframe["OrganisationHash"] = organisation_hash
+    :param pandas.DataFrame dataframe: data of the organisation, with a column per variable
+    :param list expl_vars: names of the variables to correlate
+    :return dict: the number of complete rows 'n', the per-variable 'sums', and the 'cross_products' of every pair
+    of variables, i.e. the sums of squares on the diagonal
 
-    placeholder_heatmap_dict = {organisation_hash: {}}
-    placeholder_heatmap_dict[organisation_hash]['columns'] = list(output_dataframe.columns)
-    placeholder_heatmap_dict[organisation_hash]['ROI'] = roi_names
+    Example:
+        {
+            "n": 3,
+            "sums": {"A": 6.0, "B": 3.0},
+            "cross_products": {"A": {"A": 14.0, "B": 7.0}, "B": {"A": 7.0, "B": 5.0}}
+        }
+    """
+    data = dataframe[list(expl_vars)].dropna().to_numpy(dtype=float)
+    sums = data.sum(axis=0)
+    cross_products = data.T @ data
 
-    # TODO add filter or something alike
+    return {'n': int(data.shape[0]),
+            'sums': {variable: float(sums[i]) for i, variable in enumerate(expl_vars)},
+            'cross_products': {variable: {other_variable: float(cross_products[i, j])
+                                          for j, other_variable in enumerate(expl_vars)}
+                               for i, variable in enumerate(expl_vars)}}
 
-    # if an existing DataFrame is provided, append the generated DataFrame to it
-    if isinstance(existing_df, pd.DataFrame):
-        output_dataframe = pd.concat([existing_df, output_dataframe], ignore_index=True)
 
-    return output_dataframe, placeholder_heatmap_dict
+def pack_sufficient_statistics(statistics):
+    """
+    Convert sufficient statistics as returned by the algorithm into NumPy arrays with a label index, which occupy
+    a fraction of the memory of the nested dictionaries when there are hundreds of variables.
+    The statistics are kept in double precision, as the covariance is their difference and float32 would lose
+    most of its significant digits; only the resulting correlation matrix is single precision.
+
+    :param dict statistics: sufficient statistics as described in compute_sufficient_statistics, or already packed
+    :return dict: 'labels' as tuple of variable names, 'n', and 'sums' and 'cross_products' as float64 arrays
+    """
+    if isinstance(statistics, dict) and 'labels' in statistics:
+        return statistics
+
+    if isinstance(statistics, dict) is False or not {'n', 'sums', 'cross_products'} <= set(statistics):
+        raise ValueError('The result does not contain sufficient statistics, i.e. n, sums, and cross_products')
+
+    labels = tuple(statistics['sums'].keys())
+    return {'labels': labels,
+            'n': int(statistics['n']),
+            'sums': np.array([statistics['sums'][variable] for variable in labels], dtype=np.float64),
+            'cross_products': np.array([[statistics['cross_products'][variable][other_variable]
+                                         for other_variable in labels] for variable in labels], dtype=np.float64)}
+
+
+def combine_sufficient_statistics(statistics):
+    """
+    Combine the sufficient statistics of several organisations into the Pearson correlation matrix of their pooled
+    data; the statistics are additive, so any selection of organisations can be combined without querying them again.
+    Only the variables that every organisation has statistics of are combined, so that no padding is required.
+
+    :param list statistics: sufficient statistics per organisation, as described in compute_sufficient_statistics
+    or pack_sufficient_statistics
+    :return pd.DataFrame: the float32 correlation matrix, with the variables as index and columns
+    """
+    statistics = [pack_sufficient_statistics(organisation_statistics) for organisation_statistics in statistics]
+
+    # the variables that all organisations share, in the order of the first organisation
+    shared_labels = set(statistics[0]['labels']).intersection(*[organisation_statistics['labels']
+                                                                for organisation_statistics in statistics[1:]])
+    expl_vars = [variable for variable in statistics[0]['labels'] if variable in shared_labels]
+
+    n = sum(organisation_statistics['n'] for organisation_statistics in statistics)
+    sums = np.zeros(len(expl_vars))
+    cross_products = np.zeros((len(expl_vars), len(expl_vars)))
+
+    for organisation_statistics in statistics:
+        label_index = {variable: i for i, variable in enumerate(organisation_statistics['labels'])}
+        positions = [label_index[variable] for variable in expl_vars]
+
+        sums += organisation_statistics['sums'][positions]
+        cross_products += organisation_statistics['cross_products'][np.ix_(positions, positions)]
+
+    # covariance of the pooled data; the normalisation cancels out in the correlation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = cross_products - np.outer(sums, sums) / n
+        standard_deviation = np.sqrt(np.diag(covariance))
+        correlation = covariance / np.outer(standard_deviation, standard_deviation)
+
+    return pd.DataFrame(correlation.astype(np.float32), index=expl_vars, columns=expl_vars)
+
+
+def convert_correlation_matrix(correlation):
+    """
+    Convert a correlation matrix as returned by the algorithm into a float32 DataFrame
+
+    :param dict correlation: correlation per pair of variables, as returned by pandas.DataFrame.corr().to_dict()
+    :return pd.DataFrame: the correlation matrix, with the variables as index and columns in the same order
+    """
+    if isinstance(correlation, dict) is False or \
+            any(isinstance(correlations, dict) is False for correlations in correlation.values()):
+        raise ValueError('The result is not a correlation matrix, i.e. a correlation per pair of variables')
+
+    correlation = pd.DataFrame(correlation)
+    if set(correlation.index) != set(correlation.columns):
+        raise ValueError('The result is not a correlation matrix, as its rows and columns differ')
+
+    return correlation.loc[correlation.columns, correlation.columns].astype(np.float32)
+
+
+def select_correlation_matrix(correlations):
+    """
+    Select the correlation matrix of a selection of organisations; unlike sufficient statistics, the correlation
+    matrices of several organisations cannot be combined
+
+    :param list correlations: correlation matrices as returned by convert_correlation_matrix
+    :return pd.DataFrame: the single correlation matrix
+    """
+    if len(correlations) != 1:
+        raise ValueError('Correlation matrices of separate selections of organisations cannot be combined')
+
+    return correlations[0]
+
+
+def order_correlation_matrix(correlation):
+    """
+    Order the variables of a correlation matrix such that correlated variables are adjacent, using the angles of
+    the first two eigenvectors (angular order of eigenvectors); this requires a single eigendecomposition
+
+    :param numpy.ndarray correlation: square correlation matrix, undefined correlations (NaN) are treated as 0
+    :return numpy.ndarray: positions of the variables in their new order
+    """
+    correlation = np.nan_to_num(np.asarray(correlation, dtype=np.float64))
+
+    if correlation.shape[0] < 3:
+        return np.arange(correlation.shape[0])
+
+    # eigh returns the eigenvalues in ascending order, so the last two eigenvectors are the first two
+    eigenvectors = np.linalg.eigh(correlation)[1]
+    angles = np.arctan2(eigenvectors[:, -2], eigenvectors[:, -1])
+    return np.argsort(np.where(angles < 0, angles + 2 * np.pi, angles), kind='stable')
+
+
+def downsample_matrix(matrix, labels, max_size):
+    """
+    Reduce a square matrix to at most max_size rows and columns by averaging contiguous blocks of variables,
+    so that large matrices can be drawn without sending every cell to the browser
+
+    :param numpy.ndarray matrix: square matrix, e.g. an ordered correlation matrix
+    :param list labels: names of the rows and columns
+    :param int max_size: maximum number of rows and columns of the result
+    :return: the averaged float32 matrix and the labels of the blocks, named after their first variable
+    """
+    if len(labels) <= max_size:
+        return np.asarray(matrix, dtype=np.float32), list(labels)
+
+    blocks = np.array_split(np.arange(len(labels)), max_size)
+    block_starts = np.array([block[0] for block in blocks])
+
+    # average the blocks of rows followed by the blocks of columns, ignoring undefined correlations
+    with np.errstate(invalid='ignore'):
+        block_sums = np.add.reduceat(np.add.reduceat(np.nan_to_num(matrix), block_starts, axis=0), block_starts,
+                                     axis=1)
+        defined = np.add.reduceat(np.add.reduceat((~np.isnan(matrix)).astype(np.float64), block_starts, axis=0),
+                                  block_starts, axis=1)
+        averages = block_sums / defined
+
+    block_labels = [f'{labels[block[0]]} (+{len(block) - 1})' if len(block) > 1 else labels[block[0]]
+                    for block in blocks]
+    return averages.astype(np.float32), block_labels
+
+
+def build_query_key(query_type, **parameters):
+    """
+    Turn all parameters of a query into a canonical sha256 hash, so that equivalent queries share the same key.
+    Dictionaries are ordered by key, whereas lists, tuples and sets are treated as sets, so that e.g. the order in
+    which organisations were selected or the order of filter values does not result in a different key.
+
+    Example:
+        build_query_key('count', predicate='roo:P100018', filters={'roo:P100018': ['C20197', 'C16576']},
+                        organisation_ids=[3, 2])
+        == build_query_key('count', organisation_ids=[2, 3], predicate='roo:P100018',
+                           filters={'roo:P100018': ['C16576', 'C20197']})
+
+    :param str query_type: type of the query, e.g. 'count' or 'heatmap', so that different queries never collide
+    :param any parameters: every parameter that determines the result of the query
+    :return: sha256 hash as string of the canonical form of the query
+    """
+    canonical_query = json.dumps({'query_type': query_type, 'parameters': _normalise_query_parameter(parameters)},
+                                 sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical_query.encode()).hexdigest()
+
+
+def _normalise_query_parameter(parameter):
+    """
+    Convert a query parameter into a canonical form that can be serialised as JSON
+
+    :param any parameter: parameter of the query
+    :return: the canonical form of the parameter
+    """
+    if isinstance(parameter, dict):
+        return {str(key): _normalise_query_parameter(value) for key, value in parameter.items()}
+
+    if isinstance(parameter, (list, tuple, set, frozenset)):
+        normalised_values = {json.dumps(_normalise_query_parameter(value), sort_keys=True)
+                             for value in parameter}
+        return [json.loads(value) for value in sorted(normalised_values)]
+
+    # numpy scalars and alike are not JSON serialisable
+    if isinstance(parameter, bool) or parameter is None:
+        return parameter
+    if isinstance(parameter, numbers.Integral):
+        return int(parameter)
+    if isinstance(parameter, numbers.Real):
+        return float(parameter)
+
+    return str(parameter)
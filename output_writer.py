@@ -0,0 +1,178 @@
+import concurrent.futures
+import gzip
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    # optional dependency; without it tabular outputs are written as compressed JSON as well
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+_Writers = {}
+_WritersLock = threading.Lock()
+
+
+def get_output_writer(directory):
+    """
+    Retrieve the writer that is shared by all clients that write to a directory, or create it if there is none yet,
+    so that every login does not start a thread of its own and the outputs of a query are written in order
+
+    :param str directory: directory to write the outputs to
+    :return OutputWriter: the shared writer
+    """
+    with _WritersLock:
+        writer = _Writers.get(os.path.realpath(directory))
+
+        if writer is None:
+            writer = _Writers[os.path.realpath(directory)] = OutputWriter(directory)
+
+    return writer
+
+
+def convert_to_json(value):
+    """
+    Convert values that the json module cannot serialise, used as its default function
+
+    :param any value: value to convert, e.g. a pandas.DataFrame or NumPy array
+    :return: a JSON serialisable representation of the value
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.to_dict(orient='split')
+    if isinstance(value, pd.Series):
+        return value.to_dict()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, tuple)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serialisable')
+
+
+def read_output(filepath, memory_map=True):
+    """
+    Read an output that was written by OutputWriter
+
+    :param str filepath: path of the output
+    :param bool memory_map: memory-map NumPy arrays and Parquet files, so that only the parts that are accessed
+    are read from disk
+    :return: the output, i.e. a pandas.DataFrame, NumPy array, or the deserialised JSON
+    """
+    if filepath.endswith('.parquet'):
+        return pd.read_parquet(filepath, memory_map=memory_map)
+
+    if filepath.endswith('.npy'):
+        return np.load(filepath, mmap_mode='r' if memory_map else None)
+
+    with gzip.open(filepath, 'rt', encoding='utf-8') as file:
+        return json.load(file)
+
+
+class LazyOutput:
+    def __init__(self, filepath, memory_map=True):
+        """
+        Output on disk that is only read when it is first used
+
+        :param str filepath: path of the output
+        :param bool memory_map: memory-map NumPy arrays and Parquet files, see read_output
+        """
+        self.Filepath = filepath
+        self.MemoryMap = memory_map
+
+        self._Value = None
+        self._Loaded = False
+
+    def load(self):
+        """
+        Read the output, or return it if it has been read before
+
+        :return: the output
+        """
+        if self._Loaded is False:
+            self._Value = read_output(self.Filepath, self.MemoryMap)
+            self._Loaded = True
+
+        return self._Value
+
+
+class OutputWriter:
+    def __init__(self, directory):
+        """
+        Write the outputs of tasks to disk on a background thread, so that neither serialising nor compressing
+        the outputs delays the threads that handle requests or follow tasks.
+        Tabular outputs are written as Parquet if pyarrow is available, NumPy arrays as .npy files, and any other
+        output as gzip-compressed JSON; files are named by the query key of the output.
+
+        :param str directory: directory to write the outputs to
+        """
+        self.Directory = directory
+
+        # a single thread writes the outputs in order, so that a later output of a query replaces an earlier one
+        self.Executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='output-writer')
+
+    def write(self, query_key, output):
+        """
+        Schedule an output to be written
+
+        :param str query_key: canonical key of the query of which the output is written
+        :param any output: output of the task
+        :return concurrent.futures.Future: future that resolves to the path of the written file
+        """
+        return self.Executor.submit(self._write, query_key, output)
+
+    def find(self, query_key):
+        """
+        Find the output of a query on disk
+
+        :param str query_key: canonical key of the query
+        :return LazyOutput: the output, that is read upon use, or None if there is no output of the query
+        """
+        for extension in ['.parquet', '.npy', '.json.gz']:
+            filepath = os.path.join(self.Directory, f'{query_key}{extension}')
+            if os.path.exists(filepath):
+                return LazyOutput(filepath)
+
+        return None
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting outputs
+
+        :param bool wait: wait until the scheduled outputs have been written
+        """
+        self.Executor.shutdown(wait=wait)
+
+    def _write(self, query_key, output):
+        """
+        Write an output to a temporary file and move it in place, so that readers never see a partial file
+
+        :param str query_key: canonical key of the query of which the output is written
+        :param any output: output of the task
+        :return str: path of the written file
+        """
+        if isinstance(output, pd.DataFrame) and pyarrow is not None:
+            extension = '.parquet'
+        elif isinstance(output, np.ndarray) and output.dtype != object:
+            extension = '.npy'
+        else:
+            extension = '.json.gz'
+
+        filepath = os.path.join(self.Directory, f'{query_key}{extension}')
+        temporary_filepath = f'{filepath}.tmp'
+
+        if extension == '.parquet':
+            output.to_parquet(temporary_filepath)
+        elif extension == '.npy':
+            with open(temporary_filepath, 'wb') as file:
+                np.save(file, output)
+        else:
+            with gzip.open(temporary_filepath, 'wt', encoding='utf-8', compresslevel=6) as file:
+                json.dump(output, file, separators=(',', ':'), default=convert_to_json)
+
+        os.replace(temporary_filepath, filepath)
+        return filepath
@@ -0,0 +1,147 @@
+import pickle
+import sqlite3
+import threading
+import time
+
+
+class PersistentCache:
+    def __init__(self, path, ttl=None, max_bytes=None, stale_ttl=None):
+        """
+        Store results of queries on disk in an SQLite database, so that they survive a restart of the dashboard.
+        Entries expire after their time to live, and the least recently used entries are evicted
+        once the total size of the cache exceeds max_bytes.
+
+        :param str path: path of the SQLite database file
+        :param float ttl: default number of seconds that an entry remains valid, None keeps entries indefinitely
+        :param int max_bytes: maximum total size of the stored entries, None does not limit the size
+        :param float stale_ttl: number of seconds that expired entries are kept, so that they can be fallen back on
+        when a query cannot be answered, see get; None removes entries as soon as they expire
+        """
+        if isinstance(stale_ttl, (int, float)) is False:
+            stale_ttl = 0
+
+        self.Path = path
+        self.TTL = ttl
+        self.MaxBytes = max_bytes
+        self.StaleTTL = stale_ttl
+
+        self._Lock = threading.Lock()
+        self._Connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._Connection.execute('PRAGMA journal_mode=WAL')
+        self._Connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                                 'key TEXT PRIMARY KEY, '
+                                 'payload BLOB NOT NULL, '
+                                 'size INTEGER NOT NULL, '
+                                 'created REAL NOT NULL, '
+                                 'expires REAL, '
+                                 'accessed REAL NOT NULL)')
+        self._Connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    def get(self, key, default=None, stale=False, with_expiry=False):
+        """
+        Retrieve an entry from the cache; expired entries are not returned, and removed once they are older than
+        the stale time to live
+
+        :param str key: hash identifier of the query
+        :param any default: value to return if the entry is not available
+        :param bool stale: return entries that have expired but are still kept, e.g. to fall back on
+        :param bool with_expiry: also return when the entry expires, as seconds since the epoch or None if it does not
+        :return: the stored result or the default, and when it expires if with_expiry is set
+        """
+        now = time.time()
+        with self._Lock:
+            row = self._Connection.execute('SELECT payload, expires FROM entries WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                return (default, None) if with_expiry else default
+
+            if row[1] is not None and row[1] + self.StaleTTL <= now:
+                self._Connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return (default, None) if with_expiry else default
+
+            if row[1] is not None and row[1] <= now and stale is False:
+                return (default, None) if with_expiry else default
+
+            self._Connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+
+        try:
+            value = pickle.loads(row[0])
+        except Exception as exception:
+            # entries that cannot be unpickled, e.g. as they are corrupt or of a class that changed, are treated as
+            # missing; the entry is only removed if it has not been replaced in the meantime
+            print(f'Cached result {key} could not be loaded and is removed: {exception}')
+            with self._Lock:
+                self._Connection.execute('DELETE FROM entries WHERE key = ? AND payload = ?', (key, row[0]))
+            return (default, None) if with_expiry else default
+
+        if with_expiry:
+            return value, row[1]
+        return value
+
+    def put(self, key, value, ttl=None):
+        """
+        Store an entry in the cache and evict entries if the cache has grown beyond its maximum size
+
+        :param str key: hash identifier of the query
+        :param any value: result of the query, must be picklable
+        :param float ttl: number of seconds that the entry remains valid, None uses the default of the cache
+        """
+        if ttl is None:
+            ttl = self.TTL
+
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+
+        with self._Lock:
+            self._Connection.execute('INSERT OR REPLACE INTO entries (key, payload, size, created, expires, accessed) '
+                                     'VALUES (?, ?, ?, ?, ?, ?)', (key, payload, len(payload), now, expires, now))
+            self._evict(now)
+
+    def pop(self, key):
+        """
+        Remove an entry from the cache
+
+        :param str key: hash identifier of the query
+        """
+        with self._Lock:
+            self._Connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def size(self):
+        """
+        Retrieve the total size of all entries in the cache
+
+        :return int: size in bytes
+        """
+        with self._Lock:
+            return self._Connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def close(self):
+        """
+        Close the connection to the database, e.g. before the database file is removed
+        """
+        with self._Lock:
+            self._Connection.close()
+
+    def _evict(self, now):
+        """
+        Remove entries that expired longer than the stale time to live ago, followed by the least recently used
+        entries until the cache fits its maximum size
+
+        :param float now: current time as seconds since the epoch
+        """
+        self._Connection.execute('DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?',
+                                 (now - self.StaleTTL,))
+
+        if self.MaxBytes is None:
+            return
+
+        total_size = self._Connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total_size <= self.MaxBytes:
+            return
+
+        for key, size in self._Connection.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall():
+            if total_size <= self.MaxBytes:
+                break
+            self._Connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+            total_size -= size
@@ -0,0 +1,140 @@
+def split_organisations(organisation_ids, individually=True):
+    """
+    Split a selection of organisations into the organisations that are queried and cached individually.
+    An empty selection is kept as a single unit, as it is not composed of individual organisations.
+
+    :param list organisation_ids: organisations that the user has selected
+    :param bool individually: split the selection into single organisations, otherwise keep it as a single unit
+    :return list: tuples of organisation ids, each representing a single query
+    """
+    unique_organisation_ids = sorted(set(organisation_ids), key=str)
+
+    if unique_organisation_ids and individually:
+        return [(organisation_id,) for organisation_id in unique_organisation_ids]
+    return [tuple(unique_organisation_ids)]
+
+
+class QueryPlan:
+    def __init__(self, items, units, keys, results, missing):
+        """
+        Outcome of planning a query for a selection of organisations
+
+        :param list items: the items that were requested, e.g. variables or ROIs
+        :param list units: tuples of organisation ids that are queried individually
+        :param dict keys: hash identifier per (item, unit)
+        :param dict results: stored result per (item, unit), only for the results that are available
+        :param dict missing: per unit the items of which the result is not available
+        """
+        self.Items = items
+        self.Units = units
+        self.Keys = keys
+        self.Results = results
+        self.Missing = missing
+        # (item, unit) of which an expired result was fallen back on, see QueryPlanner.fall_back
+        self.Stale = set()
+
+    def missing_keys(self, item):
+        """
+        Retrieve the hash identifiers of the results of an item that are not available, or only as a fallback
+
+        :param any item: the requested item
+        :return list: hash identifiers
+        """
+        return [self.Keys[(item, unit)] for unit in self.Units
+                if (item, unit) not in self.Results or (item, unit) in self.Stale]
+
+    def progress(self, item):
+        """
+        Retrieve how many of the units of an item have their results available, not counting fallbacks
+
+        :param any item: the requested item
+        :return tuple: number of units of which the results are available, and the total number of units
+        """
+        return len([unit for unit in self.Units if (item, unit) in self.Results and (item, unit) not in self.Stale]), \
+            len(self.Units)
+
+
+class QueryPlanner:
+    def __init__(self, result_store, build_key, combine, split=True):
+        """
+        Plan queries of additive results, such as counts, per organisation. Any selection of organisations is
+        assembled locally from the results of the individual organisations, so that only the organisations of which
+        the results are missing have to be queried.
+
+        :param ResultStore result_store: store that holds the results per organisation
+        :param callable build_key: function of an item and a list of organisation ids that returns the hash identifier
+        :param callable combine: function that combines a list of results of individual organisations into one
+        :param bool split: query organisations individually; set to False for results that are not additive,
+        which are then queried and stored per selection of organisations
+        """
+        self.ResultStore = result_store
+        self.BuildKey = build_key
+        self.Combine = combine
+        self.Split = split
+
+    def plan(self, items, organisation_ids):
+        """
+        Determine which results are available and which have to be queried
+
+        :param list items: the requested items, e.g. variables or ROIs
+        :param list organisation_ids: organisations that the user has selected
+        :return QueryPlan: the available and missing results
+        """
+        units = split_organisations(organisation_ids, self.Split)
+        keys = self.keys(items, organisation_ids)
+        results = {}
+        missing = {}
+
+        for (item, unit), key in keys.items():
+            result = self.ResultStore.get(key)
+
+            if result is None:
+                missing.setdefault(unit, []).append(item)
+            else:
+                results[(item, unit)] = result
+
+        return QueryPlan(list(items), units, keys, results, missing)
+
+    def keys(self, items, organisation_ids):
+        """
+        Determine the hash identifiers of the results of the individual organisations that make up a query
+
+        :param list items: the requested items, e.g. variables or ROIs
+        :param list organisation_ids: organisations that the user has selected
+        :return dict: hash identifier per (item, unit), where a unit is a tuple of organisation ids
+        """
+        return {(item, unit): self.BuildKey(item, list(unit))
+                for item in items for unit in split_organisations(organisation_ids, self.Split)}
+
+    def fall_back(self, plan, keys):
+        """
+        Fill in the last stored results of queries that cannot be answered, e.g. as their organisation does not
+        respond; such results may have expired, see ResultStore.get_stale
+
+        :param QueryPlan plan: plan of the query
+        :param set keys: hash identifiers of the results to fall back on
+        """
+        for (item, unit), key in plan.Keys.items():
+            if key not in keys or (item, unit) in plan.Results:
+                continue
+
+            result = self.ResultStore.get_stale(key)
+            if result is not None:
+                plan.Results[(item, unit)] = result
+                plan.Stale.add((item, unit))
+
+    def assemble(self, plan, item, partial=False):
+        """
+        Combine the results of the individual organisations into the result for the selection of organisations
+
+        :param QueryPlan plan: plan of the query
+        :param any item: the requested item
+        :param bool partial: combine the results that are available, even if some organisations have not responded
+        :return: the combined result, or None if not all organisations' results are available;
+        when partial, None is only returned if none of the organisations' results are available
+        """
+        results = [plan.Results[(item, unit)] for unit in plan.Units if (item, unit) in plan.Results]
+
+        if not results or (len(results) < len(plan.Units) and partial is False):
+            return None
+        return self.Combine(results)
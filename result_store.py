@@ -0,0 +1,242 @@
+import collections
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# private module
+import metrics
+
+
+def estimate_size(result):
+    """
+    Estimate the memory that a query result occupies
+
+    :param any result: result of a query, e.g. a pandas.DataFrame
+    :return int: estimated size in bytes
+    """
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, pd.Series):
+        return int(result.memory_usage(deep=True))
+    if isinstance(result, np.ndarray):
+        return int(result.nbytes)
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(estimate_size(key) + estimate_size(value)
+                                           for key, value in result.items())
+    if isinstance(result, (list, tuple)):
+        return sys.getsizeof(result) + sum(estimate_size(value) for value in result)
+    return sys.getsizeof(result)
+
+
+class ResultStore:
+    def __init__(self, backing=None, ttl=None, max_bytes=None, name=None):
+        """
+        Thread-safe store of query results keyed by the hash identifier of the query.
+        Looking up and inserting a result are dictionary operations, regardless of how many results have been stored.
+        Once the results occupy more than max_bytes, the least recently used results are evicted from memory.
+
+        :param PersistentCache backing: optional on-disk cache that results are written to, and that is consulted
+        when a result is not in memory; this way results are loaded lazily after a restart or eviction
+        :param float ttl: number of seconds that a persisted result remains valid, None keeps results indefinitely
+        :param int max_bytes: memory budget of the store in bytes, None does not limit the memory use
+        :param str name: name of the store in the metrics of the cache lookups
+        """
+        if isinstance(name, str) is False:
+            name = 'results'
+
+        self.Name = name
+        self.Backing = backing
+        self.TTL = ttl
+        self.MaxBytes = max_bytes
+        self.Size = 0
+
+        # evictable results are ordered from least to most recently used, pinned results are never evicted
+        self._Results = collections.OrderedDict()
+        self._Pinned = {}
+        self._Sizes = {}
+        self._Expiry = {}
+        self._Lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Retrieve the result of a query
+
+        :param str key: hash identifier of the query
+        :param any default: value to return if the result is not available
+        :return: the stored result or the default
+        """
+        with self._Lock:
+            if self._Expiry.get(key, float('inf')) <= time.time():
+                self._remove(key)
+
+            result = self._Pinned.get(key)
+            if result is None:
+                result = self._Results.get(key)
+                if result is not None:
+                    self._Results.move_to_end(key)
+
+        if result is not None:
+            metrics.cache_lookups.increment({'store': self.Name, 'result': 'memory'})
+            return result
+
+        if self.Backing is not None:
+            # the result expires from memory when it expires on disk, rather than a full time to live from now
+            result, expires = self.Backing.get(key, with_expiry=True)
+            if result is not None:
+                with self._Lock:
+                    self._insert(key, result, True, expires)
+
+        metrics.cache_lookups.increment({'store': self.Name, 'result': 'miss' if result is None else 'disk'})
+        return default if result is None else result
+
+    def get_stale(self, key, default=None):
+        """
+        Retrieve the result of a query even if it has expired, to fall back on when the query cannot be answered;
+        expired results are only kept by the backing cache, see PersistentCache
+
+        :param str key: hash identifier of the query
+        :param any default: value to return if no result has been kept
+        :return: the stored result or the default
+        """
+        result = self.get(key)
+
+        if result is None and self.Backing is not None:
+            result = self.Backing.get(key, stale=True)
+
+            if result is not None:
+                metrics.cache_lookups.increment({'store': self.Name, 'result': 'stale'})
+
+        return default if result is None else result
+
+    def put(self, key, result, persist=True):
+        """
+        Store the result of a query, replacing any result that was stored for the same query
+
+        :param str key: hash identifier of the query
+        :param any result: result of the query, e.g. a pandas.DataFrame
+        :param bool persist: write the result to the backing cache and let it expire after the time to live;
+        set to False for placeholder data that should remain available for as long as the process runs,
+        such results are never evicted
+        """
+        with self._Lock:
+            self._insert(key, result, persist)
+
+        if persist and self.Backing is not None:
+            self.Backing.put(key, result, self.TTL)
+
+    def put_frame(self, dataframe, key_column, persist=True):
+        """
+        Split a pandas.DataFrame that holds the results of multiple queries and store every query separately
+
+        :param pandas.DataFrame dataframe: results of the queries
+        :param str key_column: name of the column that holds the hash identifier of the queries
+        :param bool persist: write the results to the backing cache and let them expire after the time to live
+        """
+        for key, result in dataframe.groupby(key_column, sort=False, observed=True):
+            result = result.reset_index(drop=True)
+
+            # categorical columns would otherwise keep the labels of all queries, in memory and when persisted
+            for column in result.columns:
+                if isinstance(result[column].dtype, pd.CategoricalDtype):
+                    result[column] = result[column].cat.remove_unused_categories()
+
+            self.put(key, result, persist)
+
+    def pop(self, key, default=None):
+        """
+        Remove the result of a query from the store
+
+        :param str key: hash identifier of the query
+        :param any default: value to return if the result is not available
+        :return: the removed result or the default
+        """
+        if self.Backing is not None:
+            self.Backing.pop(key)
+
+        with self._Lock:
+            result = self._remove(key)
+
+        return default if result is None else result
+
+    def holds(self, key):
+        """
+        Check whether the result of a query is held in memory and has not expired, without consulting the backing
+        cache, so that it is cheap enough to check whilst holding other locks
+
+        :param str key: hash identifier of the query
+        :return bool: True if the result is held in memory
+        """
+        with self._Lock:
+            return key in self._Pinned or (key in self._Results and
+                                           self._Expiry.get(key, float('inf')) > time.time())
+
+    def keys(self):
+        """
+        Retrieve the hash identifiers of all queries that are held in memory
+
+        :return list: hash identifiers
+        """
+        with self._Lock:
+            return list(self._Pinned.keys()) + list(self._Results.keys())
+
+    def memory_usage(self):
+        """
+        Retrieve the memory that the results held in memory occupy, per query
+
+        :return dict: estimated size in bytes per hash identifier
+        """
+        with self._Lock:
+            return dict(self._Sizes)
+
+    def _insert(self, key, result, persist, expires=None):
+        """
+        Insert a result as the most recently used one and evict results that do not fit the memory budget;
+        the lock of the store must be held
+
+        :param str key: hash identifier of the query
+        :param any result: result of the query
+        :param bool persist: let the result expire after the time to live, rather than pinning it in memory
+        :param float expires: time at which the result expires as seconds since the epoch, e.g. as stored on disk;
+        None lets the result expire after the time to live from now
+        """
+        self._remove(key)
+
+        size = estimate_size(result)
+        self._Sizes[key] = size
+        self.Size += size
+
+        if persist is False:
+            self._Pinned[key] = result
+            return
+
+        self._Results[key] = result
+        if expires is not None:
+            self._Expiry[key] = expires
+        elif self.TTL is not None:
+            self._Expiry[key] = time.time() + self.TTL
+
+        # evict the least recently used results, but keep the result that was just inserted
+        while self.MaxBytes is not None and self.Size > self.MaxBytes and len(self._Results) > 1:
+            self._remove(next(iter(self._Results)))
+
+    def _remove(self, key):
+        """
+        Remove a result from memory; the lock of the store must be held
+
+        :param str key: hash identifier of the query
+        :return: the removed result or None
+        """
+        self.Size -= self._Sizes.pop(key, 0)
+        self._Expiry.pop(key, None)
+        result = self._Pinned.pop(key, None)
+        return self._Results.pop(key, result)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._Lock:
+            return len(self._Pinned) + len(self._Results)
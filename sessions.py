@@ -0,0 +1,145 @@
+import threading
+import time
+import uuid
+
+
+class DashboardSession:
+    def __init__(self, vantage6_user, organisations):
+        """
+        State of a single user of the dashboard
+
+        :param Vantage6Client vantage6_user: the client that the user has logged in with
+        :param dict organisations: organisations that are available to the user, as listed by the Vantage6 server
+        """
+        self.Vantage6User = vantage6_user
+        self.Organisations = organisations
+        self.LastAccess = time.time()
+
+        # per view of the dashboard, e.g. 'counts', its current selection and when it changed, and the hash
+        # identifiers of the results that it waits for
+        self.Selections = {}
+        self.WatchedJobs = {}
+        self._Lock = threading.Lock()
+
+    def change_selection(self, view, selection, debounce):
+        """
+        Register the current selection of a view; rapid changes are debounced, so that intermediate selections that
+        the user clicks through are not queried
+
+        :param str view: name of the view, e.g. 'counts'
+        :param selection: hashable description of the selection, e.g. the variable and organisation ids
+        :param float debounce: number of seconds that a selection has to settle if it follows a previous change
+        :return bool: True if the selection may be queried straight away, False if it follows the previous change
+        within the debounce time, in which case it is to be queried once it has been unchanged for that long
+        """
+        now = time.time()
+
+        with self._Lock:
+            previous_selection, changed_at = self.Selections.get(view, (None, 0.0))
+
+            if selection != previous_selection:
+                self.Selections[view] = (selection, now)
+
+        return now - changed_at >= debounce
+
+    def watch_jobs(self, view, job_keys):
+        """
+        Replace the results that a view waits for
+
+        :param str view: name of the view, e.g. 'counts'
+        :param list job_keys: hash identifiers of the results
+        :return set: hash identifiers that the view no longer waits for
+        """
+        with self._Lock:
+            previous_job_keys = self.WatchedJobs.get(view, set())
+            self.WatchedJobs[view] = set(job_keys)
+
+        return previous_job_keys - set(job_keys)
+
+    def collect_watched_jobs(self):
+        """
+        Collect the results that any view of this session waits for
+
+        :return set: hash identifiers of the results
+        """
+        with self._Lock:
+            return set().union(*self.WatchedJobs.values())
+
+
+class SessionRegistry:
+    def __init__(self, max_idle=None):
+        """
+        Thread-safe registry of the sessions of the users that are logged in on this process.
+        The browser only holds the session id, so callbacks of different users can run concurrently.
+        When running multiple processes, requests of a session have to be routed to the same process
+        (i.e. sticky sessions), as the authenticated clients cannot be shared between processes.
+
+        :param float max_idle: number of seconds after which an unused session is removed, None keeps sessions
+        """
+        self.MaxIdle = max_idle
+
+        self._Sessions = {}
+        self._Lock = threading.Lock()
+
+    def create(self, vantage6_user, organisations):
+        """
+        Register a new session
+
+        :param Vantage6Client vantage6_user: the client that the user has logged in with
+        :param dict organisations: organisations that are available to the user
+        :return str: the id of the session
+        """
+        session_id = uuid.uuid4().hex
+
+        with self._Lock:
+            self._expire_idle()
+            self._Sessions[session_id] = DashboardSession(vantage6_user, organisations)
+
+        return session_id
+
+    def get(self, session_id):
+        """
+        Retrieve a session and mark it as used
+
+        :param str session_id: the id of the session
+        :return DashboardSession: the session, or None if it does not exist (anymore)
+        """
+        with self._Lock:
+            session = self._Sessions.get(session_id)
+
+            if session is not None:
+                session.LastAccess = time.time()
+
+        return session
+
+    def collect_watched_jobs(self):
+        """
+        Collect the results that any view of any session waits for, so that these are not cancelled
+
+        :return set: hash identifiers of the results
+        """
+        with self._Lock:
+            sessions = list(self._Sessions.values())
+
+        return set().union(*[session.collect_watched_jobs() for session in sessions])
+
+    def remove(self, session_id):
+        """
+        Remove a session, e.g. when the user logs out
+
+        :param str session_id: the id of the session
+        """
+        with self._Lock:
+            self._Sessions.pop(session_id, None)
+
+    def _expire_idle(self):
+        """
+        Remove the sessions that have not been used for longer than the maximum idle time; the lock must be held
+        """
+        if self.MaxIdle is None:
+            return
+
+        expired_before = time.time() - self.MaxIdle
+        for session_id in [session_id for session_id, session in self._Sessions.items()
+                           if session.LastAccess < expired_before]:
+            self._Sessions.pop(session_id)
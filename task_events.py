@@ -0,0 +1,114 @@
+import threading
+
+try:
+    # optional dependency; without it the completion of tasks is only noticed by polling
+    import socketio
+except ImportError:
+    socketio = None
+
+_Listeners = {}
+_ListenersLock = threading.Lock()
+
+
+def get_task_event_listener(owner, connect):
+    """
+    Retrieve the listener that is shared by all tasks of an owner, e.g. a pool of clients, or create and connect it
+
+    :param any owner: object that the listener is shared by, e.g. a ClientPool
+    :param callable connect: function of the new listener that connects it to an event source
+    :return TaskEventListener: the listener
+    """
+    with _ListenersLock:
+        listener = _Listeners.get(owner)
+
+        if listener is None:
+            listener = _Listeners[owner] = TaskEventListener()
+            connect(listener)
+
+    return listener
+
+
+class TaskEventListener:
+    def __init__(self):
+        """
+        Listener for the status changes of tasks, shared by all tasks that are followed, so that a single connection
+        to the server notifies every followed task. Followed tasks still poll the server, though less often whilst the
+        listener is connected, so that lost events or connections delay a task rather than stall it.
+        """
+        self.Connected = False
+
+        self._Watched = {}
+        self._Lock = threading.Lock()
+
+    def watch(self, task_id, callback):
+        """
+        Start watching a task
+
+        :param int task_id: id of the task
+        :param callable callback: function without arguments that is called whenever the status of the task changes;
+        it is called on the thread that receives the events and should therefore return quickly
+        """
+        with self._Lock:
+            self._Watched[task_id] = callback
+
+    def unwatch(self, task_id):
+        """
+        Stop watching a task
+
+        :param int task_id: id of the task
+        """
+        with self._Lock:
+            self._Watched.pop(task_id, None)
+
+    def handle_status_change(self, data):
+        """
+        Handle a status change event of the server; the runs of a task at the organisations report the id of
+        their task as well as the id of the job, i.e. the task that the user created
+
+        :param dict data: the event, e.g. {'task_id': 2, 'job_id': 1, 'status': 'completed'}
+        """
+        if isinstance(data, dict) is False:
+            return
+
+        with self._Lock:
+            callbacks = [self._Watched.get(task_id) for task_id in
+                         {data.get('task_id'), data.get('job_id'), data.get('parent_id')}]
+
+        for callback in callbacks:
+            if callback is not None:
+                callback()
+
+
+class SocketIOEventSource:
+    def __init__(self, listener, client, url, socketio_path):
+        """
+        Subscribe a listener to the task status events of a Vantage6 server over socket.io; the connection is made
+        in the background, and the listener is marked as connected once it has been established
+
+        :param TaskEventListener listener: listener to notify of status changes
+        :param client: authenticated vantage6.client.Client, of which the access token is used to connect
+        :param str url: url of the server including its port
+        :param str socketio_path: path of socket.io on the server, e.g. /api/socket.io
+        """
+        self.Listener = listener
+        self.SocketIO = socketio.Client(reconnection=True)
+
+        self.SocketIO.on('algorithm_status_change', listener.handle_status_change, namespace='/tasks')
+        self.SocketIO.on('connect', self._set_connected, namespace='/tasks')
+        self.SocketIO.on('disconnect', self._set_disconnected, namespace='/tasks')
+
+        threading.Thread(target=self._connect, args=(url, socketio_path, client.token), daemon=True,
+                         name='task-events').start()
+
+    def _connect(self, url, socketio_path, token):
+        try:
+            self.SocketIO.connect(url, headers={'Authorization': f'Bearer {token}'}, namespaces=['/tasks'],
+                                  socketio_path=socketio_path)
+        except Exception as exception:
+            print(f'Task status events are not available, the status of tasks is polled instead: {exception}')
+
+    def _set_connected(self):
+        self.Listener.Connected = True
+
+    def _set_disconnected(self):
+        self.Listener.Connected = False
@@ -0,0 +1,166 @@
+import concurrent.futures
+import threading
+import time
+
+# private module
+import config as config
+import metrics
+from task_tracker import AdaptiveBackoff, TaskCancelledError, TaskDeadlineExceededError
+
+
+class TaskFollower:
+    def __init__(self, vantage6_client, task, name, output_key, return_filepath=False, handle=None, deadline=None):
+        """
+        Follow a task until it completes and collect its results, without occupying a thread whilst waiting.
+        Every status check is a short function on the task tracker, after which the next check is scheduled,
+        so that any number of tasks can be followed by the few threads of the tracker.
+        The status of the task is polled with an adaptive backoff, so that short tasks are picked up quickly
+        whilst long-running tasks do not flood the server with requests. Whilst the task status events of the server
+        are received, the status is checked as soon as it changes, and otherwise only polled as a fallback.
+
+        :param Vantage6Client vantage6_client: client that created the task
+        :param dict task: task as returned by the Vantage6 server upon creation
+        :param str name: name under which the results are stored in Vantage6Client.Results
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        :param bool return_filepath: wait until the results are saved and resolve to the path of the file instead
+        :param TaskHandle handle: handle of the task; the task fails with TaskCancelledError once it is cancelled
+        :param float deadline: number of seconds that the task may take, after which it is killed and fails with
+        TaskDeadlineExceededError, so that a node that never responds does not hold up its caller;
+        None waits indefinitely
+        """
+        self.Client = vantage6_client
+        self.TaskId = task['id']
+        self.Name = name
+        self.OutputKey = output_key
+        self.ReturnFilepath = return_filepath
+        self.Handle = handle
+        self.Deadline = deadline
+        self.Future = concurrent.futures.Future()
+        self.Backoff = AdaptiveBackoff()
+
+        self._Started = None
+        self._Expires = float('inf')
+        # only the most recently scheduled status check is performed, earlier ones have been superseded
+        self._Generation = 0
+        self._Finished = False
+        self._Lock = threading.Lock()
+
+    def start(self):
+        """
+        Start following the task; the first status check is made straight away on the calling thread
+
+        :return concurrent.futures.Future: future that resolves to the results of the task, or the path of the file
+        they were saved in
+        """
+        print("Waiting for results")
+        self._Started = time.monotonic()
+        if self.Deadline is not None:
+            self._Expires = self._Started + self.Deadline
+
+        # watch the task before its first status check, so that no status change is missed
+        if self.Client.Events is not None:
+            self.Client.Events.watch(self.TaskId, self._check_soon)
+        if self.Handle is not None:
+            self.Handle.add_cancel_callback(lambda cancelled_handle: self._check_soon())
+
+        self._check(self._Generation)
+        return self.Future
+
+    def _check_soon(self, delay=0):
+        """
+        Schedule the next status check, superseding any check that was scheduled before
+
+        :param float delay: number of seconds to wait before checking
+        """
+        with self._Lock:
+            if self._Finished:
+                return
+            self._Generation += 1
+            generation = self._Generation
+
+        self.Client.Tracker.schedule(delay, self._check, generation)
+
+    def _check(self, generation):
+        """
+        Check the status of the task and either collect its results or schedule the next check
+
+        :param int generation: generation of the check, a check that has been superseded is skipped
+        """
+        with self._Lock:
+            if self._Finished or generation != self._Generation:
+                return
+
+        try:
+            if self.Handle is not None and self.Handle.cancelled():
+                raise TaskCancelledError(f'Task {self.Name} has been cancelled')
+
+            # a client is only borrowed for each request, so that waiting does not occupy a client of the pool
+            with self.Client.borrow_client() as client:
+                task_info = client.task.get(self.TaskId)
+
+            if not task_info.get("complete"):
+                remaining_time = self._Expires - time.monotonic()
+                if remaining_time <= 0:
+                    # the outcome is claimed before killing the task, as the kill triggers another status check
+                    if self._claim():
+                        self.Client.kill_task(self.TaskId)
+                        self._finish(exception=TaskDeadlineExceededError(
+                            f'Task {self.Name} did not complete within {self.Deadline} seconds'), claimed=True)
+                    return
+
+                if self.Client.Events is not None and self.Client.Events.Connected:
+                    delay = config.task_event_fallback_interval
+                else:
+                    delay = self.Backoff.next_delay()
+
+                print("Waiting for results")
+                self._check_soon(min(delay, remaining_time))
+                return
+        except Exception as exception:
+            self._finish(exception=exception)
+            return
+
+        if self._claim() is False:
+            return
+
+        metrics.phase_duration.observe(time.monotonic() - self._Started, {'phase': 'task_wait'})
+        print("Results are ready!")
+
+        try:
+            output_data = self.Client.collect_results(task_info, self.Name, self.OutputKey, self.ReturnFilepath)
+        except Exception as exception:
+            self._finish(exception=exception, claimed=True)
+            return
+
+        self._finish(output_data, claimed=True)
+
+    def _claim(self):
+        """
+        Claim the outcome of the task, so that it is only resolved once when several checks run simultaneously
+
+        :return bool: True if the outcome was claimed, False if it has been claimed already
+        """
+        with self._Lock:
+            if self._Finished:
+                return False
+            self._Finished = True
+
+        if self.Client.Events is not None:
+            self.Client.Events.unwatch(self.TaskId)
+        return True
+
+    def _finish(self, output_data=None, exception=None, claimed=False):
+        """
+        Resolve the future of the task
+
+        :param output_data: results of the task
+        :param Exception exception: exception that the task failed with, if any
+        :param bool claimed: specify whether the outcome has been claimed already
+        """
+        if claimed is False and self._claim() is False:
+            return
+
+        if exception is not None:
+            self.Future.set_exception(exception)
+        else:
+            self.Future.set_result(output_data)
@@ -0,0 +1,332 @@
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import threading
+import time
+
+_Tracker = None
+_TrackerLock = threading.Lock()
+
+
+class TaskCancelledError(Exception):
+    """
+    Raised by a task that was cancelled, e.g. as no user is waiting for its results anymore
+    """
+
+
+class TaskDeadlineExceededError(TimeoutError):
+    """
+    Raised by a task that did not complete before its deadline, e.g. as a node does not respond
+    """
+
+
+class AdaptiveBackoff:
+    def __init__(self, initial_delay=0.5, factor=1.5, maximum_delay=3.0):
+        """
+        Produce increasing waiting times for polling the status of a task.
+        Tasks that finish quickly are picked up almost immediately, whereas long-running tasks are not polled
+        more often than once every maximum_delay seconds. The delay never exceeds the fixed interval of three
+        seconds that tasks were polled at before, so that no task is picked up later than it used to be.
+
+        :param float initial_delay: seconds to wait before the first poll
+        :param float factor: multiplier that is applied to the delay after every poll
+        :param float maximum_delay: upper bound of the delay in seconds
+        """
+        self.InitialDelay = initial_delay
+        self.Factor = factor
+        self.MaximumDelay = maximum_delay
+
+        self._Delay = initial_delay
+
+    def next_delay(self):
+        """
+        Retrieve the delay to wait before the next poll and increase the delay thereafter
+
+        :return float: seconds to wait
+        """
+        delay = self._Delay
+        self._Delay = min(self._Delay * self.Factor, self.MaximumDelay)
+        return delay
+
+    def reset(self):
+        """
+        Start again from the initial delay
+        """
+        self._Delay = self.InitialDelay
+
+
+class TaskHandle:
+    def __init__(self, name, future):
+        """
+        Handle to a Vantage6 task that is being tracked in the background.
+        The handle can be polled with done(), waited upon with result() or awaited in a coroutine.
+
+        :param str name: name of the task as used in Vantage6Client.Tasks and Vantage6Client.Results
+        :param concurrent.futures.Future future: future that resolves to the outcome of the task
+        """
+        self.Name = name
+        self.Future = future
+        # the task id only becomes available once the task has been created on the server
+        self.TaskId = None
+
+        self._Cancelled = False
+        self._CancelCallbacks = []
+        self._Lock = threading.Lock()
+
+    def done(self):
+        """
+        Check whether the task has finished, regardless of whether it succeeded
+
+        :return bool: True if the task has finished
+        """
+        return self.Future.done()
+
+    def result(self, timeout=None):
+        """
+        Wait for the task to finish and retrieve its outcome; exceptions raised whilst tracking are re-raised
+
+        :param float timeout: maximum number of seconds to wait, None waits indefinitely
+        :return: the outcome of the task
+        """
+        return self.Future.result(timeout)
+
+    def exception(self, timeout=None):
+        """
+        Wait for the task to finish and retrieve the exception that it raised, if any
+
+        :param float timeout: maximum number of seconds to wait, None waits indefinitely
+        :return Exception: the raised exception or None
+        """
+        return self.Future.exception(timeout)
+
+    def cancel(self):
+        """
+        Cancel the task; the function that performs the task is expected to stop by raising TaskCancelledError,
+        and functions registered with add_cancel_callback are called, e.g. to stop the task on the server
+
+        :return bool: True if the task was cancelled, False if it had already finished or been cancelled
+        """
+        with self._Lock:
+            if self._Cancelled or self.Future.done():
+                return False
+
+            self._Cancelled = True
+            callbacks = list(self._CancelCallbacks)
+
+        for callback in callbacks:
+            callback(self)
+        return True
+
+    def cancelled(self):
+        """
+        Check whether the task has been cancelled
+
+        :return bool: True if the task has been cancelled
+        """
+        return self._Cancelled
+
+    def add_cancel_callback(self, callback):
+        """
+        Call a function with this handle as its only argument once the task is cancelled,
+        or straight away if it has been cancelled already
+
+        :param callable callback: function to call
+        """
+        with self._Lock:
+            if self._Cancelled is False:
+                self._CancelCallbacks.append(callback)
+                return
+
+        callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Call a function with this handle as its only argument once the task has finished
+
+        :param callable callback: function to call
+        """
+        self.Future.add_done_callback(lambda future: callback(self))
+
+    def __await__(self):
+        return asyncio.wrap_future(self.Future).__await__()
+
+
+def _copy_outcome(source, target):
+    """
+    Resolve a future with the outcome of another future
+
+    :param concurrent.futures.Future source: future that has finished
+    :param concurrent.futures.Future target: future to resolve
+    """
+    exception = source.exception()
+    if exception is not None:
+        target.set_exception(exception)
+    else:
+        target.set_result(source.result())
+
+
+def gather(handles, timeout=None):
+    """
+    Wait for several tasks and collect their outcomes as they complete.
+    Failing tasks do not affect the others; their exception is returned in place of their outcome.
+
+    :param list handles: TaskHandles to wait for, a handle may occur more than once
+    :param float timeout: maximum number of seconds to wait for all tasks, None waits indefinitely
+    :return list: outcomes or raised exceptions in the order of the handles; tasks that did not finish in time
+    yield a concurrent.futures.TimeoutError
+    """
+    positions = {}
+    for position, handle in enumerate(handles):
+        positions.setdefault(handle.Future, []).append(position)
+
+    outcomes = [None] * len(handles)
+    try:
+        for future in concurrent.futures.as_completed(positions, timeout):
+            exception = future.exception()
+            for position in positions.pop(future):
+                outcomes[position] = exception if exception is not None else future.result()
+    except concurrent.futures.TimeoutError:
+        for future_positions in positions.values():
+            for position in future_positions:
+                outcomes[position] = concurrent.futures.TimeoutError(
+                    f'Task {handles[position].Name} did not finish within {timeout} seconds')
+
+    return outcomes
+
+
+def get_task_tracker():
+    """
+    Retrieve the tracker that is shared by all clients of this process, or create it if there is none yet,
+    so that every login does not start a pool of threads of its own
+
+    :return TaskTracker: the shared tracker
+    """
+    global _Tracker
+
+    with _TrackerLock:
+        if _Tracker is None:
+            _Tracker = TaskTracker()
+
+    return _Tracker
+
+
+class TaskTracker:
+    def __init__(self, max_workers=None):
+        """
+        Run the creation and tracking of Vantage6 tasks on a pool of background threads.
+        Waiting is not done on the pool: functions that follow a task are scheduled again once the task is due to be
+        checked, so that the threads are only occupied whilst talking to the server and any number of tasks can be
+        created and followed simultaneously.
+
+        :param int max_workers: maximum number of requests to the server that are made simultaneously
+        """
+        if isinstance(max_workers, int) is False:
+            max_workers = 8
+
+        self.Executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix='vantage6-task')
+
+        # functions that are due to run on the pool, as (time, sequence, function, arguments)
+        self._Scheduled = []
+        self._Sequence = itertools.count()
+        self._Scheduler = None
+        self._Condition = threading.Condition()
+        self._Stopped = False
+
+    def submit(self, name, function, *args, **kwargs):
+        """
+        Run a function that creates and/or follows a task in the background and return a handle to it straight away.
+        The handle is passed to the function as keyword argument 'handle' so that it can register the task id.
+        A function that returns a concurrent.futures.Future hands over the rest of the task, e.g. to functions that
+        it scheduled, and the handle resolves to the outcome of that future instead.
+
+        :param str name: name of the task
+        :param callable function: function that performs the task
+        :return TaskHandle: handle to the task
+        """
+        future = concurrent.futures.Future()
+        handle = TaskHandle(name, future)
+
+        def run():
+            if future.set_running_or_notify_cancel() is False:
+                return
+            try:
+                outcome = function(*args, handle=handle, **kwargs)
+            except BaseException as exception:
+                future.set_exception(exception)
+                return
+
+            if isinstance(outcome, concurrent.futures.Future):
+                outcome.add_done_callback(lambda pending: _copy_outcome(pending, future))
+            else:
+                future.set_result(outcome)
+
+        self.Executor.submit(run)
+        return handle
+
+    def schedule(self, delay, function, *args):
+        """
+        Run a function on the pool once a delay has passed, without occupying a thread of the pool in the meantime
+
+        :param float delay: number of seconds to wait
+        :param callable function: function to run
+        """
+        with self._Condition:
+            # functions that are scheduled once the tracker has been shut down would never run
+            if self._Stopped:
+                return
+
+            heapq.heappush(self._Scheduled, (time.monotonic() + delay, next(self._Sequence), function, args))
+            self._Condition.notify()
+
+            if self._Scheduler is None:
+                self._Scheduler = threading.Thread(target=self._run_scheduled, daemon=True,
+                                                   name='vantage6-task-scheduler')
+                self._Scheduler.start()
+
+    def _run_scheduled(self):
+        """
+        Hand scheduled functions to the pool once they are due; runs on a single thread for all tasks until the
+        tracker is shut down
+        """
+        while True:
+            with self._Condition:
+                while self._Stopped is False and (len(self._Scheduled) == 0 or
+                                                  self._Scheduled[0][0] > time.monotonic()):
+                    self._Condition.wait(self._Scheduled[0][0] - time.monotonic() if self._Scheduled else None)
+                if self._Stopped:
+                    return
+                _, _, function, args = heapq.heappop(self._Scheduled)
+
+            try:
+                self.Executor.submit(function, *args)
+            except RuntimeError:
+                # the pool has been shut down
+                return
+
+    @staticmethod
+    def fail(name, exception):
+        """
+        Create a handle to a task that could not be submitted or handled, so that it fails like a task that raised
+
+        :param str name: name of the task
+        :param Exception exception: the reason that the task could not be submitted
+        :return TaskHandle: handle that has finished with the exception
+        """
+        future = concurrent.futures.Future()
+        future.set_exception(exception)
+        return TaskHandle(name, future)
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting new tasks and stop the scheduler thread; functions that are still scheduled do not run
+
+        :param bool wait: wait for the tasks that are being tracked to finish
+        """
+        with self._Condition:
+            self._Stopped = True
+            self._Scheduled.clear()
+            self._Condition.notify_all()
+
+        self.Executor.shutdown(wait=wait)
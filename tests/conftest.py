@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+
+import pytest
+
+# the modules of the dashboard are not installed as a package, but imported from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        """
+        Clock that only moves when advanced, as a stand-in for time.time
+
+        :param float now: starting time in seconds since the epoch
+        """
+        self.Now = now
+
+    def advance(self, seconds):
+        """
+        Move the clock forward
+
+        :param float seconds: number of seconds to move
+        """
+        self.Now += seconds
+
+    def __call__(self):
+        return self.Now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Replace time.time by a clock that only moves when advanced, so that expiry can be tested without waiting
+    """
+    fixed_clock = Clock()
+    monkeypatch.setattr(time, 'time', fixed_clock)
+    return fixed_clock
+
+
+@pytest.fixture
+def output_directory(tmp_path, monkeypatch):
+    """
+    Run in a temporary working directory, as the clients save their results in ../output relative to it
+    """
+    working_directory = tmp_path / 'work'
+    working_directory.mkdir()
+    monkeypatch.chdir(working_directory)
+    return tmp_path / 'output'
+
+
+def wait_until(condition, timeout=10.0, interval=0.05):
+    """
+    Wait until a condition holds
+
+    :param callable condition: function without arguments that returns whether the condition holds
+    :param float timeout: maximum number of seconds to wait
+    :param float interval: number of seconds between checks
+    :return bool: True if the condition holds, False if it did not hold in time
+    """
+    expires = time.monotonic() + timeout
+    while time.monotonic() < expires:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
@@ -0,0 +1,11 @@
+import benchmark
+import fake_vantage6
+
+
+def test_benchmark_reports_every_scenario(output_directory):
+    summaries = benchmark.run_benchmark(iterations=2, server=fake_vantage6.FakeVantage6Server(latency=0.05),
+                                        poll_interval=0.01)
+
+    assert [summary['scenario'] for summary in summaries] == ['counts (uncached)', 'heatmap (uncached)',
+                                                              'counts (cached)', 'heatmap (cached)']
+    assert all(summary['samples'] == 2 for summary in summaries)
@@ -0,0 +1,76 @@
+import circuit_breaker
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure(4)
+    assert breaker.is_open(4) is False
+
+    breaker.record_failure(4)
+    assert breaker.is_open(4)
+    assert breaker.allow([2, 4]) is False
+    assert breaker.open_organisations() == [4]
+
+
+def test_success_resets_the_failures(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    breaker.record_failure(4)
+    breaker.record_success(4)
+    breaker.record_failure(4)
+
+    assert breaker.is_open(4) is False
+
+
+def test_half_open_breaker_lets_a_single_probe_through(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, reset_timeout=60, probe_timeout=30)
+    breaker.record_failure(4)
+
+    clock.advance(61)
+    assert breaker.is_open(4) is False
+    assert breaker.allow([4])
+
+    # the breaker remains open for all other queries whilst the probe is running
+    assert breaker.is_open(4)
+    assert breaker.allow([4]) is False
+
+    breaker.record_success(4)
+    assert breaker.is_open(4) is False
+    assert breaker.allow([4])
+    assert breaker.allow([4])
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, reset_timeout=60, probe_timeout=30)
+    breaker.record_failure(4)
+    clock.advance(61)
+    assert breaker.allow([4])
+
+    breaker.record_failure(4)
+
+    clock.advance(59)
+    assert breaker.allow([4]) is False
+
+    clock.advance(2)
+    assert breaker.allow([4])
+
+
+def test_lost_probe_is_given_up(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, reset_timeout=60, probe_timeout=30)
+    breaker.record_failure(4)
+    clock.advance(61)
+    assert breaker.allow([4])
+
+    clock.advance(31)
+    assert breaker.allow([4])
+
+
+def test_no_probe_is_claimed_if_another_organisation_is_open(clock):
+    breaker = circuit_breaker.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure(4)
+    clock.advance(61)
+    breaker.record_failure(5)
+
+    assert breaker.allow([4, 5]) is False
+    assert breaker.allow([4])
@@ -0,0 +1,114 @@
+import base64
+import json
+import threading
+
+import pytest
+
+import client_pool
+
+
+class FakeClient:
+    def __init__(self, expiry=None):
+        """
+        Stand-in for an authenticated vantage6.client.Client
+
+        :param float expiry: expiry of the access token in seconds since the epoch, None gives no token
+        """
+        self.token = None
+        self.Refreshed = 0
+        if expiry is not None:
+            self.token = create_token(expiry)
+
+    def refresh_token(self):
+        self.Refreshed += 1
+
+
+def create_token(expiry):
+    """
+    Create an unsigned JSON web token that expires at the given time
+
+    :param float expiry: expiry in seconds since the epoch
+    :return str: the token
+    """
+    payload = base64.urlsafe_b64encode(json.dumps({'exp': expiry}).encode()).decode().rstrip('=')
+    return f'header.{payload}.signature'
+
+
+def test_token_expiry_is_read_from_the_token():
+    assert client_pool.get_token_expiry(create_token(1234)) == 1234
+    assert client_pool.get_token_expiry('not a token') is None
+    assert client_pool.get_token_expiry(None) is None
+
+
+def test_logging_in_again_reuses_the_pool():
+    created = []
+
+    def create_client():
+        created.append(FakeClient())
+        return created[-1]
+
+    pool = client_pool.get_client_pool(('server', 'test-reuse'), 'password', create_client)
+
+    assert client_pool.get_client_pool(('server', 'test-reuse'), 'password', create_client) is pool
+    assert client_pool.get_client_pool(('server', 'test-reuse'), 'other', create_client) is not pool
+    assert len(created) == 2
+
+
+def test_pool_creates_clients_up_to_its_size():
+    pool = client_pool.ClientPool(FakeClient, size=2)
+
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second
+
+    acquired = []
+    waiting = threading.Thread(target=lambda: acquired.append(pool.acquire(timeout=5)))
+    waiting.start()
+
+    pool.release(first)
+    waiting.join(5)
+    assert acquired == [first]
+
+
+def test_only_expiring_tokens_are_refreshed(clock):
+    expiring_pool = client_pool.ClientPool(lambda: FakeClient(expiry=clock.Now + 30), refresh_margin=60)
+    valid_pool = client_pool.ClientPool(lambda: FakeClient(expiry=clock.Now + 3600), refresh_margin=60)
+
+    with expiring_pool.client() as client:
+        assert client.Refreshed == 1
+
+    with valid_pool.client() as client:
+        assert client.Refreshed == 0
+
+
+def test_acquiring_from_a_full_pool_times_out():
+    pool = client_pool.ClientPool(FakeClient, size=1, timeout=0.1)
+    pool.acquire()
+
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+
+
+def test_clients_that_cannot_be_authenticated_anew_leave_the_pool(clock):
+    class ExpiredClient(FakeClient):
+        def refresh_token(self):
+            raise ValueError('refresh token expired')
+
+    authenticate = [lambda: ExpiredClient(expiry=clock.Now + 30)]
+
+    def create_client():
+        return authenticate[0]()
+
+    pool = client_pool.ClientPool(create_client, size=1, refresh_margin=60, timeout=0.1)
+    pool.release(pool.acquire())
+
+    def fail():
+        raise ConnectionError('server unavailable')
+
+    authenticate[0] = fail
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+
+    # the client that could not be replaced no longer occupies the pool
+    authenticate[0] = FakeClient
+    assert isinstance(pool.acquire(), FakeClient)
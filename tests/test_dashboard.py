@@ -0,0 +1,308 @@
+import concurrent.futures
+import os
+import time
+
+import pytest
+from dash import dcc
+
+import benchmark
+import config
+import dash_v6
+import fake_vantage6
+import task_tracker
+from conftest import wait_until
+
+
+class MalformedVantage6Server(fake_vantage6.FakeVantage6Server):
+    def compute_result(self, input_):
+        return {key: 'malformed' for key in super().compute_result(input_)}
+
+
+class IncompleteVantage6Server(fake_vantage6.FakeVantage6Server):
+    def __init__(self, missing_predicates=(), empty_predicates=(), correlation_matrix=False, **kwargs):
+        """
+        Fake server of which the results lack counts, or of which the heatmaps are correlation matrices regardless
+        of the requested output, as with a version of the heatmap algorithm without sufficient statistics
+
+        :param list missing_predicates: predicates of which the counts are left out of the results
+        :param list empty_predicates: predicates of which the counts are empty
+        :param bool correlation_matrix: return correlation matrices even if sufficient statistics are requested
+        """
+        super().__init__(**kwargs)
+        self.MissingPredicates = missing_predicates
+        self.EmptyPredicates = empty_predicates
+        self.CorrelationMatrix = correlation_matrix
+
+    def compute_result(self, input_):
+        if self.CorrelationMatrix:
+            input_ = dict(input_, kwargs={key: value for key, value in input_.get('kwargs', {}).items()
+                                          if key != 'output'})
+
+        result = super().compute_result(input_)
+
+        for predicate in self.MissingPredicates:
+            result.pop(f'{predicate}_count', None)
+        for predicate in self.EmptyPredicates:
+            if f'{predicate}_count' in result:
+                result[f'{predicate}_count'] = {}
+
+        return result
+
+
+def render_until_done(render, arguments, timeout=10.0):
+    """
+    Call a rendering callback as the job poll of the dashboard would, until it disables the job poll
+
+    :param callable render: callback that returns whether the job poll should be disabled last
+    :param tuple arguments: arguments of the callback
+    :param float timeout: maximum number of seconds to poll
+    :return tuple: outputs of the last call of the callback
+    """
+    expires = time.monotonic() + timeout
+    while True:
+        outputs = render(*arguments)
+        if outputs[-1] or time.monotonic() > expires:
+            return outputs
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def dashboard(output_directory):
+    return dash_v6.Dashboard()
+
+
+@pytest.fixture
+def create_dashboard(output_directory, tmp_path):
+    dashboards = []
+
+    def create(server):
+        dashboard = dash_v6.Dashboard(server.client, os.path.join(tmp_path, 'cache.sqlite'), server.event_source)
+        dashboards.append(dashboard)
+        session_id = benchmark.get_callback(dashboard, 'authentication-status')(1, 'user', 'password', None)[4]
+        return dashboard, session_id
+
+    yield create
+
+    for dashboard in dashboards:
+        dashboard.ResultCache.close()
+
+
+def test_job_status_follows_the_task(dashboard):
+    future = concurrent.futures.Future()
+    task_handle = task_tracker.TaskHandle('counts', future)
+    dashboard.Jobs['job'] = task_handle
+
+    assert dashboard._collect_job_status('unknown') == 'queued'
+    assert dashboard._collect_job_status('job') == 'queued'
+
+    task_handle.TaskId = 1
+    assert dashboard._collect_job_status('job') == 'running'
+
+    # successful queries remain running until their result has been stored
+    future.set_result({})
+    assert dashboard._collect_job_status('job') == 'running'
+
+
+def test_failed_jobs_are_removed(dashboard):
+    future = concurrent.futures.Future()
+    future.set_exception(RuntimeError('node error'))
+    dashboard.Jobs['job'] = task_tracker.TaskHandle('counts', future)
+
+    assert dashboard._collect_job_status('job') == 'failed'
+    assert 'job' not in dashboard.Jobs
+
+
+class RecordingUser:
+    def __init__(self):
+        """
+        Stand-in for the Vantage6 client that records the queries submitted to it and never finishes them
+        """
+        self.Queries = []
+
+    def compute_count_sparql(self, name, **kwargs):
+        self.Queries.append(('count', kwargs))
+        return task_tracker.TaskHandle(name, concurrent.futures.Future())
+
+    def compute_hm_sparql(self, name, **kwargs):
+        self.Queries.append(('heatmap', kwargs))
+        return task_tracker.TaskHandle(name, concurrent.futures.Future())
+
+
+def test_warm_up_submits_every_query_once_per_organisation(dashboard):
+    vantage6_user = RecordingUser()
+
+    dashboard.warm_up_cache([3, 2], vantage6_user)
+    dashboard.warm_up_cache([2, 3], vantage6_user)
+
+    queries = vantage6_user.Queries
+    assert [(parameters['predicates'], parameters['organisation_ids']) for query, parameters in queries
+            if query == 'count'] == [(list(dashboard.filter_dict), [2]), (list(dashboard.filter_dict), [3])]
+    # correlation matrices cannot be combined, so these are queried for the selection as a whole
+    assert sorted((parameters['roitype'], parameters['organisation_ids']) for query, parameters in queries
+                  if query == 'heatmap') == sorted((roi_name, [2, 3]) for roi_name in dashboard.roi_names.values())
+
+
+def test_counts_are_summed_over_organisations(create_dashboard):
+    server = fake_vantage6.FakeVantage6Server(latency=0.1)
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    counts = {organisation_id: render_until_done(render_content, ([organisation_id], 'roo:P100018', None,
+                                                                  session_id))[0] for organisation_id in [2, 3]}
+    tasks_created = server.Requests['task.create']
+
+    # the selection of both organisations is combined from the stored counts, without querying them again
+    combined_counts, _, _ = render_until_done(render_content, ([2, 3], 'roo:P100018', None, session_id))
+
+    assert server.Requests['task.create'] == tasks_created
+    assert combined_counts['Values'] == [first + second for first, second in zip(counts[2]['Values'],
+                                                                                 counts[3]['Values'])]
+
+
+@pytest.mark.parametrize('sufficient_statistics', [False, True])
+def test_heatmap_is_rendered(create_dashboard, monkeypatch, sufficient_statistics):
+    monkeypatch.setattr(config, 'heatmap_sufficient_statistics', sufficient_statistics)
+    dashboard, session_id = create_dashboard(fake_vantage6.FakeVantage6Server(latency=0.1))
+    render_heatmap = benchmark.get_callback(dashboard, 'heatmap-content')
+
+    content, poll_disabled = render_until_done(render_heatmap, ([2, 3], 'GTV-1', None, session_id))
+
+    assert poll_disabled
+    assert isinstance(content, dcc.Graph)
+
+
+def test_heatmap_of_unexpected_shape_fails(create_dashboard, monkeypatch):
+    monkeypatch.setattr(config, 'heatmap_sufficient_statistics', True)
+    server = IncompleteVantage6Server(correlation_matrix=True, latency=0.1)
+    dashboard, session_id = create_dashboard(server)
+    render_heatmap = benchmark.get_callback(dashboard, 'heatmap-content')
+
+    content, poll_disabled = render_until_done(render_heatmap, ([2], 'GTV-1', None, session_id))
+
+    assert poll_disabled
+    assert content.children == dashboard._render_job_status('failed').children
+    assert server.Requests['task.create'] == 1
+
+
+def test_metrics_are_served(dashboard):
+    response = dashboard.App.server.test_client().get('/metrics')
+
+    assert response.status_code == 200
+    assert 'dashboard_phase_duration_seconds' in response.get_data(as_text=True)
+
+
+def test_count_data_is_cached(create_dashboard, monkeypatch):
+    dashboard, session_id = create_dashboard(fake_vantage6.FakeVantage6Server(latency=0.1))
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+    count_data, _, _ = render_until_done(render_content, ([2], 'roo:P100018', None, session_id))
+
+    # cached counts are pushed without assembling them again
+    monkeypatch.setattr(dashboard.CountPlanner, 'assemble', None)
+
+    assert render_content([2], 'roo:P100018', None, session_id) == (count_data, None, True)
+
+    # the memory of the received counts is reported per variable and organisation
+    response = dashboard.App.server.test_client().get('/metrics')
+    assert 'dashboard_count_entry_bytes_count' in response.get_data(as_text=True)
+
+
+def test_counts_that_cannot_be_stored_fail(create_dashboard):
+    dashboard, session_id = create_dashboard(MalformedVantage6Server(latency=0.1))
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    count_data, status, poll_disabled = render_until_done(render_content, ([2], 'roo:P100018', None, session_id))
+
+    assert poll_disabled
+    assert count_data is None
+    assert status.children == dashboard._render_job_status('failed').children
+    assert dashboard.Jobs == {}
+
+
+def test_counts_of_missing_predicates_fail_without_being_queried_again(create_dashboard):
+    server = IncompleteVantage6Server(missing_predicates=['roo:P100018'], latency=0.1)
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    count_data, status, poll_disabled = render_until_done(render_content, ([2], 'roo:P100018', None, session_id))
+
+    assert poll_disabled
+    assert count_data is None
+    assert status.children == dashboard._render_job_status('failed').children
+    assert server.Requests['task.create'] == 1
+
+
+def test_empty_counts_complete(create_dashboard):
+    server = IncompleteVantage6Server(empty_predicates=['roo:P100018'], latency=0.1)
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    count_data, status, poll_disabled = render_until_done(render_content, ([2], 'roo:P100018', None, session_id))
+
+    assert poll_disabled
+    assert count_data == {'Categories': [], 'Values': []}
+    assert status is None
+
+
+def test_partial_counts_are_shown_whilst_institutions_respond(create_dashboard):
+    server = fake_vantage6.FakeVantage6Server(latency=0.1, organisation_latency={3: 2})
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    assert wait_until(lambda: render_content([2, 3], 'roo:P100018', None, session_id)[0] is not None)
+    count_data, status, poll_disabled = render_content([2, 3], 'roo:P100018', None, session_id)
+
+    assert poll_disabled is False
+    assert status.children.startswith('Partial results of 1 out of 2 institutions are shown.')
+    assert len(dashboard.FigureCache) == 0
+
+    # the complete counts replace the partial counts once the last institution has responded
+    complete_data, status, poll_disabled = render_until_done(render_content, ([2, 3], 'roo:P100018', None,
+                                                                              session_id))
+
+    assert poll_disabled
+    assert status is None
+    assert sum(complete_data['Values']) > sum(count_data['Values'])
+
+
+def test_completed_tasks_are_noticed_without_polling(create_dashboard):
+    server = fake_vantage6.FakeVantage6Server(latency=1)
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    count_data, _, poll_disabled = render_until_done(render_content, ([2], 'roo:P100018', None, session_id))
+
+    assert poll_disabled
+    assert count_data is not None
+    # the status is checked once upon submission and once when the completion is announced
+    assert server.Requests['task.get'] == 2
+
+
+def test_queries_of_variables_that_are_no_longer_shown_are_cancelled(create_dashboard):
+    server = fake_vantage6.FakeVantage6Server(latency=30)
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    render_content([2], 'roo:P100018', None, session_id)
+    assert wait_until(lambda: server.Requests['task.create'] == 1)
+    assert wait_until(lambda: all(handle.TaskId is not None for handle in dashboard.Jobs.values()))
+
+    # the next variable follows within the debounce time, so it is not queried until the selection settles
+    render_content([2], 'roo:P100244', None, session_id)
+
+    assert wait_until(lambda: server.Requests['task.kill'] == 1)
+    assert server.Requests['task.create'] == 1
+    assert dashboard.Jobs == {}
+
+
+def test_counts_of_responding_institutions_are_shown_when_others_exceed_the_deadline(create_dashboard, monkeypatch):
+    monkeypatch.setattr(config, 'query_deadline', 0.3)
+    server = fake_vantage6.FakeVantage6Server(latency=0.1, organisation_latency={3: 30})
+    dashboard, session_id = create_dashboard(server)
+    render_content = benchmark.get_callback(dashboard, 'count-data')
+
+    count_data, status, poll_disabled = render_until_done(render_content, ([2, 3], 'roo:P100018', None, session_id))
+
+    assert poll_disabled
+    assert count_data is not None
+    assert status.children == dashboard._render_job_status('unavailable', (1, 2)).children
+    assert server.Requests['task.kill'] >= 1
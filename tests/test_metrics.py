@@ -0,0 +1,39 @@
+import pytest
+
+import metrics
+
+
+def test_metrics_are_rendered_in_the_prometheus_text_format():
+    registry = metrics.MetricsRegistry()
+    lookups = registry.counter('lookups_total', 'Lookups')
+    jobs = registry.gauge('jobs', 'Jobs')
+    lookups.increment({'store': 'counts'})
+    lookups.increment({'store': 'counts'}, 2)
+    jobs.set_function(lambda: 3)
+
+    assert registry.render().splitlines() == ['# HELP lookups_total Lookups', '# TYPE lookups_total counter',
+                                              'lookups_total{store="counts"} 3',
+                                              '# HELP jobs Jobs', '# TYPE jobs gauge', 'jobs 3']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.MetricsRegistry().histogram('duration_seconds', 'Duration', buckets=(1, 10))
+    histogram.observe(0.5)
+    histogram.observe(5)
+    histogram.observe(50)
+
+    assert histogram.render()[2:] == ['duration_seconds_bucket{le="1"} 1', 'duration_seconds_bucket{le="10"} 2',
+                                      'duration_seconds_bucket{le="+Inf"} 3', 'duration_seconds_sum 55.5',
+                                      'duration_seconds_count 3']
+
+
+def test_label_values_are_escaped():
+    assert metrics.format_labels((('phase', 'a"b\\c'),)) == '{phase="a\\"b\\\\c"}'
+
+
+def test_metrics_are_registered_once():
+    registry = metrics.MetricsRegistry()
+    registry.counter('lookups_total', 'Lookups')
+
+    with pytest.raises(ValueError):
+        registry.gauge('lookups_total', 'Lookups')
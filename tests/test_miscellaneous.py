@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import miscellaneous
+
+
+def test_query_key_ignores_the_order_of_parameters_and_selections():
+    assert miscellaneous.build_query_key('count', predicate='roo:P100018',
+                                         filters={'roo:P100018': ['C20197', 'C16576']}, organisation_ids=[3, 2]) == \
+        miscellaneous.build_query_key('count', organisation_ids=[2, 3], predicate='roo:P100018',
+                                      filters={'roo:P100018': ['C16576', 'C20197']})
+
+
+def test_query_key_distinguishes_queries():
+    key = miscellaneous.build_query_key('count', predicate='roo:P100018', organisation_ids=[2])
+
+    assert key != miscellaneous.build_query_key('heatmap', predicate='roo:P100018', organisation_ids=[2])
+    assert key != miscellaneous.build_query_key('count', predicate='roo:P100018', organisation_ids=[2, 3])
+    assert key != miscellaneous.build_query_key('count', predicate='roo:P100244', organisation_ids=[2])
+
+
+def test_count_frames_are_keyed_like_single_queries():
+    filters = {'A': ['x', 'y'], 'B': ['z']}
+    count_frame = miscellaneous.convert_count_dict_to_dataframe({'A_count': {'x': 1, 'y': 2}, 'B_count': {'z': 3}},
+                                                               filters, [2])
+
+    assert set(count_frame['HashIdentifier']) == {
+        miscellaneous.build_query_key('count', predicate=predicate, filters={predicate: filters[predicate]},
+                                      organisation_ids=[2]) for predicate in filters}
+    assert isinstance(count_frame['Categories'].dtype, pd.CategoricalDtype)
+
+    memory_per_entry = miscellaneous.count_memory_per_entry(count_frame)
+    assert len(memory_per_entry) == 2
+    assert (memory_per_entry > 0).all()
+
+
+def test_combined_sufficient_statistics_equal_the_correlation_of_the_pooled_data():
+    random = np.random.default_rng(0)
+    expl_vars = ['a', 'b', 'c']
+    organisations = [pd.DataFrame(random.normal(size=(50, 3)), columns=expl_vars) for _ in range(3)]
+    organisations[0].loc[0, 'a'] = np.nan
+
+    correlation = miscellaneous.combine_sufficient_statistics(
+        [miscellaneous.compute_sufficient_statistics(dataframe, expl_vars) for dataframe in organisations])
+
+    pooled_data = pd.concat([dataframe.dropna() for dataframe in organisations])
+    np.testing.assert_allclose(correlation.to_numpy(), pooled_data.corr().to_numpy(), rtol=1e-5, atol=1e-6)
+    assert correlation.dtypes.unique().tolist() == [np.float32]
+
+
+def test_combined_sufficient_statistics_only_cover_shared_variables():
+    random = np.random.default_rng(1)
+    first = miscellaneous.compute_sufficient_statistics(pd.DataFrame(random.normal(size=(20, 3)),
+                                                                     columns=['a', 'b', 'c']), ['a', 'b', 'c'])
+    second = miscellaneous.pack_sufficient_statistics(
+        miscellaneous.compute_sufficient_statistics(pd.DataFrame(random.normal(size=(20, 2)), columns=['c', 'a']),
+                                                    ['c', 'a']))
+
+    assert miscellaneous.combine_sufficient_statistics([first, second]).columns.tolist() == ['a', 'c']
+
+
+def test_correlated_variables_are_ordered_next_to_each_other():
+    random = np.random.default_rng(2)
+    first, second = random.normal(size=(2, 200))
+    data = np.column_stack([first, second, first + random.normal(scale=0.1, size=200),
+                            second + random.normal(scale=0.1, size=200)])
+
+    order = miscellaneous.order_correlation_matrix(np.corrcoef(data, rowvar=False)).tolist()
+
+    assert abs(order.index(0) - order.index(2)) in [1, 3]
+    assert abs(order.index(1) - order.index(3)) in [1, 3]
+
+
+def test_large_matrices_are_averaged_into_blocks():
+    matrix, labels = miscellaneous.downsample_matrix(np.arange(16, dtype=float).reshape(4, 4), list('abcd'), 2)
+
+    np.testing.assert_allclose(matrix, [[2.5, 4.5], [10.5, 12.5]])
+    assert labels == ['a (+1)', 'c (+1)']
+
+
+def test_malformed_sufficient_statistics_are_rejected():
+    with pytest.raises(ValueError):
+        miscellaneous.pack_sufficient_statistics({'a': {'a': 1.0}})
+
+
+def test_correlation_matrix_is_ordered_by_its_columns():
+    correlation = miscellaneous.convert_correlation_matrix({'a': {'b': 0.5, 'a': 1.0}, 'b': {'a': 0.5, 'b': 1.0}})
+
+    assert correlation.index.tolist() == ['a', 'b']
+    assert correlation.loc['a', 'b'] == pytest.approx(0.5)
+
+    with pytest.raises(ValueError):
+        miscellaneous.convert_correlation_matrix({'n': 3, 'sums': {}, 'cross_products': {}})
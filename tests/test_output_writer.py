@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import output_writer
+
+
+def test_outputs_are_written_and_found(tmp_path):
+    writer = output_writer.OutputWriter(str(tmp_path))
+    writer.write('json', {'a': np.int64(1), 'b': (1, 2)}).result(timeout=5)
+    writer.write('array', np.arange(5)).result(timeout=5)
+    writer.shutdown()
+
+    assert writer.find('json').load() == {'a': 1, 'b': [1, 2]}
+    assert writer.find('array').load().tolist() == [0, 1, 2, 3, 4]
+    assert writer.find('missing') is None
+
+
+def test_frames_are_written(tmp_path):
+    writer = output_writer.OutputWriter(str(tmp_path))
+    filepath = writer.write('frame', pd.DataFrame({'Values': [1, 2]})).result(timeout=5)
+    writer.shutdown()
+
+    output = output_writer.read_output(filepath)
+    if filepath.endswith('.parquet'):
+        assert output['Values'].tolist() == [1, 2]
+    else:
+        assert output['data'] == [[1], [2]]
+
+
+def test_no_temporary_files_remain(tmp_path):
+    writer = output_writer.OutputWriter(str(tmp_path))
+    writer.write('json', [1, 2, 3])
+    writer.shutdown()
+
+    assert os.listdir(tmp_path) == ['json.json.gz']
@@ -0,0 +1,86 @@
+import pandas as pd
+
+import miscellaneous
+import persistent_cache
+import query_planner
+import result_store
+
+
+def build_key(item, organisation_ids):
+    return miscellaneous.build_query_key('test', item=item, organisation_ids=organisation_ids)
+
+
+def count_frame(values):
+    return pd.DataFrame({'Categories': ['a', 'b'], 'Values': values})
+
+
+def test_split_organisations_deduplicates_and_sorts():
+    assert query_planner.split_organisations([3, 2, 3]) == [(2,), (3,)]
+    assert query_planner.split_organisations([3, 2, 3], individually=False) == [(2, 3)]
+    assert query_planner.split_organisations([]) == [()]
+
+
+def test_plan_only_reports_missing_organisations():
+    store = result_store.ResultStore()
+    planner = query_planner.QueryPlanner(store, build_key, miscellaneous.sum_count_frames)
+    store.put(build_key('x', [2]), count_frame([1, 2]))
+
+    plan = planner.plan(['x'], [3, 2])
+
+    assert plan.Units == [(2,), (3,)]
+    assert plan.Missing == {(3,): ['x']}
+    assert plan.missing_keys('x') == [build_key('x', [3])]
+    assert plan.progress('x') == (1, 2)
+
+
+def test_assemble_combines_organisations():
+    store = result_store.ResultStore()
+    planner = query_planner.QueryPlanner(store, build_key, miscellaneous.sum_count_frames)
+    store.put(build_key('x', [2]), count_frame([1, 2]))
+    store.put(build_key('x', [3]), count_frame([10, 20]))
+
+    plan = planner.plan(['x'], [2, 3])
+
+    assert plan.Missing == {}
+    assert planner.assemble(plan, 'x')['Values'].tolist() == [11, 22]
+
+
+def test_assemble_partial_results():
+    store = result_store.ResultStore()
+    planner = query_planner.QueryPlanner(store, build_key, miscellaneous.sum_count_frames)
+    store.put(build_key('x', [2]), count_frame([1, 2]))
+
+    plan = planner.plan(['x'], [2, 3])
+
+    assert planner.assemble(plan, 'x') is None
+    assert planner.assemble(plan, 'x', partial=True)['Values'].tolist() == [1, 2]
+    assert planner.assemble(planner.plan(['x'], [3]), 'x', partial=True) is None
+
+
+def test_keys_are_shared_by_any_selection():
+    planner = query_planner.QueryPlanner(result_store.ResultStore(), build_key, miscellaneous.sum_count_frames)
+
+    assert planner.keys(['x'], [2, 3])[('x', (3,))] == planner.keys(['x'], [3, 4])[('x', (3,))]
+
+
+def test_unsplit_planner_keys_the_whole_selection():
+    planner = query_planner.QueryPlanner(result_store.ResultStore(), build_key,
+                                         miscellaneous.select_correlation_matrix, split=False)
+
+    assert planner.keys(['x'], [3, 2]) == {('x', (2, 3)): build_key('x', [2, 3])}
+
+
+def test_fall_back_on_expired_results(tmp_path, clock):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10, stale_ttl=100)
+    store = result_store.ResultStore(backing, ttl=10)
+    planner = query_planner.QueryPlanner(store, build_key, miscellaneous.sum_count_frames)
+    store.put(build_key('x', [2]), count_frame([1, 2]))
+    clock.advance(20)
+
+    plan = planner.plan(['x'], [2])
+    assert plan.Missing == {(2,): ['x']}
+
+    planner.fall_back(plan, {build_key('x', [2])})
+    assert planner.assemble(plan, 'x')['Values'].tolist() == [1, 2]
+    assert plan.missing_keys('x') == [build_key('x', [2])]
+    assert plan.progress('x') == (0, 1)
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+import persistent_cache
+import result_store
+
+
+def test_results_are_stored_by_key():
+    store = result_store.ResultStore()
+    store.put('key', 'result')
+
+    assert store.get('key') == 'result'
+    assert store.get('other', 'default') == 'default'
+    assert 'key' in store
+    assert store.pop('key') == 'result'
+    assert len(store) == 0
+
+
+def test_frames_are_split_per_key():
+    store = result_store.ResultStore()
+    store.put_frame(pd.DataFrame({'Values': [1, 2, 3], 'HashIdentifier': ['a', 'b', 'a']}), 'HashIdentifier')
+
+    assert sorted(store.keys()) == ['a', 'b']
+    assert store.get('a')['Values'].tolist() == [1, 3]
+    assert store.get('a').index.tolist() == [0, 1]
+
+
+def test_stored_frames_only_keep_their_own_categories():
+    store = result_store.ResultStore()
+    store.put_frame(pd.DataFrame({'Categories': pd.Categorical(['x', 'y', 'z']), 'Values': [1, 2, 3],
+                                  'HashIdentifier': pd.Categorical(['a', 'b', 'a'])}), 'HashIdentifier')
+
+    assert store.get('a')['Categories'].cat.categories.tolist() == ['x', 'z']
+    assert store.get('b')['HashIdentifier'].cat.categories.tolist() == ['b']
+
+
+def test_results_expire_after_the_time_to_live(clock):
+    store = result_store.ResultStore(ttl=10)
+    store.put('key', 'result')
+
+    clock.advance(9)
+    assert store.get('key') == 'result'
+
+    clock.advance(2)
+    assert store.get('key') is None
+
+
+def test_pinned_results_do_not_expire(clock):
+    store = result_store.ResultStore(ttl=10)
+    store.put('key', 'result', persist=False)
+
+    clock.advance(100)
+    assert store.get('key') == 'result'
+
+
+def test_results_are_loaded_from_disk_after_a_restart(tmp_path):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    result_store.ResultStore(backing, ttl=10).put('key', [1, 2, 3])
+
+    restarted_store = result_store.ResultStore(persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite')),
+                                               ttl=10)
+    assert restarted_store.get('key') == [1, 2, 3]
+
+
+def test_persistent_cache_entries_expire(tmp_path, clock):
+    cache = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    cache.put('key', {'a': 1})
+    cache.put('kept', {'b': 2}, ttl=100)
+
+    clock.advance(11)
+    assert cache.get('key') is None
+    assert cache.get('kept') == {'b': 2}
+
+
+def test_results_loaded_from_disk_keep_their_expiry(tmp_path, clock):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    result_store.ResultStore(backing, ttl=10).put('key', 'result')
+
+    # a restarted dashboard loads the result from disk close to its expiry, which should not be extended
+    clock.advance(9)
+    store = result_store.ResultStore(backing, ttl=10)
+    assert store.get('key') == 'result'
+
+    clock.advance(2)
+    assert store.get('key') is None
+
+
+def test_persistent_cache_keeps_expired_entries_to_fall_back_on(tmp_path, clock):
+    cache = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10, stale_ttl=100)
+    cache.put('key', {'a': 1})
+
+    assert cache.get('key', with_expiry=True) == ({'a': 1}, clock.Now + 10)
+
+    clock.advance(50)
+    assert cache.get('key') is None
+    assert cache.get('key', stale=True) == {'a': 1}
+
+    clock.advance(100)
+    assert cache.get('key', stale=True) is None
+
+
+def test_stale_results_are_loaded_from_disk(tmp_path, clock):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10, stale_ttl=100)
+    store = result_store.ResultStore(backing, ttl=10)
+    store.put('key', 'result')
+
+    clock.advance(20)
+    assert store.get('key') is None
+    assert store.get_stale('key') == 'result'
+
+
+def test_persistent_cache_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = persistent_cache.PersistentCache(path)
+    cache.put('key', [1, 2, 3])
+    cache.close()
+
+    assert persistent_cache.PersistentCache(path).get('key') == [1, 2, 3]
+
+
+def test_entries_that_cannot_be_unpickled_are_removed(tmp_path):
+    cache = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('key', [1, 2, 3])
+    cache._Connection.execute('UPDATE entries SET payload = ? WHERE key = ?', (b'corrupt', 'key'))
+
+    assert cache.get('key', 'default') == 'default'
+    assert cache.get('key', with_expiry=True) == (None, None)
+    assert cache.size() == 0
+
+
+def test_persistent_cache_evicts_least_recently_used_entries(tmp_path, clock):
+    cache = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('first', b'x' * 1000)
+    clock.advance(1)
+    cache.put('second', b'x' * 1000)
+    clock.advance(1)
+    cache.get('first')
+    clock.advance(1)
+
+    cache.MaxBytes = cache.size() + 500
+    cache.put('third', b'x' * 1000)
+
+    assert cache.get('first') is not None
+    assert cache.get('second') is None
+    assert cache.get('third') is not None
+
+
+def test_least_recently_used_results_are_evicted():
+    size = result_store.estimate_size(np.zeros(100))
+    store = result_store.ResultStore(max_bytes=2 * size)
+    store.put('first', np.zeros(100))
+    store.put('second', np.zeros(100))
+
+    # using the first result makes the second the least recently used one
+    store.get('first')
+    store.put('third', np.zeros(100))
+
+    assert sorted(store.keys()) == ['first', 'third']
+    assert store.Size == 2 * size
+    assert store.memory_usage() == {'first': size, 'third': size}
+
+
+def test_pinned_results_are_not_evicted():
+    store = result_store.ResultStore(max_bytes=1)
+    store.put('placeholder', np.zeros(100), persist=False)
+    store.put('result', np.zeros(100))
+    store.put('other', np.zeros(100))
+
+    assert sorted(store.keys()) == ['other', 'placeholder']
+
+
+def test_holds_only_reports_unexpired_results_in_memory(tmp_path, clock):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    backing.put('on_disk', 'result')
+    store = result_store.ResultStore(backing, ttl=10)
+    store.put('in_memory', 'result')
+
+    assert store.holds('in_memory')
+    assert store.holds('on_disk') is False
+
+    clock.advance(11)
+    assert store.holds('in_memory') is False
+
+
+def test_evicted_results_are_loaded_from_disk(tmp_path):
+    backing = persistent_cache.PersistentCache(str(tmp_path / 'cache.sqlite'), ttl=10)
+    store = result_store.ResultStore(backing, ttl=10, max_bytes=1)
+    store.put('first', np.arange(100))
+    store.put('second', np.arange(100))
+
+    assert store.keys() == ['second']
+    assert store.get('first').tolist() == list(range(100))
@@ -0,0 +1,56 @@
+import sessions
+
+
+def test_rapid_selection_changes_are_debounced(clock):
+    session = sessions.DashboardSession(None, {})
+
+    assert session.change_selection('counts', ('roo:P100018', (2,)), debounce=0.5)
+
+    clock.advance(0.1)
+    assert session.change_selection('counts', ('roo:P100244', (2,)), debounce=0.5) is False
+
+    # the selection is queried once it has settled
+    clock.advance(0.6)
+    assert session.change_selection('counts', ('roo:P100244', (2,)), debounce=0.5)
+
+
+def test_views_are_debounced_separately(clock):
+    session = sessions.DashboardSession(None, {})
+    session.change_selection('counts', ('roo:P100018', (2,)), debounce=0.5)
+
+    assert session.change_selection('heatmap', ('GTV-1', (2,)), debounce=0.5)
+
+
+def test_watching_other_jobs_releases_the_previous_ones():
+    registry = sessions.SessionRegistry()
+    first = registry.get(registry.create(None, {}))
+    second = registry.get(registry.create(None, {}))
+
+    first.watch_jobs('counts', ['a', 'b'])
+    second.watch_jobs('counts', ['b'])
+
+    assert first.watch_jobs('counts', ['c']) == {'a', 'b'}
+    assert registry.collect_watched_jobs() == {'b', 'c'}
+
+
+def test_idle_sessions_expire(clock):
+    registry = sessions.SessionRegistry(max_idle=60)
+    session_id = registry.create(None, {})
+
+    clock.advance(61)
+    registry.create(None, {})
+
+    assert registry.get(session_id) is None
+
+
+def test_used_sessions_do_not_expire(clock):
+    registry = sessions.SessionRegistry(max_idle=60)
+    session_id = registry.create(None, {})
+
+    clock.advance(50)
+    assert registry.get(session_id) is not None
+
+    clock.advance(50)
+    registry.create(None, {})
+
+    assert registry.get(session_id) is not None
@@ -0,0 +1,36 @@
+import task_events
+
+
+def test_status_changes_wake_the_watched_task():
+    listener = task_events.TaskEventListener()
+    status_changes = []
+    listener.watch(1, lambda: status_changes.append(1))
+
+    listener.handle_status_change({'task_id': 2, 'job_id': 3, 'status': 'active'})
+    assert status_changes == []
+
+    # the runs of a task at the organisations report the task that the user created as their job
+    listener.handle_status_change({'task_id': 4, 'job_id': 1, 'status': 'completed'})
+    assert status_changes == [1]
+
+
+def test_unwatched_tasks_are_forgotten():
+    listener = task_events.TaskEventListener()
+    status_changes = []
+    listener.watch(1, lambda: status_changes.append(1))
+    listener.unwatch(1)
+
+    listener.handle_status_change({'task_id': 1, 'status': 'completed'})
+    listener.handle_status_change('malformed')
+
+    assert status_changes == []
+
+
+def test_listener_is_shared_by_its_owner():
+    connected = []
+    owner = object()
+
+    listener = task_events.get_task_event_listener(owner, connected.append)
+
+    assert task_events.get_task_event_listener(owner, connected.append) is listener
+    assert connected == [listener]
@@ -0,0 +1,143 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import pytest
+
+import task_tracker
+
+
+def test_backoff_grows_up_to_the_maximum_delay():
+    backoff = task_tracker.AdaptiveBackoff(initial_delay=0.5, factor=2, maximum_delay=3)
+
+    assert [backoff.next_delay() for _ in range(5)] == [0.5, 1, 2, 3, 3]
+
+    backoff.reset()
+    assert backoff.next_delay() == 0.5
+
+
+def test_backoff_is_capped_at_the_maximum_delay():
+    backoff = task_tracker.AdaptiveBackoff()
+    delays = [backoff.next_delay() for _ in range(20)]
+
+    assert delays[0] == backoff.InitialDelay
+    assert max(delays) == 3.0
+
+
+def test_tracker_runs_functions_in_the_background():
+    tracker = task_tracker.TaskTracker(max_workers=2)
+    started = threading.Event()
+    release = threading.Event()
+
+    def track(value, handle=None):
+        started.set()
+        release.wait(5)
+        return value, handle.Name
+
+    handle = tracker.submit('task', track, 'result')
+
+    assert started.wait(5)
+    assert handle.done() is False
+
+    release.set()
+    assert handle.result(timeout=5) == ('result', 'task')
+    tracker.shutdown()
+
+
+def test_exceptions_are_raised_by_the_handle():
+    tracker = task_tracker.TaskTracker(max_workers=1)
+
+    def fail(handle=None):
+        raise KeyError('missing')
+
+    handle = tracker.submit('task', fail)
+
+    with pytest.raises(KeyError):
+        handle.result(timeout=5)
+    assert isinstance(handle.exception(), KeyError)
+    tracker.shutdown()
+
+
+def test_handle_can_be_awaited():
+    tracker = task_tracker.TaskTracker(max_workers=1)
+    handle = tracker.submit('task', lambda handle=None: 'result')
+
+    async def wait_for_handle():
+        return await handle
+
+    assert asyncio.run(wait_for_handle()) == 'result'
+    tracker.shutdown()
+
+
+def test_gather_returns_exceptions_in_place_of_outcomes():
+    succeeded = concurrent.futures.Future()
+    succeeded.set_result(1)
+    handles = [task_tracker.TaskHandle('succeeded', succeeded), task_tracker.TaskTracker.fail('failed', KeyError())]
+
+    outcomes = task_tracker.gather(handles)
+
+    assert outcomes[0] == 1
+    assert isinstance(outcomes[1], KeyError)
+
+
+def test_gather_reports_tasks_that_did_not_finish_in_time():
+    handles = [task_tracker.TaskHandle('pending', concurrent.futures.Future())]
+
+    outcomes = task_tracker.gather(handles + handles, timeout=0.1)
+
+    assert all(isinstance(outcome, concurrent.futures.TimeoutError) for outcome in outcomes)
+
+
+def test_cancel_calls_the_cancel_callbacks_once():
+    handle = task_tracker.TaskHandle('task', concurrent.futures.Future())
+    cancelled = []
+    handle.add_cancel_callback(cancelled.append)
+
+    assert handle.cancel()
+    assert handle.cancel() is False
+    assert cancelled == [handle]
+
+    # callbacks that are added once the handle has been cancelled are called straight away
+    handle.add_cancel_callback(cancelled.append)
+    assert cancelled == [handle, handle]
+
+
+def test_finished_tasks_cannot_be_cancelled():
+    future = concurrent.futures.Future()
+    future.set_result('result')
+
+    assert task_tracker.TaskHandle('task', future).cancel() is False
+
+
+def test_handle_resolves_to_the_future_that_a_function_hands_over():
+    tracker = task_tracker.TaskTracker(max_workers=1)
+    pending = concurrent.futures.Future()
+
+    handle = tracker.submit('task', lambda handle: pending)
+    tracker.schedule(0.05, pending.set_result, 'result')
+
+    assert handle.result(timeout=5) == 'result'
+    tracker.shutdown()
+
+
+def test_scheduled_functions_do_not_occupy_the_pool():
+    tracker = task_tracker.TaskTracker(max_workers=1)
+    ran = threading.Event()
+
+    tracker.schedule(10, ran.set)
+    tracker.Executor.submit(ran.set).result(timeout=5)
+
+    assert ran.is_set()
+    tracker.shutdown()
+
+
+def test_shutdown_stops_the_scheduler():
+    tracker = task_tracker.TaskTracker(max_workers=1)
+    ran = threading.Event()
+    tracker.schedule(10, ran.set)
+
+    tracker.shutdown()
+    tracker._Scheduler.join(timeout=5)
+
+    assert tracker._Scheduler.is_alive() is False
+    assert ran.is_set() is False
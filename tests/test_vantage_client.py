@@ -0,0 +1,181 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+import fake_vantage6
+import task_tracker
+import vantage_client
+from conftest import wait_until
+
+
+def create_client(release):
+    """
+    Create a client of which the tasks are created locally and complete once released
+
+    :param threading.Event release: event that completes the created tasks
+    :return vantage_client.Vantage6Client: client
+    """
+    client = vantage_client.Vantage6Client()
+
+    def follow_task(task, *args, **kwargs):
+        following = concurrent.futures.Future()
+
+        def complete():
+            release.wait(5)
+            following.set_result(task['id'])
+
+        threading.Thread(target=complete).start()
+        return following
+
+    client.follow_task = follow_task
+    return client
+
+
+def test_identical_concurrent_requests_share_a_task(output_directory):
+    created = []
+    release = threading.Event()
+    client = create_client(release)
+
+    def create_task(client):
+        created.append('task')
+        return {'id': len(created)}
+
+    first = client._submit_task(create_task, 'first', wait=False, query_key='key')
+    second = client._submit_task(create_task, 'second', wait=False, query_key='key')
+    other = client._submit_task(create_task, 'other', wait=False, query_key='other')
+
+    assert first is second
+    assert other is not first
+
+    release.set()
+    assert first.result(timeout=5) == second.result(timeout=5)
+    assert len(created) == 2
+
+
+def test_shared_tasks_keep_the_settings_of_every_request(output_directory):
+    created = []
+    release = threading.Event()
+    client = create_client(release)
+
+    def create_task(client):
+        created.append('task')
+        return {'id': len(created)}
+
+    first = client._submit_task(create_task, 'first', wait=False, query_key='shared-key')
+    second = client._submit_task(create_task, 'second', filename='counts', wait=False, query_key='shared-key')
+    other_deadline = client._submit_task(create_task, 'third', wait=False, query_key='shared-key', deadline=10)
+
+    assert first is second
+    assert other_deadline is not first
+
+    release.set()
+    assert second.result(timeout=5) == 1
+
+    # the results are stored under the name of the request that shared the task, and saved as it requested
+    assert wait_until(lambda: client.Results.get('second') == 1)
+    assert wait_until(lambda: client.Writer.find('shared-key') is not None)
+
+
+def test_finished_tasks_are_no_longer_shared(output_directory):
+    created = []
+    release = threading.Event()
+    release.set()
+    client = create_client(release)
+
+    def create_task(client):
+        created.append('task')
+        return {'id': len(created)}
+
+    first = client._submit_task(create_task, 'first', query_key='key')
+    assert wait_until(lambda: client.InFlight == {})
+
+    second = client._submit_task(create_task, 'second', query_key='key')
+    assert first is not second
+    assert len(created) == 2
+
+
+def test_failing_analyses_do_not_affect_the_others(output_directory):
+    server = fake_vantage6.FakeVantage6Server(latency=0.5)
+    client = vantage_client.Vantage6Client(server.client, server.event_source)
+    client.login('user', 'password')
+
+    outcomes = client.gather_results([('compute_count_sparql', {'predicates': ['a'], 'organisation_ids': [2],
+                                                                'name': 'a', 'save_results': False}),
+                                      ('compute_count_sparql', {'predicates': ['b'], 'organisation_ids': [2],
+                                                                'name': 'b', 'save_results': False}),
+                                      ('unknown_analysis', {})], timeout=10)
+
+    assert set(outcomes[0]) == {'a_count'}
+    assert set(outcomes[1]) == {'b_count'}
+    assert isinstance(outcomes[2], AttributeError)
+
+
+def test_clients_share_their_threads(output_directory):
+    server = fake_vantage6.FakeVantage6Server(latency=0.1)
+    clients = [vantage_client.Vantage6Client(server.client, server.event_source) for _ in range(3)]
+
+    assert len({id(client.Tracker) for client in clients}) == 1
+    assert len({id(client.Writer) for client in clients}) == 1
+
+
+@pytest.fixture
+def vantage6_user(output_directory):
+    server = fake_vantage6.FakeVantage6Server(latency=1.0)
+    client = vantage_client.Vantage6Client(server.client, server.event_source)
+    client.login('user', 'password')
+    return server, client
+
+
+def test_cancelled_task_is_killed(vantage6_user):
+    server, client = vantage6_user
+    server.Latency = 30
+
+    handle = client.compute_count_sparql(predicates=['x'], organisation_ids=[2], save_results=False, wait=False)
+    assert wait_until(lambda: handle.TaskId is not None)
+
+    handle.cancel()
+
+    with pytest.raises(task_tracker.TaskCancelledError):
+        handle.result(timeout=5)
+    assert wait_until(lambda: server.Requests['task.kill'] == 1)
+
+
+def test_cancelling_does_not_wait_for_the_kill(vantage6_user, monkeypatch):
+    server, client = vantage6_user
+    server.Latency = 30
+    release = threading.Event()
+    killed = []
+    monkeypatch.setattr(client, 'kill_task', lambda task_id: killed.append(release.wait(5)))
+
+    handle = client.compute_count_sparql(predicates=['x'], organisation_ids=[2], save_results=False, wait=False)
+    assert wait_until(lambda: handle.TaskId is not None)
+
+    handle.cancel()
+    assert killed == []
+
+    release.set()
+    assert wait_until(lambda: killed == [True])
+
+
+def test_task_that_exceeds_its_deadline_is_killed(vantage6_user):
+    server, client = vantage6_user
+    server.Latency = 30
+
+    handle = client.compute_count_sparql(predicates=['x'], organisation_ids=[2], save_results=False, wait=False,
+                                         deadline=0.2)
+
+    with pytest.raises(task_tracker.TaskDeadlineExceededError):
+        handle.result(timeout=5)
+    assert server.Requests['task.kill'] == 1
+
+
+def test_more_tasks_than_threads_are_created_straight_away(vantage6_user):
+    server, client = vantage6_user
+    client.Tracker = task_tracker.TaskTracker(max_workers=2)
+
+    handles = [client.compute_count_sparql(predicates=[f'x{index}'], organisation_ids=[2], name=f'counts {index}',
+                                           save_results=False, wait=False) for index in range(6)]
+
+    assert wait_until(lambda: server.Requests['task.create'] == 6, timeout=0.5)
+    assert all(isinstance(outcome, dict) for outcome in task_tracker.gather(handles, timeout=10))
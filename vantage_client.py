@@ -1,29 +1,86 @@
-import json
+import contextlib
 import os
 import sys
 import subprocess
-import time
+import threading
 
 from vantage6.client import Client
 
 # private module
 import config as config
+import metrics
+import miscellaneous
+from client_pool import get_client_pool
+from output_writer import get_output_writer
+from task_events import SocketIOEventSource, get_task_event_listener, socketio
+from task_follower import TaskFollower
+from result_store import estimate_size
+from task_tracker import TaskCancelledError, gather, get_task_tracker
+
+
+def get_output_path(directory=None):
+    """
+    Retrieve the directory that results are saved in, and create it if it is not present
+
+    :param str directory: working directory, defaults to the current working directory
+    :return str: path of the output directory
+    """
+    if directory is None:
+        directory = os.getcwd()
+
+    # ensure path is present
+    if os.path.exists(os.path.join(directory, '../output')) is False:
+        os.mkdir(os.path.join(directory, '../output'))
+    return os.path.join(directory, '../output')
+
+
+def connect_task_events(listener, client):
+    """
+    Subscribe a listener to the task status events of the Vantage6 server in the configuration over socket.io
+
+    :param TaskEventListener listener: listener to notify of status changes
+    :param client: authenticated vantage6.client.Client to connect with
+    :return SocketIOEventSource: the connection to the server
+    """
+    return SocketIOEventSource(listener, client, f'{config.server_url}:{config.server_port}',
+                               f'{config.server_api}/socket.io')
 
 
 class Vantage6Client:
-    def __init__(self):
-        """"""
+    def __init__(self, client_factory=None, event_source_factory=None):
+        """
+        :param callable client_factory: function of the server url, port and api path that returns an
+        unauthenticated client, defaults to vantage6.client.Client
+        :param callable event_source_factory: function of a TaskEventListener and an authenticated client that
+        subscribes the listener to the task status events of the server, e.g. FakeVantage6Server.event_source;
+        defaults to socket.io for vantage6.client.Client if python-socketio is installed, None polls the server only
+        """
+        if client_factory is None:
+            client_factory = Client
+
+            if event_source_factory is None and socketio is not None:
+                event_source_factory = connect_task_events
+
+        self.ClientFactory = client_factory
+        self.EventSourceFactory = event_source_factory
         self.Client = None
+        self.Pool = None
+        self.Events = None
         self.Tasks = {}
         self.Results = {}
         self.Dashboard = None
+        # the threads that create, follow and save tasks are shared by all clients, so that replaced or expired
+        # sessions do not leave threads behind
+        self.Tracker = get_task_tracker()
 
-        self.Directory = os.getcwd()
+        # tasks that are running, with the key that their results are saved under, by query key and deadline, so that
+        # identical concurrent requests share a single task
+        self.InFlight = {}
+        self._InFlightLock = threading.RLock()
 
-        # ensure path is present
-        if os.path.exists(os.path.join(self.Directory, '../output')) is False:
-            os.mkdir(os.path.join(self.Directory, '../output'))
-        self.OutputPath = os.path.join(self.Directory, '../output')
+        self.Directory = os.getcwd()
+        self.OutputPath = get_output_path(self.Directory)
+        self.Writer = get_output_writer(self.OutputPath)
 
     def login(self, username=None, password=None):
         """
@@ -33,9 +90,6 @@ class Vantage6Client:
         :param str password: Vantage6 Password
         :return:
         """
-        # Initialize the client object, and run the authentication
-        self.Client = Client(config.server_url, config.server_port, config.server_api, verbose=True)
-
         # retrieve login details
         if isinstance(username, str) is False:
             if isinstance(config.username, str) is False:
@@ -49,12 +103,28 @@ class Vantage6Client:
             else:
                 password = config.password
 
-        self.Client.authenticate(username, password)
+        def create_client():
+            # Initialize the client object, and run the authentication
+            client = self.ClientFactory(config.server_url, config.server_port, config.server_api, verbose=True)
+            client.authenticate(username, password)
+
+            # Optional: set up the encryption, if you have an organization_key
+            client.setup_encryption(config.organization_key)
+            return client
 
-        # Optional: set up the encryption, if you have an organization_key
-        self.Client.setup_encryption(config.organization_key)
+        # clients that were authenticated with the same credentials before are reused
+        self.Pool = get_client_pool((self.ClientFactory, config.server_url, config.server_port, config.server_api,
+                                     username), password, create_client, config.client_pool_size,
+                                    config.client_token_refresh_margin, config.client_pool_timeout)
+        self.Client = self.Pool.Primary
 
-    def varsha_benedetta(self, column_names=None, name=None, description=None, check_results=True, save_results=True):
+        # a single listener notifies all tasks of the clients in the pool of their completion
+        if self.EventSourceFactory is not None:
+            self.Events = get_task_event_listener(self.Pool,
+                                                  lambda listener: self.EventSourceFactory(listener, self.Pool.Primary))
+
+    def varsha_benedetta(self, column_names=None, name=None, description=None, check_results=True, save_results=True,
+                         wait=True):
         """"""
 
         if name is None:
@@ -71,22 +141,21 @@ class Vantage6Client:
             },
         }
 
-        task = self.Client.task.create(name="testing",
-                                       description="test connection",
-                                       image="coxphl1/vtg_corr:latest",
-                                       collaboration=1,
-                                       input=input_,
-                                       organizations=[2, 3])
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{column_names}.json'
-            self.retrieve_results(task, name, filename)
-
-        self.Tasks.update({name: task})
-
-    def take_summary(self, column_names=None, name=None, description=None, check_results=True, save_results=True):
+        def create_task(client):
+            return client.task.create(name="testing",
+                                      description="test connection",
+                                      image="coxphl1/vtg_corr:latest",
+                                      collaboration=1,
+                                      input=input_,
+                                      organizations=[2, 3])
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{column_names}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait)
+
+    def take_summary(self, column_names=None, name=None, description=None, check_results=True, save_results=True,
+                     wait=True):
         """"""
         if column_names is None:
             # The `columns` in the datasets you want to summarize and specify if
@@ -120,23 +189,22 @@ class Vantage6Client:
         }
 
         # Send the task to the central server
-        task = self.Client.task.create(name=name,
-                                       description=description,
-                                       collaboration=1,
-                                       organizations=[2],
-                                       image="harbor.vantage6.ai/algorithms/summary",
-                                       input=input_,
-                                       organization_ids=[2])
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{column_names}.json'
-            self.retrieve_results(task, name, filename)
-
-        self.Tasks.update({name: task})
+        def create_task(client):
+            return client.task.create(name=name,
+                                      description=description,
+                                      collaboration=1,
+                                      organizations=[2],
+                                      image="harbor.vantage6.ai/algorithms/summary",
+                                      input=input_,
+                                      organization_ids=[2])
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{column_names}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait)
 
     def take_average(self, column_name=None, collaboration=None, aggregating_organisation=None,
-                     name=None, description=None, check_results=True, save_results=True):
+                     name=None, description=None, check_results=True, save_results=True, wait=True):
 
         """
         Take the average of a given column
@@ -147,7 +215,9 @@ class Vantage6Client:
         :param string name: define the name of the task
         :param string description: provide a description of the task
         :param boolean check_results: specify whether to check for results
-        :param boolean save_results:  specify whether to save the results as JSON file
+        :param boolean save_results:  specify whether to save the results in the output directory
+        :param boolean wait: specify whether to block until the results are in; otherwise return the handle directly
+        :return TaskHandle: handle to the task that resolves to its results
         """
         if collaboration is None:
             collaboration = 1
@@ -168,25 +238,23 @@ class Vantage6Client:
                          'kwargs': {'column_name': column_name},
                          'master': True}
 
-        task = self.Client.task.create(name=name,
-                                       description=description,
-                                       collaboration=collaboration,
-                                       organizations=aggregating_organisation,
-                                       image="harbor2.vantage6.ai/demo/average",
-                                       input=input_average,
-                                       data_format='json')
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{column_name}.json'
-            self.retrieve_results(task, name, filename)
+        def create_task(client):
+            return client.task.create(name=name,
+                                      description=description,
+                                      collaboration=collaboration,
+                                      organizations=aggregating_organisation,
+                                      image="harbor2.vantage6.ai/demo/average",
+                                      input=input_average,
+                                      data_format='json')
 
-        self.Tasks.update({name: task})
+        filename = None
+        if save_results:
+            filename = f'{name}_{column_name}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait)
 
     def take_average_predicate_sparql(self, predicates=None, filters=None, collaboration=None, organisation_ids=[4],
                                       aggregating_organisation=None, name=None, description=None,
-                                      check_results=True, save_results=True):
+                                      check_results=True, save_results=True, wait=True):
         """
         Take the average of a given predicate using SPARQL
 
@@ -198,7 +266,9 @@ class Vantage6Client:
         :param string name: define the name of the task
         :param string description: provide a description of the task
         :param boolean check_results: specify whether to check for results
-        :param boolean save_results:  specify whether to save the results as JSON file
+        :param boolean save_results:  specify whether to save the results in the output directory
+        :param boolean wait: specify whether to block until the results are in; otherwise return the handle directly
+        :return TaskHandle: handle to the task that resolves to its results
         """
         if collaboration is None:
             collaboration = 2
@@ -222,28 +292,26 @@ class Vantage6Client:
                                     'organization_ids': organisation_ids},
                          'master': True}
 
-        task = self.Client.task.create(name=name,
-                                       description=description,
-                                       collaboration=collaboration,
-                                       organizations=aggregating_organisation,
-                                       image="jhogenboom/average_sparql",
-                                       input=input_average,
-                                       data_format='json',
-                                       database='rdf')
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{predicates}.json'
-            self.retrieve_results(task, name, filename)
-
-        self.Tasks.update({name: task})
+        def create_task(client):
+            return client.task.create(name=name,
+                                      description=description,
+                                      collaboration=collaboration,
+                                      organizations=aggregating_organisation,
+                                      image="jhogenboom/average_sparql",
+                                      input=input_average,
+                                      data_format='json',
+                                      database='rdf')
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{predicates}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait)
 
     def perform_generalised_linear_regression(self, formula=None, categorical_variables=None,
                                               family=None, tolerance=None, max_iterations=None,
                                               collaboration=None, organisation_ids=[2, 3, 5, 6],
                                               aggregating_organisation=None, name=None, description=None,
-                                              check_results=True, save_results=True):
+                                              check_results=True, save_results=True, wait=True):
         """
 
         :param formula: 'outcome ~ explanatory_variable_1 + explanatory_variable_2 + et cetera'
@@ -256,7 +324,8 @@ class Vantage6Client:
         :param description:
         :param check_results:
         :param save_results:
-        :return:
+        :param wait: specify whether to block until the results are in; otherwise return the handle directly
+        :return: TaskHandle to the task that resolves to its results
         """
         if isinstance(formula, str) is False:
             formula = "BIneg_new ~ alg_v1b + " \
@@ -290,72 +359,70 @@ class Vantage6Client:
                 #     'levels': ['1', '2', '3', '4']}
                 #     }
 
-            if isinstance(family, str) is False:
-                family = 'binomial'
-
-            if isinstance(tolerance, (int, float)) is False:
-                tolerance = 1e-08
+        if isinstance(family, str) is False:
+            family = 'binomial'
 
-            if isinstance(max_iterations, int) is False:
-                max_iterations = 25
+        if isinstance(tolerance, (int, float)) is False:
+            tolerance = 1e-08
 
-            if isinstance(collaboration, int) is False:
-                collaboration = 2
+        if isinstance(max_iterations, int) is False:
+            max_iterations = 25
 
-            if isinstance(aggregating_organisation, list) is False:
-                aggregating_organisation = [8]
-
-            if isinstance(name, str) is False:
-                name = 'Logistic Regression'
-
-            if isinstance(description, str) is False:
-                description = f'Logistic regression for formula:\n {formula}'
+        if isinstance(collaboration, int) is False:
+            collaboration = 2
 
-            # this step is done seperately whereas None might cause errors
-            if isinstance(organisation_ids, list):
-                input_regression = {'master': True,
-                                    'method': 'dglm',
-                                    'args': [],
-                                    'kwargs': {
-                                        'formula': formula,
-                                        'types': categorical_variables,
-                                        'family': family,
-                                        'tol': tolerance,
-                                        'maxit': max_iterations,
-                                        'organizations_to_include': organisation_ids},
-                                    'output_format': 'json'}
-            else:
-                input_regression = {'master': True,
-                                    'method': 'dglm',
-                                    'args': [],
-                                    'kwargs': {
-                                        'formula': formula,
-                                        'types': categorical_variables,
-                                        'family': family,
-                                        'tol': tolerance,
-                                        'maxit': max_iterations},
-                                    'output_format': 'json'}
-
-            # Sending the analysis task to the server
-            task = self.Client.task.create(collaboration=collaboration,
-                                           organizations=aggregating_organisation,
-                                           name=name,
-                                           description=description,
-                                           image='jhogenboom/glm_csv:1.1.0',
-                                           input=input_regression,
-                                           data_format='json')
-
-            if check_results:
-                filename = None
-            if save_results:
-                filename = f'{name}_{formula}.json'
-            self.retrieve_results(task, name, filename)
+        if isinstance(aggregating_organisation, list) is False:
+            aggregating_organisation = [8]
+
+        if isinstance(name, str) is False:
+            name = 'Logistic Regression'
+
+        if isinstance(description, str) is False:
+            description = f'Logistic regression for formula:\n {formula}'
+
+        # this step is done seperately whereas None might cause errors
+        if isinstance(organisation_ids, list):
+            input_regression = {'master': True,
+                                'method': 'dglm',
+                                'args': [],
+                                'kwargs': {
+                                    'formula': formula,
+                                    'types': categorical_variables,
+                                    'family': family,
+                                    'tol': tolerance,
+                                    'maxit': max_iterations,
+                                    'organizations_to_include': organisation_ids},
+                                'output_format': 'json'}
+        else:
+            input_regression = {'master': True,
+                                'method': 'dglm',
+                                'args': [],
+                                'kwargs': {
+                                    'formula': formula,
+                                    'types': categorical_variables,
+                                    'family': family,
+                                    'tol': tolerance,
+                                    'maxit': max_iterations},
+                                'output_format': 'json'}
 
-            self.Tasks.update({name: task})
+        # Sending the analysis task to the server
+        def create_task(client):
+            return client.task.create(collaboration=collaboration,
+                                      organizations=aggregating_organisation,
+                                      name=name,
+                                      description=description,
+                                      image='jhogenboom/glm_csv:1.1.0',
+                                      input=input_regression,
+                                      data_format='json')
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{formula}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait)
 
     def compute_dashboard(self, columns_to_count=None, columns_to_describe=None, column_to_stratify=None,
                           organisation_ids=None, name=None, description=None,
-                          check_results=True, save_results=True):
+                          check_results=True, save_results=True, wait=True):
         """"""
         # placeholder for column name
         column_name = ''
@@ -373,26 +440,40 @@ class Vantage6Client:
                             'column_to_stratify': column_to_stratify,
                             'organization_ids': organisation_ids}}
 
-        task = self.Client.task.create(name=name,
-                                       description=description,
-                                       collaboration=1,
-                                       organizations=[6],
-                                       image="varshagouthamchand/v6_dash_master",
-                                       input=input,
-                                       data_format='json',
-                                       database='default')
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{column_name}.json'
-            filepath = self.retrieve_results(task, name, filename, True)
-
-        self.Tasks.update({name: task})
+        def create_task(client):
+            return client.task.create(name=name,
+                                      description=description,
+                                      collaboration=1,
+                                      organizations=[6],
+                                      image="varshagouthamchand/v6_dash_master",
+                                      input=input,
+                                      data_format='json',
+                                      database='default')
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{column_name}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait, return_filepath=True)
 
     def compute_count_sparql(self, predicates=None, filters=None, collaboration=None, organisation_ids=None,
-                             name=None, description=None, check_results=True, save_results=True):
-        """"""
+                             name=None, description=None, check_results=True, save_results=True, wait=True,
+                             deadline=None):
+        """
+        Count the unique values of the given predicates using a SPARQL query
+
+        :param list predicates: predicates to count the values of
+        :param dict filters: categories to count per predicate
+        :param integer collaboration: collaboration to run the task in
+        :param list organisation_ids: organisations to run the task in
+        :param string name: define the name of the task
+        :param string description: provide a description of the task
+        :param boolean check_results: specify whether to check for results
+        :param boolean save_results:  specify whether to save the results in the output directory
+        :param boolean wait: specify whether to block until the results are in; otherwise return the handle directly
+        :param float deadline: number of seconds that the task may take once created, after which it is killed and
+        raises TaskDeadlineExceededError; None waits indefinitely
+        :return TaskHandle: handle to the task that resolves to its results
+        """
         if predicates is None:
             predicates = ['roo:P100018']
 
@@ -412,26 +493,47 @@ class Vantage6Client:
                                           'filters': filters}}
 
         # Sending the analysis task to the server
-        task = self.Client.task.create(collaboration=collaboration,
-                                       organizations=[2],
-                                       name=name,
-                                       description=description,
-                                       image='varshagouthamchand/count_pie_sparql:latest',
-                                       input=input_counts_sparql,
-                                       data_format='json',
-                                       database='rdf')
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'{name}_{predicates}.json'
-            self.retrieve_results(task, name, filename)
-
-        self.Tasks.update({name: task})
+        def create_task(client):
+            return client.task.create(collaboration=collaboration,
+                                      organizations=[2],
+                                      name=name,
+                                      description=description,
+                                      image='varshagouthamchand/count_pie_sparql:latest',
+                                      input=input_counts_sparql,
+                                      data_format='json',
+                                      database='rdf')
+
+        query_key = miscellaneous.build_query_key('count_sparql', predicates=predicates, filters=filters,
+                                                  organisation_ids=organisation_ids, collaboration=collaboration)
+
+        filename = None
+        if save_results:
+            filename = f'{name}_{predicates}.json'
+        return self._submit_task(create_task, name, filename, check_results, wait, query_key=query_key,
+                                 deadline=deadline)
 
     def compute_hm_sparql(self, expl_vars, censor_col, roitype, organisation_ids=None, collaboration=None,
-                          description=None, name=None, check_results=True, save_results=True):
-        """"""
+                          description=None, name=None, check_results=True, save_results=True, wait=True,
+                          sufficient_statistics=False, deadline=None):
+        """
+        Compute the correlation matrix of the given variables using a SPARQL query
+
+        :param list expl_vars: variables to correlate
+        :param str censor_col: name of the censoring column
+        :param str roitype: ROI to compute the correlation matrix for
+        :param list organisation_ids: organisations to run the task in
+        :param integer collaboration: collaboration to run the task in
+        :param string description: provide a description of the task
+        :param string name: define the name of the task
+        :param boolean check_results: specify whether to check for results
+        :param boolean save_results:  specify whether to save the results in the output directory
+        :param boolean wait: specify whether to block until the results are in; otherwise return the handle directly
+        :param boolean sufficient_statistics: retrieve the number of rows, sums, and cross-products of the variables
+        instead of the correlation matrix, see miscellaneous.combine_sufficient_statistics
+        :param float deadline: number of seconds that the task may take once created, after which it is killed and
+        raises TaskDeadlineExceededError; None waits indefinitely
+        :return TaskHandle: handle to the task that resolves to its results
+        """
 
         if isinstance(collaboration, int) is False:
             collaboration = 1
@@ -449,49 +551,291 @@ class Vantage6Client:
                                      'roitype': roitype,
                                      'organization_ids': organisation_ids}}
 
+        if sufficient_statistics:
+            input_hm_sparql['kwargs']['output'] = 'sufficient_statistics'
+
         # Sending the analysis task to the server
-        task = self.Client.task.create(collaboration=collaboration,
-                                       organizations=[2],
-                                       name=name,
-                                       description=description,
-                                       image='varshagouthamchand/v6_hm',
-                                       input=input_hm_sparql,
-                                       data_format='json',
-                                       database='rdf')
-
-        if check_results:
-            filename = None
-            if save_results:
-                filename = f'hm.json'
-            self.retrieve_results(task, name, filename)
-
-        self.Tasks.update({name: task})
-
-    def retrieve_results(self, task, name, filename, return_filepath=False):
-        """"""
-        print("Waiting for results")
-        task_id = task['id']
-        task_info = self.Client.task.get(task_id)
-        while not task_info.get("complete"):
-            task_info = self.Client.task.get(task_id, include_results=True)
-            print("Waiting for results")
-            time.sleep(3)
+        def create_task(client):
+            return client.task.create(collaboration=collaboration,
+                                      organizations=[2],
+                                      name=name,
+                                      description=description,
+                                      image='varshagouthamchand/v6_hm',
+                                      input=input_hm_sparql,
+                                      data_format='json',
+                                      database='rdf')
+
+        query_key = miscellaneous.build_query_key('hm_sparql', expl_vars=expl_vars, censor_col=censor_col,
+                                                  roitype=roitype, organisation_ids=organisation_ids,
+                                                  collaboration=collaboration,
+                                                  sufficient_statistics=sufficient_statistics)
+
+        filename = None
+        if save_results:
+            filename = f'hm.json'
+        return self._submit_task(create_task, name, filename, check_results, wait, query_key=query_key,
+                                 deadline=deadline)
+
+    def submit_tasks(self, task_specifications):
+        """
+        Submit several analyses at once; their tasks are created and followed concurrently on the task tracker,
+        so that the set of analyses takes about as long as the slowest rather than the sum of all of them.
+        An analysis that cannot be submitted, e.g. due to an unknown method, fails on its handle only.
+
+        :param list task_specifications: (method, keyword arguments) pairs, where method is the name of an analysis
+        of this client, e.g. [('take_average', {'column_name': 'pf'}), ('take_summary', {'name': 'Summary'})];
+        give analyses of the same method distinct names, as their results are stored by name in self.Results
+        :return list: TaskHandles to the tasks in the order of the specifications
+        """
+        handles = []
+        for method_name, kwargs in task_specifications:
+            kwargs = dict(kwargs or {}, wait=False)
 
-        print("Results are ready!")
+            try:
+                handle = getattr(self, method_name)(**kwargs)
+            except Exception as exception:
+                handle = self.Tracker.fail(kwargs.get('name', method_name), exception)
 
+            handles.append(handle)
+
+        return handles
+
+    def gather_results(self, task_specifications, timeout=None):
+        """
+        Run several analyses concurrently and collect their results, see submit_tasks
+
+        :param list task_specifications: (method, keyword arguments) pairs, see submit_tasks
+        :param float timeout: maximum number of seconds to wait for all analyses, None waits indefinitely
+        :return list: results in the order of the specifications; an analysis that failed or did not finish in time
+        yields its exception instead, so that one failing analysis does not lose the results of the others
+        """
+        handles = self.submit_tasks(task_specifications)
+
+        outcomes = gather(handles, timeout)
+        for handle, outcome in zip(handles, outcomes):
+            if isinstance(outcome, Exception):
+                print(f'Task {handle.Name} failed: {outcome}')
+
+        return outcomes
+
+    def kill_task(self, task_id):
+        """
+        Stop a task on the Vantage6 server, so that the nodes do not spend any more time on it
+
+        :param int task_id: id of the task
+        """
+        try:
+            with self.borrow_client() as client:
+                client.task.kill(id_=task_id)
+            print(f'Task {task_id} has been killed')
+        except Exception as exception:
+            print(f'Task {task_id} could not be killed: {exception}')
+
+    def follow_task(self, task, name, output_key, return_filepath=False, handle=None, deadline=None):
+        """
+        Follow a task until it completes and collect its results in the background, see task_follower.TaskFollower
+
+        :param dict task: task as returned by the Vantage6 server upon creation
+        :param str name: name under which the results are stored in self.Results
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        :param bool return_filepath: resolve to the path of the saved file instead of the results
+        :param TaskHandle handle: handle of the task; the task fails with TaskCancelledError once it is cancelled
+        :param float deadline: number of seconds that the task may take, after which it is killed and fails with
+        TaskDeadlineExceededError; None waits indefinitely
+        :return concurrent.futures.Future: future that resolves to the results of the task, or the path of the file
+        they were saved in
+        """
+        return TaskFollower(self, task, name, output_key, return_filepath, handle, deadline).start()
+
+    def retrieve_results(self, task, name, output_key, return_filepath=False, handle=None, deadline=None):
+        """
+        Wait for a task to complete and collect its results, see follow_task
+
+        :param dict task: task as returned by the Vantage6 server upon creation
+        :param str name: name under which the results are stored in self.Results
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        :param bool return_filepath: wait until the results are saved and return the path of the file instead
+        :param TaskHandle handle: handle of the task; raises TaskCancelledError once the handle is cancelled
+        :param float deadline: number of seconds that the task may take, after which it is killed and
+        TaskDeadlineExceededError is raised; None waits indefinitely
+        :return: the results of the task, or the path of the file they were saved in
+        """
+        return self.follow_task(task, name, output_key, return_filepath, handle, deadline).result()
+
+    def collect_results(self, task_info, name, output_key, return_filepath=False):
+        """
+        Collect the results of a task that has completed.
+        The results are saved in the background by the output writer, see output_writer.OutputWriter.
+
+        :param dict task_info: task as returned by the Vantage6 server once it has completed
+        :param str name: name under which the results are stored in self.Results
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        :param bool return_filepath: wait until the results are saved and return the path of the file instead
+        :return: the results of the task, or the path of the file they were saved in
+        """
         result_id = task_info['id']
-        result_info = self.Client.result.list(task=result_id)
+        with metrics.phase_duration.time({'phase': 'result_list'}):
+            with self.borrow_client() as client:
+                result_info = client.result.list(task=result_id)
 
         output_data = result_info['data'][0]['result']
+        metrics.payload_size.observe(estimate_size(output_data))
 
-        print(f'\n################################\nResult of query: {output_data}\n################################\n')
+        print(f'Result of query {name} has been retrieved')
 
         self.Results.update({name: output_data})
 
-        if isinstance(filename, str):
-            filepath = f'{self.OutputPath}{os.path.sep}{filename}'
-            with open(filepath, 'w') as file_path:
-                json.dump(output_data, file_path, indent=4)
+        if isinstance(output_key, str):
+            written_output = self.Writer.write(output_key, output_data)
 
             if return_filepath:
-                return filepath
\ No newline at end of file
+                return written_output.result()
+
+        return output_data
+
+    def _submit_task(self, create_task, name, filename=None, check_results=True, wait=True, return_filepath=False,
+                     query_key=None, deadline=None):
+        """
+        Create a task and follow it on the task tracker, so that the calling thread is not blocked.
+        If a task with the same query key and deadline is already running, its handle is shared rather than creating
+        a new task; the results of a shared task are stored under the name, and saved under the output key, of every
+        request that shares it.
+
+        :param callable create_task: function of a client that creates the task on the Vantage6 server and returns it
+        :param str name: name of the task
+        :param str filename: name that identifies the saved results of a task without query key,
+        None does not save the results
+        :param bool check_results: specify whether to wait for the results of the task
+        :param bool wait: specify whether to block until the task has been handled
+        :param bool return_filepath: let the handle resolve to the path of the saved file instead of the results
+        :param str query_key: canonical key of the query, see miscellaneous.build_query_key; None never shares tasks
+        :param float deadline: number of seconds that the task may take once created, see follow_task
+        :return TaskHandle: handle to the task
+        """
+        # results are saved under the key of their query, or under a key of their filename if there is none
+        output_key = None
+        if isinstance(filename, str):
+            output_key = query_key if query_key is not None else miscellaneous.build_query_key('output',
+                                                                                               filename=filename)
+
+        # only tasks of which the results are retrieved can be shared, and only by requests with the same deadline
+        in_flight_key = None
+        if check_results and return_filepath is False and query_key is not None:
+            in_flight_key = (query_key, deadline)
+
+        with self._InFlightLock:
+            handle, shared_output_key = self.InFlight.get(in_flight_key, (None, None))
+            shared = handle is not None
+
+            if shared is False:
+                handle = self.Tracker.submit(name, self._run_task, create_task, name, output_key, check_results,
+                                             return_filepath, deadline)
+
+                if in_flight_key is not None:
+                    self.InFlight[in_flight_key] = (handle, output_key)
+                    handle.add_done_callback(lambda finished_handle: self._release_in_flight(in_flight_key,
+                                                                                             finished_handle))
+
+        # a request that shares the task of another request stores and saves the results as it requested itself
+        if shared and output_key == shared_output_key:
+            output_key = None
+
+        if wait:
+            # re-raises any exception that occurred whilst creating or following the task
+            handle.result()
+
+            if shared:
+                self._store_shared_results(handle, name, output_key)
+        elif shared:
+            handle.add_done_callback(lambda finished_handle: self._store_shared_results(finished_handle, name,
+                                                                                        output_key))
+
+        return handle
+
+    @contextlib.contextmanager
+    def borrow_client(self):
+        """
+        Borrow an authenticated client from the pool, or use the client that was set directly if there is no pool
+
+        :return: an authenticated vantage6.client.Client
+        """
+        if self.Pool is None:
+            yield self.Client
+            return
+
+        with self.Pool.client() as client:
+            yield client
+
+    def _release_in_flight(self, in_flight_key, handle):
+        """
+        Stop sharing a task once it has finished, so that later requests create a new task
+
+        :param tuple in_flight_key: canonical key of the query and deadline of the task
+        :param TaskHandle handle: handle of the finished task
+        """
+        with self._InFlightLock:
+            if self.InFlight.get(in_flight_key, (None, None))[0] is handle:
+                self.InFlight.pop(in_flight_key)
+
+    def _store_shared_results(self, handle, name, output_key):
+        """
+        Store the results of a task that was shared with another request under the name of this request, and save
+        them if this request saves them under another key than the request that created the task
+
+        :param TaskHandle handle: handle of the finished task
+        :param str name: name under which the results are stored in self.Results
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        """
+        if handle.cancelled() or handle.exception() is not None:
+            return
+
+        output_data = handle.result()
+        self.Results.update({name: output_data})
+
+        if isinstance(output_key, str):
+            self.Writer.write(output_key, output_data)
+
+    def _run_task(self, create_task, name, output_key, check_results, return_filepath, deadline=None, handle=None):
+        """
+        Create a task and, if requested, follow it until its results are retrieved; runs on a thread of the task
+        tracker, which is released as soon as the task has been created
+
+        :param callable create_task: function of a client that creates the task on the Vantage6 server and returns it
+        :param str name: name of the task
+        :param str output_key: key to save the results under in the output directory, None does not save the results
+        :param bool check_results: specify whether to wait for the results of the task
+        :param bool return_filepath: return the path of the saved file instead of the results
+        :param float deadline: number of seconds that the task may take once created, see follow_task
+        :param TaskHandle handle: handle of the task, used to register the task id and to kill the task once the
+        handle is cancelled
+        :return: the task itself, or a concurrent.futures.Future that resolves to the results of the task or the path
+        of the file they were saved in
+        """
+        if handle is not None and handle.cancelled():
+            raise TaskCancelledError(f'Task {name} has been cancelled before it was created')
+
+        metrics.tasks_in_flight.increment()
+        following = None
+        try:
+            with metrics.phase_duration.time({'phase': 'task_create'}):
+                with self.borrow_client() as client:
+                    task = create_task(client)
+            self.Tasks.update({name: task})
+
+            if handle is not None:
+                handle.TaskId = task['id']
+                # the task is killed on the pool, as handles are cancelled by the threads that handle requests
+                handle.add_cancel_callback(
+                    lambda cancelled_handle: self.Tracker.Executor.submit(self.kill_task, cancelled_handle.TaskId))
+
+            if check_results is False:
+                return task
+
+            # the task is followed without occupying this thread, so that it is free to create the next task
+            following = self.follow_task(task, name, output_key, return_filepath, handle, deadline)
+            return following
+        finally:
+            if following is None:
+                metrics.tasks_in_flight.decrement()
+            else:
+                following.add_done_callback(lambda future: metrics.tasks_in_flight.decrement())